@@ -6,18 +6,18 @@ ALTER TABLE lucky_draw.ticket
     REFERENCES "user" (id)
     ON DELETE CASCADE;
 
+ALTER TABLE lucky_draw.ticket
+    ADD CONSTRAINT ticket_redeemed_raffle_id_foreign_key
+    FOREIGN KEY (redeemed_raffle_id)
+    REFERENCES lucky_draw.raffle (id)
+    ON DELETE SET NULL;
+
 ALTER TABLE lucky_draw.entry
     ADD CONSTRAINT entry_raffle_id_foreign_key
     FOREIGN KEY (raffle_id)
     REFERENCES lucky_draw.raffle (id)
     ON DELETE CASCADE;
 
-ALTER TABLE lucky_draw.entry
-    ADD CONSTRAINT entry_ticket_no_foreign_key
-    FOREIGN KEY (ticket_no)
-    REFERENCES lucky_draw.ticket (ticket_no)
-    ON DELETE CASCADE;
-
 ALTER TABLE lucky_draw.entry
     ADD CONSTRAINT entry_user_id_foreign_key
     FOREIGN KEY (user_id)
@@ -30,16 +30,22 @@ ALTER TABLE lucky_draw.result
     REFERENCES lucky_draw.raffle (id)
     ON DELETE CASCADE;
 
-ALTER TABLE lucky_draw.result
-    ADD CONSTRAINT result_ticket_no_foreign_key
-    FOREIGN KEY (ticket_no)
-    REFERENCES lucky_draw.ticket (ticket_no)
-    ON DELETE CASCADE;
-
 ALTER TABLE lucky_draw.result
     ADD CONSTRAINT result_user_id_foreign_key
     FOREIGN KEY (user_id)
     REFERENCES "user" (id)
     ON DELETE CASCADE;
 
+ALTER TABLE lucky_draw.raffle_summary
+    ADD CONSTRAINT raffle_summary_raffle_id_foreign_key
+    FOREIGN KEY (raffle_id)
+    REFERENCES lucky_draw.raffle (id)
+    ON DELETE CASCADE;
+
+ALTER TABLE lucky_draw.raffle_entry_count
+    ADD CONSTRAINT raffle_entry_count_raffle_id_foreign_key
+    FOREIGN KEY (raffle_id)
+    REFERENCES lucky_draw.raffle (id)
+    ON DELETE CASCADE;
+
 COMMIT;
@@ -2,7 +2,16 @@ BEGIN;
 
 CREATE UNIQUE INDEX auth_token_ndx_user ON "user" (auth_token);
 
-CREATE INDEX user_id_ticekts ON lucky_draw.ticket (user_id);
+CREATE INDEX start_time_ndx_raffle ON lucky_draw.raffle (start_time);
+CREATE INDEX closing_time_id_ndx_raffle ON lucky_draw.raffle (closing_time, id);
+CREATE INDEX modified_ndx_raffle ON lucky_draw.raffle (modified);
+
+CREATE INDEX start_time_ndx_raffle_summary ON lucky_draw.raffle_summary (start_time);
+CREATE INDEX closing_time_raffle_id_ndx_raffle_summary ON lucky_draw.raffle_summary (closing_time, raffle_id);
+
+CREATE INDEX user_id_created_ndx_ticket ON lucky_draw.ticket (user_id, created);
+
 CREATE UNIQUE INDEX user_id_raffle_id_entry ON lucky_draw.entry (user_id, raffle_id);
+CREATE INDEX raffle_id_ndx_entry ON lucky_draw.entry (raffle_id);
 
 COMMIT;
@@ -3,5 +3,7 @@ BEGIN;
 ALTER TABLE "user" ADD CONSTRAINT user_pkey PRIMARY KEY (id);
 
 ALTER TABLE lucky_draw.raffle ADD CONSTRAINT raffle_pkey PRIMARY KEY (id);
-ALTER TABLE lucky_draw.ticket ADD CONSTRAINT ticket_pkey PRIMARY KEY (ticket_no);
+ALTER TABLE lucky_draw.ticket ADD CONSTRAINT ticket_pkey PRIMARY KEY (ticket_no, valid_upto);
+ALTER TABLE lucky_draw.raffle_summary ADD CONSTRAINT raffle_summary_pkey PRIMARY KEY (raffle_id);
+ALTER TABLE lucky_draw.raffle_entry_count ADD CONSTRAINT raffle_entry_count_pkey PRIMARY KEY (raffle_id, shard);
 COMMIT;
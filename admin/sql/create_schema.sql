@@ -1 +1,3 @@
 CREATE SCHEMA lucky_draw;
+-- Expired partitions of the lucky_draw tables, detached by `python3 manage.py maintain_partitions`
+CREATE SCHEMA lucky_draw_archive;
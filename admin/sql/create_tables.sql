@@ -17,29 +17,60 @@ CREATE TABLE lucky_draw.raffle (
   prize                 TEXT NOT NULL,
   prize_picture_url     TEXT,
   start_time            TIMESTAMP WITH TIME ZONE NOT NULL,
-  closing_time          TIMESTAMP WITH TIME ZONE NOT NULL
+  closing_time          TIMESTAMP WITH TIME ZONE NOT NULL,
+  modified              TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW() -- when the raffle was created or its result saved
 );
 
+-- Partitioned by the month in which the tickets expire, and entries by ranges of raffle IDs. The partitions are created
+-- ahead of time and archived once expired by `python3 manage.py maintain_partitions`, rows outside them go to the default partitions.
 CREATE TABLE lucky_draw.ticket (
   ticket_no             SERIAL,
   user_id               INT, -- FK to "user".id
   created               TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-  valid_upto            TIMESTAMP WITH TIME ZONE NOT NULL
-);
+  valid_upto            TIMESTAMP WITH TIME ZONE NOT NULL,
+  redeemed_raffle_id    INT -- FK to lucky_draw.raffle.id, the raffle the ticket was used to enter
+) PARTITION BY RANGE (valid_upto);
+CREATE TABLE lucky_draw.ticket_default PARTITION OF lucky_draw.ticket DEFAULT;
 
 CREATE TABLE lucky_draw.entry (
   raffle_id             INT, -- FK to lucky_draw.raffle.id
-  ticket_no             INT, -- FK to lucky_draw.ticket.ticket_no
+  ticket_no             INT, -- lucky_draw.ticket.ticket_no
   user_id               INT -- FK to "user".id
-);
+) PARTITION BY RANGE (raffle_id);
+CREATE TABLE lucky_draw.entry_default PARTITION OF lucky_draw.entry DEFAULT;
 
 CREATE TABLE lucky_draw.result (
   raffle_id             INT, -- FK to lucky_draw.raffle.id
-  ticket_no             INT, -- FK to lucky_draw.ticket.ticket_no
+  ticket_no             INT, -- lucky_draw.ticket.ticket_no
   user_id               INT -- FK to "user".id
 );
 ALTER TABLE lucky_draw.result ADD CONSTRAINT result_raffle_id_key UNIQUE (raffle_id);
 
+-- Denormalised copy of each raffle with its result, written when the raffle is created or its result saved,
+-- from which the raffles are read by the API. Rebuilt with `python3 manage.py rebuild_raffle_summary`.
+CREATE TABLE lucky_draw.raffle_summary (
+  raffle_id             INT, -- FK to lucky_draw.raffle.id
+  title                 TEXT NOT NULL,
+  description           TEXT,
+  prize                 TEXT NOT NULL,
+  prize_picture_url     TEXT,
+  start_time            TIMESTAMP WITH TIME ZONE NOT NULL,
+  closing_time          TIMESTAMP WITH TIME ZONE NOT NULL,
+  winner_user_id        INT, -- "user".id of the winner
+  winner_name           TEXT,
+  winner_email_id       TEXT,
+  winner_ticket_no      INT,
+  entry_count           INT -- no. of entries, recorded when the result is saved
+);
+
+-- No. of entries in each raffle, split over ENTRY_COUNTER_SHARDS rows per raffle so that concurrent entries rarely
+-- update the same row. Incremented along with each entry, the no. of entries is the sum of the rows of the raffle.
+CREATE TABLE lucky_draw.raffle_entry_count (
+  raffle_id             INT, -- FK to lucky_draw.raffle.id
+  shard                 SMALLINT,
+  entry_count           INT NOT NULL
+);
+
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO bingo;
 
 COMMIT;
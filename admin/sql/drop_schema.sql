@@ -1,5 +1,6 @@
 BEGIN;
 
 DROP SCHEMA IF EXISTS lucky_draw;
+DROP SCHEMA IF EXISTS lucky_draw_archive;
 
 COMMIT;
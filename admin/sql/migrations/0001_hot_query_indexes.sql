@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Indexes for the raffle listings, result computation, raffle entries and ticket lookups.
+-- In case a build fails, drop the INVALID index it leaves behind before migrating again.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS start_time_ndx_raffle ON lucky_draw.raffle (start_time);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS closing_time_id_ndx_raffle ON lucky_draw.raffle (closing_time, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS raffle_id_ndx_entry ON lucky_draw.entry (raffle_id);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ticket_no_entry ON lucky_draw.entry (ticket_no);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_id_created_ndx_ticket ON lucky_draw.ticket (user_id, created);
+DROP INDEX CONCURRENTLY IF EXISTS lucky_draw.user_id_ticekts;
@@ -0,0 +1,4 @@
+-- The time when each raffle was created or its result saved, from which the ETag and
+-- Last-Modified headers of the raffle endpoints are built. Existing raffles get the time of the migration.
+ALTER TABLE lucky_draw.raffle ADD COLUMN IF NOT EXISTS modified TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS modified_ndx_raffle ON lucky_draw.raffle (modified);
@@ -0,0 +1,34 @@
+-- The raffle_summary read model, built from the existing raffles and results.
+CREATE TABLE IF NOT EXISTS lucky_draw.raffle_summary (
+  raffle_id             INT, -- FK to lucky_draw.raffle.id
+  title                 TEXT NOT NULL,
+  description           TEXT,
+  prize                 TEXT NOT NULL,
+  prize_picture_url     TEXT,
+  start_time            TIMESTAMP WITH TIME ZONE NOT NULL,
+  closing_time          TIMESTAMP WITH TIME ZONE NOT NULL,
+  winner_user_id        INT, -- "user".id of the winner
+  winner_name           TEXT,
+  winner_email_id       TEXT,
+  winner_ticket_no      INT,
+  entry_count           INT, -- no. of entries, recorded when the result is saved
+  CONSTRAINT raffle_summary_pkey PRIMARY KEY (raffle_id),
+  CONSTRAINT raffle_summary_raffle_id_foreign_key FOREIGN KEY (raffle_id) REFERENCES lucky_draw.raffle (id) ON DELETE CASCADE
+);
+
+INSERT INTO lucky_draw.raffle_summary (raffle_id, title, description, prize, prize_picture_url, start_time, closing_time,
+                                       winner_user_id, winner_name, winner_email_id, winner_ticket_no, entry_count)
+     SELECT raffle.id, title, description, prize, prize_picture_url, start_time, closing_time,
+            result.user_id, "user".name, "user".email_id, result.ticket_no,
+            CASE WHEN result.raffle_id IS NOT NULL
+                 THEN (SELECT COUNT(*) FROM lucky_draw.entry WHERE entry.raffle_id = raffle.id)
+            END
+       FROM lucky_draw.raffle AS raffle
+  LEFT JOIN lucky_draw.result AS result
+         ON raffle.id = result.raffle_id
+  LEFT JOIN "user"
+         ON result.user_id = "user".id
+ON CONFLICT (raffle_id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS start_time_ndx_raffle_summary ON lucky_draw.raffle_summary (start_time);
+CREATE INDEX IF NOT EXISTS closing_time_raffle_id_ndx_raffle_summary ON lucky_draw.raffle_summary (closing_time, raffle_id);
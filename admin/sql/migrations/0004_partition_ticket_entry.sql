@@ -0,0 +1,81 @@
+-- Partitions lucky_draw.ticket by the month in which the tickets expire and lucky_draw.entry by ranges of raffle IDs.
+-- The tables are rewritten into their default partitions, so the app should be stopped while this runs, and
+-- `python3 manage.py maintain_partitions` run right after it to move the rows into partitions of their own.
+-- Partitioned tables can't have a unique index which doesn't include the partition key, so the unique ticket_no index
+-- of the entries and the foreign keys to the ticket no. are dropped. Instead, each ticket records the raffle it was
+-- used to enter, in redeemed_raffle_id.
+CREATE SCHEMA IF NOT EXISTS lucky_draw_archive;
+
+ALTER TABLE lucky_draw.entry DROP CONSTRAINT IF EXISTS entry_ticket_no_foreign_key;
+ALTER TABLE lucky_draw.result DROP CONSTRAINT IF EXISTS result_ticket_no_foreign_key;
+
+ALTER TABLE lucky_draw.ticket RENAME TO ticket_unpartitioned;
+ALTER TABLE lucky_draw.ticket_unpartitioned DROP CONSTRAINT ticket_pkey;
+DROP INDEX IF EXISTS lucky_draw.user_id_created_ndx_ticket;
+ALTER SEQUENCE lucky_draw.ticket_ticket_no_seq OWNED BY NONE;
+
+ALTER TABLE lucky_draw.entry RENAME TO entry_unpartitioned;
+DROP INDEX IF EXISTS lucky_draw.user_id_raffle_id_entry;
+DROP INDEX IF EXISTS lucky_draw.raffle_id_ndx_entry;
+
+CREATE TABLE lucky_draw.ticket (
+  ticket_no             INT NOT NULL DEFAULT nextval('lucky_draw.ticket_ticket_no_seq'),
+  user_id               INT, -- FK to "user".id
+  created               TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  valid_upto            TIMESTAMP WITH TIME ZONE NOT NULL,
+  redeemed_raffle_id    INT -- FK to lucky_draw.raffle.id, the raffle the ticket was used to enter
+) PARTITION BY RANGE (valid_upto);
+CREATE TABLE lucky_draw.ticket_default PARTITION OF lucky_draw.ticket DEFAULT;
+ALTER SEQUENCE lucky_draw.ticket_ticket_no_seq OWNED BY lucky_draw.ticket.ticket_no;
+
+CREATE TABLE lucky_draw.entry (
+  raffle_id             INT, -- FK to lucky_draw.raffle.id
+  ticket_no             INT, -- lucky_draw.ticket.ticket_no
+  user_id               INT -- FK to "user".id
+) PARTITION BY RANGE (raffle_id);
+CREATE TABLE lucky_draw.entry_default PARTITION OF lucky_draw.entry DEFAULT;
+
+-- A ticket has at most one entry, thanks to the unique index of the old table
+INSERT INTO lucky_draw.ticket (ticket_no, user_id, created, valid_upto, redeemed_raffle_id)
+     SELECT ticket.ticket_no, ticket.user_id, ticket.created, ticket.valid_upto, entry.raffle_id
+       FROM lucky_draw.ticket_unpartitioned AS ticket
+  LEFT JOIN lucky_draw.entry_unpartitioned AS entry
+         ON entry.ticket_no = ticket.ticket_no;
+
+INSERT INTO lucky_draw.entry (raffle_id, ticket_no, user_id)
+     SELECT raffle_id, ticket_no, user_id
+       FROM lucky_draw.entry_unpartitioned;
+
+DROP TABLE lucky_draw.ticket_unpartitioned;
+DROP TABLE lucky_draw.entry_unpartitioned;
+
+ALTER TABLE lucky_draw.ticket ADD CONSTRAINT ticket_pkey PRIMARY KEY (ticket_no, valid_upto);
+
+ALTER TABLE lucky_draw.ticket
+    ADD CONSTRAINT ticket_user_id_foreign_key
+    FOREIGN KEY (user_id)
+    REFERENCES "user" (id)
+    ON DELETE CASCADE;
+
+ALTER TABLE lucky_draw.ticket
+    ADD CONSTRAINT ticket_redeemed_raffle_id_foreign_key
+    FOREIGN KEY (redeemed_raffle_id)
+    REFERENCES lucky_draw.raffle (id)
+    ON DELETE SET NULL;
+
+ALTER TABLE lucky_draw.entry
+    ADD CONSTRAINT entry_raffle_id_foreign_key
+    FOREIGN KEY (raffle_id)
+    REFERENCES lucky_draw.raffle (id)
+    ON DELETE CASCADE;
+
+ALTER TABLE lucky_draw.entry
+    ADD CONSTRAINT entry_user_id_foreign_key
+    FOREIGN KEY (user_id)
+    REFERENCES "user" (id)
+    ON DELETE CASCADE;
+
+CREATE INDEX user_id_created_ndx_ticket ON lucky_draw.ticket (user_id, created);
+
+CREATE UNIQUE INDEX user_id_raffle_id_entry ON lucky_draw.entry (user_id, raffle_id);
+CREATE INDEX raffle_id_ndx_entry ON lucky_draw.entry (raffle_id);
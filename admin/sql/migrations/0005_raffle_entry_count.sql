@@ -0,0 +1,17 @@
+-- Sharded entry counters of the raffles, filled with the no. of entries of each raffle in a single shard.
+CREATE TABLE IF NOT EXISTS lucky_draw.raffle_entry_count (
+  raffle_id             INT, -- FK to lucky_draw.raffle.id
+  shard                 SMALLINT,
+  entry_count           INT NOT NULL,
+  CONSTRAINT raffle_entry_count_pkey PRIMARY KEY (raffle_id, shard),
+  CONSTRAINT raffle_entry_count_raffle_id_foreign_key FOREIGN KEY (raffle_id) REFERENCES lucky_draw.raffle (id) ON DELETE CASCADE
+);
+
+-- Keeps entries from being made or deleted until the counters are filled and committed
+LOCK TABLE lucky_draw.entry IN SHARE MODE;
+
+INSERT INTO lucky_draw.raffle_entry_count (raffle_id, shard, entry_count)
+     SELECT raffle_id, 0, COUNT(*)
+       FROM lucky_draw.entry
+   GROUP BY raffle_id
+ON CONFLICT (raffle_id, shard) DO NOTHING;
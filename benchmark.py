@@ -0,0 +1,330 @@
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import config
+import db
+import db.lucky_draw
+import db.statements
+import db.user
+import webserver
+from compute_results import ResultComupter
+
+_query_counts = threading.local()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _query_counts.value = getattr(_query_counts, "value", 0) + 1
+
+
+def _queries_so_far():
+    return getattr(_query_counts, "value", 0)
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(int(round(percentile / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class _Fixtures:
+    """ The users and raffles the requests of the benchmark are made with. """
+
+    def __init__(self, sample_size):
+        with db.engine.connect() as connection:
+            result = connection.execute(sqlalchemy.text("""
+                SELECT id, email_id, auth_token
+                  FROM "user"
+              ORDER BY random()
+                 LIMIT :sample_size
+            """), {"sample_size": sample_size})
+            self.users = [dict(row) for row in result.fetchall()]
+            result = connection.execute(sqlalchemy.text("""
+                SELECT id, closing_time > NOW() AS is_open
+                  FROM lucky_draw.raffle
+              ORDER BY random()
+                 LIMIT :sample_size
+            """), {"sample_size": sample_size})
+            raffles = [dict(row) for row in result.fetchall()]
+
+        if not self.users or not raffles:
+            raise Exception("The database has no users or raffles, run `python3 manage.py seed` first.")
+        self.admin = self.users[0]
+        self.raffle_ids = [raffle["id"] for raffle in raffles]
+        self.open_raffle_ids = [raffle["id"] for raffle in raffles if raffle["is_open"]] or self.raffle_ids
+
+
+def _scenarios(fixtures, rng):
+    """ Get the requests to make to each ``lucky_draw_bp`` endpoint.
+    Returns:
+        A dictionary of endpoint names to functions which return the method, URL, form data
+        and user of a request to the endpoint.
+    """
+    def user():
+        return rng.choice(fixtures.users)
+
+    def raffle_time(hours):
+        return (datetime.now(timezone.utc) + timedelta(hours=hours)).isoformat()
+
+    return {
+        "lucky_draw.get_raffle": lambda: ("GET", "/lucky-draw/raffle/%s" % rng.choice(fixtures.raffle_ids), None, user()),
+        "lucky_draw.export_raffle_applicants": lambda: (
+            "GET", "/lucky-draw/raffle/%s/applicants" % rng.choice(fixtures.raffle_ids), None, fixtures.admin),
+        "lucky_draw.get_past_raffles": lambda: ("GET", "/lucky-draw/past-raffles?limit=50", None, user()),
+        "lucky_draw.get_last_week_raffles": lambda: ("GET", "/lucky-draw/last-week-raffles", None, user()),
+        "lucky_draw.get_next_raffle": lambda: ("GET", "/lucky-draw/next-raffle", None, user()),
+        "lucky_draw.get_upcoming_raffles": lambda: ("GET", "/lucky-draw/upcoming-raffles", None, user()),
+        "lucky_draw.get_ongoing_raffles": lambda: ("GET", "/lucky-draw/ongoing-raffles", None, user()),
+        "lucky_draw.draw_ticket": lambda: ("POST", "/lucky-draw/draw-ticket", None, user()),
+        "lucky_draw.draw_tickets": lambda: (
+            "POST", "/lucky-draw/draw-tickets", {"user_ids": str(user()["id"]), "count": "10"}, fixtures.admin),
+        "lucky_draw.get_tickets_for_user": lambda: ("GET", "/lucky-draw/tickets", None, user()),
+        "lucky_draw.enter_raffle": lambda: (
+            "POST", "/lucky-draw/raffle/%s/enter" % rng.choice(fixtures.open_raffle_ids), None, user()),
+        "lucky_draw.create_raffle": lambda: ("POST", "/lucky-draw/create-raffle", {
+            "title": "Benchmark raffle",
+            "prize": "Benchmark prize",
+            "start_time": raffle_time(24),
+            "closing_time": raffle_time(48),
+        }, fixtures.admin),
+    }
+
+
+def run_benchmark(requests_per_route: int = 200, concurrency: int = 8, sample_size: int = 1000, routes: list = None, random_seed: int = None) -> dict:
+    """ Benchmark every ``lucky_draw_bp`` endpoint and a result computation pass against the configured database.
+    The requests are made through the WSGI app in process, ``concurrency`` at a time, one endpoint after another.
+    Args:
+        requests_per_route (optional): the no. of requests to make to each endpoint
+        concurrency (optional): the no. of requests in flight at a time
+        sample_size (optional): the no. of users and raffles to pick the requests from
+        routes (optional): the names of the endpoints to benchmark, all of them by default
+        random_seed (optional): the seed of the random choice of users and raffles
+    Returns:
+        A dictionary with the results of the benchmark, see ``write_results``.
+    """
+    app = webserver.create_app()
+    rng = random.Random(random_seed)
+    fixtures = _Fixtures(sample_size)
+    app.config["ADMINS"] = list(app.config["ADMINS"]) + [fixtures.admin["email_id"]]
+    scenarios = _scenarios(fixtures, rng)
+
+    endpoints = sorted(rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith("lucky_draw."))
+    missing = [endpoint for endpoint in endpoints if endpoint not in scenarios]
+    if missing:
+        raise Exception("No benchmark scenario for the endpoints: %s" % ", ".join(missing))
+    if routes:
+        endpoints = [endpoint for endpoint in endpoints if endpoint in routes]
+
+    local = threading.local()
+
+    def make_request(request):
+        method, url, data, user = request
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        queries_before = _queries_so_far()
+        start = time.perf_counter()
+        response = local.client.open(url, method=method, data=data, headers={"Authorization": "Token " + user["auth_token"]})
+        # Consume streamed responses too
+        response.get_data()
+        return time.perf_counter() - start, _queries_so_far() - queries_before, response.status_code
+
+    results = {
+        "started": datetime.now(timezone.utc).isoformat(),
+        "commit": _current_commit(),
+        "requests_per_route": requests_per_route,
+        "concurrency": concurrency,
+        "routes": {},
+    }
+    for endpoint in endpoints:
+        requests = [scenarios[endpoint]() for _ in range(requests_per_route)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(make_request, requests))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _, _ in samples)
+        statuses = {}
+        for _, _, status in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        results["routes"][endpoint] = {
+            "requests": len(samples),
+            "requests_per_second": len(samples) / elapsed,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "queries_per_request": sum(queries for _, queries, _ in samples) / len(samples),
+            "statuses": statuses,
+        }
+
+    computer = ResultComupter()
+    start = time.perf_counter()
+    computed = computer.compute_results()
+    results["result_computation"] = {
+        "raffles": len(computed),
+        "duration": time.perf_counter() - start,
+        "max_raffle_duration": max((raffle["duration"] for raffle in computed), default=None),
+    }
+    return results
+
+
+def write_results(results: dict, path: str):
+    """ Write the results of a benchmark as JSON, to be compared with later runs. The results have the structure:
+        {
+            "started": <date and time when the benchmark started>,
+            "commit": <the git commit which was benchmarked>,
+            "requests_per_route": <no. of requests made to each endpoint>,
+            "concurrency": <no. of requests in flight at a time>,
+            "routes": {
+                <endpoint name>: {
+                    "requests": <no. of requests made>,
+                    "requests_per_second": <throughput>,
+                    "p50", "p95", "p99": <latency percentiles in seconds>,
+                    "queries_per_request": <average no. of DB queries made by a request>,
+                    "statuses": <no. of responses with each HTTP status>,
+                },
+                ...
+            },
+            "result_computation": {
+                "raffles": <no. of raffles whose results were computed>,
+                "duration": <time taken by the pass in seconds>,
+                "max_raffle_duration": <longest time taken by a raffle in seconds>,
+            },
+        }
+    """
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def compare_results(baseline: dict, results: dict, tolerance: float = 0.1) -> list:
+    """ Find the endpoints whose p95 latency, throughput or queries per request got worse than in the baseline.
+    Args:
+        tolerance (optional): the fraction by which a metric can get worse before it's reported.
+    Returns:
+        A list of descriptions of the regressions.
+    """
+    regressions = []
+    for endpoint, current in sorted(results["routes"].items()):
+        previous = baseline["routes"].get(endpoint)
+        if not previous:
+            continue
+        if current["p95"] > previous["p95"] * (1 + tolerance):
+            regressions.append("%s: p95 latency %.4fs -> %.4fs" % (endpoint, previous["p95"], current["p95"]))
+        if current["requests_per_second"] < previous["requests_per_second"] * (1 - tolerance):
+            regressions.append("%s: requests per second %.1f -> %.1f" % (
+                endpoint, previous["requests_per_second"], current["requests_per_second"]))
+        if current["queries_per_request"] > previous["queries_per_request"]:
+            regressions.append("%s: queries per request %.2f -> %.2f" % (
+                endpoint, previous["queries_per_request"], current["queries_per_request"]))
+    return regressions
+
+
+def _statement_params(fixtures, rng):
+    """ Get the parameters to run each read only statement of ``db.statements`` with, in ``run_statement_benchmark``.
+    Returns:
+        A dictionary of statement names to functions which return the parameters of a run.
+    """
+    def raffle_id():
+        return rng.choice(fixtures.raffle_ids)
+
+    def user():
+        return rng.choice(fixtures.users)
+
+    return {
+        "lucky_draw_get_raffle": lambda: {"raffle_id": raffle_id()},
+        "lucky_draw_get_raffle_version": lambda: {"raffle_id": raffle_id(), "user_id": user()["id"]},
+        "lucky_draw_get_raffle_applicant": lambda: {"raffle_id": raffle_id(), "user_id": user()["id"]},
+        "lucky_draw_count_raffle_applicants": lambda: {"raffle_id": raffle_id()},
+        "lucky_draw_get_past_raffles_limited": lambda: {"limit": 50},
+        "lucky_draw_get_past_raffles_in_days": lambda: {"days": 7},
+        "lucky_draw_get_next_upcoming_raffles": lambda: {"limit": 1},
+        "lucky_draw_get_ongoing_raffles": lambda: {},
+        "lucky_draw_get_entry_counts": lambda: {"raffle_ids": rng.sample(fixtures.raffle_ids, min(10, len(fixtures.raffle_ids)))},
+        "lucky_draw_get_raffles_version": lambda: {"days": 7},
+        "lucky_draw_get_tickets_for_user": lambda: {"user_id": user()["id"]},
+        "lucky_draw_get_next_valid_ticket_for_user": lambda: {"user_id": user()["id"]},
+        "user_get": lambda: {"id": user()["id"]},
+        "user_get_by_token": lambda: {"auth_token": user()["auth_token"]},
+    }
+
+
+def run_statement_benchmark(executions: int = 500, sample_size: int = 1000, random_seed: int = None) -> dict:
+    """ Compare running the read only statements of ``db.statements`` as prepared statements with running
+    their queries as they are, one at a time on a connection of its own, which is closed afterwards.
+    Each statement is run ``executions`` times each way, with the same parameters, and its planning time
+    is measured with ``EXPLAIN (SUMMARY)`` once its prepared statement has settled on a plan.
+    Args:
+        executions (optional): the no. of times to run each statement each way
+        sample_size (optional): the no. of users and raffles to pick the parameters from
+        random_seed (optional): the seed of the random choice of users and raffles
+    Returns:
+        A dictionary of statement names to
+        {
+            "unprepared": <mean time in seconds to run the query as it is>,
+            "prepared": <mean time in seconds to run the prepared statement>,
+            "unprepared_planning": <mean planning time in seconds reported by Postgres for the query as it is>,
+            "prepared_planning": <mean planning time in seconds reported by Postgres for the prepared statement>,
+        }
+    """
+    rng = random.Random(random_seed)
+    fixtures = _Fixtures(sample_size)
+    statement_params = _statement_params(fixtures, rng)
+    explained = min(executions, 50)
+
+    results = {}
+    # Not one of the pool, whose connections keep track of the statements prepared on them
+    connection = psycopg2.connect(config.SQLALCHEMY_DATABASE_URI)
+    try:
+        cursor = connection.cursor()
+        for name, params in sorted(statement_params.items()):
+            statement = db.statements.get(name)
+            runs = [params() for _ in range(executions)]
+            cursor.execute(statement.prepare_sql)
+
+            # Interleaved, so that both ways see the same caches
+            unprepared, prepared = 0, 0
+            for run in runs:
+                start = time.perf_counter()
+                cursor.execute(statement.unprepared_sql, run)
+                cursor.fetchall()
+                unprepared += time.perf_counter() - start
+
+                start = time.perf_counter()
+                cursor.execute(statement.execute_sql, run)
+                cursor.fetchall()
+                prepared += time.perf_counter() - start
+
+            results[name] = {
+                "unprepared": unprepared / executions,
+                "prepared": prepared / executions,
+                "unprepared_planning": sum(_planning_time(cursor, statement.unprepared_sql, run) for run in runs[:explained]) / explained,
+                "prepared_planning": sum(_planning_time(cursor, statement.execute_sql, run) for run in runs[:explained]) / explained,
+            }
+            connection.rollback()
+    finally:
+        connection.close()
+    return results
+
+
+def _planning_time(cursor, query: str, params: dict) -> float:
+    cursor.execute("EXPLAIN (SUMMARY) " + query, params)
+    plan = "\n".join(row[0] for row in cursor.fetchall())
+    return float(re.search(r"Planning Time: ([\d.]+) ms", plan).group(1)) / 1000
+
+
+def _current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -1,26 +1,67 @@
-from random import choice
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import db
 import config
 import db.lucky_draw as db_lucky_draw
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 
 class ResultComupter:
-    def __init__(self):
+    def __init__(self, workers: int = None):
+        """
+        Args:
+            workers (optional): The no. of raffles whose results are computed concurrently.
+                                Defaults to ``RESULT_COMPUTATION_WORKERS`` from the config.
+        """
         db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+        self.workers = workers or config.RESULT_COMPUTATION_WORKERS
 
     def compute_result_for_given_raffle(self, raffle_id: int):
-        applicants = db_lucky_draw.get_raffle_applicants(raffle_id=raffle_id)
-        if applicants:
-            winner = choice(applicants)
-            db_lucky_draw.save_raffle_results(raffle_id=raffle_id, ticket_no=winner["ticket_no"], user_id=winner["user_id"])
+        return db_lucky_draw.draw_raffle_winner(raffle_id=raffle_id)
 
-    def compute_results(self):
+    def compute_results(self) -> list:
+        """ Compute the results of all the raffles which are due, ``workers`` raffles at a time.
+        Several processes, on one or more hosts, can run this at the same time. Each raffle is
+        computed by only one of them.
+        Returns:
+            A list of dictionaries with the following structure:
+            [
+                {
+                    "raffle_id": <DB ID of the raffle>,
+                    "winner": <the winner returned by ``draw_raffle_winner``>,
+                    "duration": <time taken to compute the result in seconds>,
+                },
+                ...
+            ]
+        """
+        start = time.perf_counter()
         raffles = db_lucky_draw.get_raffles_to_compute_results()
-        for raffle_id in raffles:
-            self.compute_result_for_given_raffle(raffle_id=raffle_id)
+        computed = []
+        if raffles:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(raffles))) as executor:
+                computed = list(executor.map(self._timed_compute_result, raffles))
+
+        metrics.RESULT_COMPUTATION_PASS_SECONDS.observe(time.perf_counter() - start)
+        return computed
+
+    def _timed_compute_result(self, raffle_id: int) -> dict:
+        start = time.perf_counter()
+        winner = self.compute_result_for_given_raffle(raffle_id=raffle_id)
+        duration = time.perf_counter() - start
+        metrics.RESULT_COMPUTATION_SECONDS.observe(duration, outcome="winner" if winner else "none")
+        if winner:
+            logger.info("Computed result of raffle %s in %.3fs: ticket %s", raffle_id, duration, winner["ticket_no"])
+        else:
+            logger.info("No result saved for raffle %s in %.3fs", raffle_id, duration)
+        return {"raffle_id": raffle_id, "winner": winner, "duration": duration}
 
 
 if __name__ == "__main__":
+    logging.basicConfig()
     rc = ResultComupter()
     rc.compute_results()
@@ -20,3 +20,131 @@ TICKET_VALIDITY = 7
 # Time in hours before the result to stop accepting entries
 # NOTE: In case this is updated update the compute-results.crontab file to compute results after this much duration
 TIME_TO_STOP_ACCEPTING_SUBMISSIONS = 1
+
+# Database connection pool. Set SQLALCHEMY_POOL_ENABLED to False to open a new connection for every query.
+SQLALCHEMY_POOL_ENABLED = True
+# No. of connections kept open in each process
+SQLALCHEMY_POOL_SIZE = 10
+# No. of connections which can be opened above SQLALCHEMY_POOL_SIZE under load
+SQLALCHEMY_MAX_OVERFLOW = 10
+# Time in seconds to wait for a free connection before giving up
+SQLALCHEMY_POOL_TIMEOUT = 30
+# Time in seconds after which a connection is closed and replaced with a new one
+SQLALCHEMY_POOL_RECYCLE = 1800
+# Test connections for liveness before using them
+SQLALCHEMY_POOL_PRE_PING = True
+# Run the queries of the db package as server side prepared statements, prepared once on each pooled connection
+# (see db.statements). Turn this off behind a connection pooler which doesn't keep them, like PgBouncer in transaction mode.
+PREPARED_STATEMENTS_ENABLED = True
+
+# Max. no. of authorization tokens cached in each process, and the time in seconds for which they are cached.
+# Rotated tokens are evicted from every process as soon as they are rotated, see db.user.listen_for_invalidations.
+# The TTL only bounds how long a stale token can be used while a process can't listen for evictions.
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Max. no. of users of logged in sessions cached in each process, and the time in seconds for which they are
+# cached. Deleted users are evicted from every process like rotated tokens.
+SESSION_USER_CACHE_SIZE = 10000
+SESSION_USER_CACHE_TTL = 60
+
+# Max. no. of raffle listings cached in each process, and the max. time in seconds for which they
+# are cached. Listings are refreshed earlier if a raffle starts or closes in the meantime.
+# Only the first page of the past raffles is cached, the later ones are read from the DB.
+RAFFLE_LISTING_CACHE_SIZE = 64
+RAFFLE_LISTING_CACHE_MAX_TTL = 30
+
+# No. of raffles whose results are computed concurrently by each results computation process.
+# Keep this below SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW.
+RESULT_COMPUTATION_WORKERS = 4
+
+# Time in seconds between reloads of the raffles by the result scheduler. New raffles are
+# picked up immediately through notifications, this only matters if those are missed.
+RESULT_SCHEDULER_POLL_INTERVAL = 300
+
+# Max. no. of tickets inserted by each statement when tickets are issued in bulk
+BULK_TICKET_BATCH_SIZE = 5000
+
+# No. of rows fetched at a time when large results are streamed from the DB
+STREAM_CHUNK_SIZE = 1000
+
+# Max. no. of raffles returned in a page of past raffles
+PAST_RAFFLES_MAX_PAGE_SIZE = 500
+
+# Record request latencies and DB usage per endpoint, exposed on /metrics in the Prometheus text format
+METRICS_ENABLED = True
+
+# Statements taking longer than this many milliseconds are logged with the function which made them,
+# their parameters (with tokens, passwords and secrets redacted) and duration. Set to None to disable the slow query log.
+SLOW_QUERY_THRESHOLD_MS = 500
+# Fraction of the slow queries which are explained to log their plans, with EXPLAIN (ANALYZE, BUFFERS) if they are
+# read only and plain EXPLAIN if they write or lock rows, and the max. time in milliseconds that's spent on each of them
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = 0.1
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = 10000
+# File the slow query log is written to, rotated once it grows over SLOW_QUERY_LOG_MAX_BYTES.
+# Set to None to only log to the console.
+SLOW_QUERY_LOG_FILE = "slow_queries.log"
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUP_COUNT = 5
+
+# Production server (manage.py run_production_server). No. of worker processes, defaults to the no. of CPUs
+# when None, and no. of threads of each worker. Keep SERVER_THREADS below SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW.
+SERVER_WORKERS = None
+SERVER_THREADS = 8
+# Time in seconds after which a stuck worker is restarted, and for which requests in flight are drained on reload or shutdown
+SERVER_TIMEOUT = 60
+SERVER_GRACEFUL_TIMEOUT = 30
+# Time in seconds to keep idle connections from clients open
+SERVER_KEEPALIVE = 5
+# No. of requests after which a worker is replaced by a new one, 0 to never replace them
+SERVER_MAX_REQUESTS = 0
+# First port on which the workers of the production server serve their own metrics, each on the lowest port from it
+# which no other worker uses: SERVER_METRICS_PORT, SERVER_METRICS_PORT + 1, ... Set to None to only serve them on /metrics,
+# which is answered by whichever worker gets the request.
+SERVER_METRICS_PORT = None
+
+# Min. and max. no. of connections of the asyncpg pool of each process of the async server (manage.py run_async_server)
+ASYNC_DB_POOL_MIN_SIZE = 10
+ASYNC_DB_POOL_MAX_SIZE = 50
+
+# Cost factor of the bcrypt hashes of passwords. Hashes with another cost factor are replaced on login.
+PASSWORD_HASH_ROUNDS = 12
+# Max. no. of passwords hashed or verified at a time by each process
+PASSWORD_HASHING_WORKERS = 4
+
+# Max. no. of seconds for which clients may reuse a raffle response without revalidating it with its ETag.
+# Responses are never cached past the time the next raffle starts or closes.
+RAFFLE_CACHE_MAX_AGE = 30
+
+# Min. size in bytes of the JSON and CSV responses which are compressed, with brotli or gzip depending on the
+# Accept-Encoding header of the request. Streamed responses are always compressed. Set to None to disable compression.
+COMPRESSION_MIN_SIZE = 1024
+# gzip compression level (1-9) and brotli quality (0-11). Low levels compress a lot faster for slightly larger responses.
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+# Streamed responses are flushed to the client every STREAM_CHUNK_SIZE chunks, e.g. rows, or once this many bytes
+# have been compressed since the last flush, whichever comes first. Each flush makes the response a little larger.
+COMPRESSION_STREAM_FLUSH_SIZE = 64 * 1024
+
+# No. of rows over which the entry counter of each raffle is split, so that concurrent entries into a raffle
+# rarely wait for each other to update its counter
+ENTRY_COUNTER_SHARDS = 16
+
+# Coalesce the tickets drawn and raffle entries made by the threads of each process at the same time into
+# multi-row statements and transactions, flushed every WRITE_BATCH_MAX_DELAY_MS milliseconds or WRITE_BATCH_MAX_SIZE
+# writes. This trades a few milliseconds of latency for far fewer commits when writes arrive in bursts.
+WRITE_BATCHING_ENABLED = False
+WRITE_BATCH_MAX_SIZE = 500
+WRITE_BATCH_MAX_DELAY_MS = 2
+# Max. time in seconds for which a request waits for its batched write, e.g. while the DB is unreachable
+WRITE_BATCH_TIMEOUT = 30
+
+# Tickets are partitioned by the month in which they expire, and raffle entries by ranges of ENTRY_PARTITION_SIZE raffle IDs.
+# `manage.py maintain_partitions` creates this many partitions ahead of the ones the current tickets and raffles go in.
+TICKET_PARTITIONS_AHEAD = 2
+ENTRY_PARTITION_SIZE = 1000
+ENTRY_PARTITIONS_AHEAD = 2
+# No. of days after the end of their month that partitions of expired tickets are archived, and after the closing of
+# all their raffles that partitions of entries are archived. Set to None to never archive them.
+TICKET_ARCHIVE_AFTER = 90
+ENTRY_ARCHIVE_AFTER = 365
@@ -4,19 +4,44 @@ from sqlalchemy.pool import NullPool
 import time
 import psycopg2
 
+import config
+from db.pool import InstrumentedQueuePool, add_fork_protection
+from db.slow_query import add_slow_query_log
+
 engine = None
 
 
-def init_db_connection(connect_str):
+def init_db_connection(connect_str, use_pool=None):
     """Initializes database connection using the specified Flask app.
     Configuration file must contain `SQLALCHEMY_DATABASE_URI` key. See
     https://pythonhosted.org/Flask-SQLAlchemy/config.html#configuration-keys
     for more info.
+    Args:
+        connect_str: the URI of the database to connect to
+        use_pool (optional): Keep a pool of open connections instead of opening a new connection for
+                             every query. Defaults to ``SQLALCHEMY_POOL_ENABLED`` from the config.
     """
     global engine
+    if use_pool is None:
+        use_pool = config.SQLALCHEMY_POOL_ENABLED
+
     while True:
         try:
-            engine = create_engine(connect_str, poolclass=NullPool)
+            if use_pool:
+                engine = create_engine(
+                    connect_str,
+                    poolclass=InstrumentedQueuePool,
+                    pool_size=config.SQLALCHEMY_POOL_SIZE,
+                    max_overflow=config.SQLALCHEMY_MAX_OVERFLOW,
+                    pool_timeout=config.SQLALCHEMY_POOL_TIMEOUT,
+                    pool_recycle=config.SQLALCHEMY_POOL_RECYCLE,
+                    pool_pre_ping=config.SQLALCHEMY_POOL_PRE_PING,
+                )
+                add_fork_protection(engine)
+            else:
+                engine = create_engine(connect_str, poolclass=NullPool)
+            if config.SLOW_QUERY_THRESHOLD_MS is not None:
+                add_slow_query_log(engine)
             break
         except psycopg2.OperationalError as e:
             print("Couldn't establish connection to db: {}".format(str(e)))
@@ -24,6 +49,17 @@ def init_db_connection(connect_str):
             time.sleep(2)
 
 
+def get_pool_stats() -> dict:
+    """Get the usage statistics of the connection pool of the current engine.
+    Returns:
+        The statistics returned by ``InstrumentedQueuePool.stats``, or ``None`` if
+        connection pooling is disabled.
+    """
+    if engine is None or not isinstance(engine.pool, InstrumentedQueuePool):
+        return None
+    return engine.pool.stats()
+
+
 def run_sql_script(sql_file_path):
     """
     Run an given SQL script.
@@ -58,3 +94,61 @@ def run_sql_script_without_transaction(sql_file_path):
             connection.connection.set_isolation_level(1)
             connection.close()
         return True
+
+
+def get_applied_migrations() -> set:
+    """
+    Get the versions of the migrations which have been applied to the database.
+    The table which keeps track of them is created if it doesn't exist.
+    Returns:
+        A set of migration versions.
+    """
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("""
+            CREATE TABLE IF NOT EXISTS schema_migration (
+              version               TEXT PRIMARY KEY,
+              applied               TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+            )
+        """))
+        result = connection.execute(sqlalchemy.text("SELECT version FROM schema_migration"))
+        return {row["version"] for row in result.fetchall()}
+
+
+def apply_migration(sql_file_path, version):
+    """
+    Apply a migration and record its version, in a single transaction. Migrations whose first
+    line is ``-- migrate: no-transaction`` are instead run with ``run_sql_script_without_transaction``,
+    e.g. to build indexes CONCURRENTLY, and their version is recorded once all their statements succeed.
+    Args:
+        sql_file_path: path to the SQL file of the migration
+        version: the version of the migration
+    Returns:
+        True if the migration was applied.
+    """
+    with open(sql_file_path) as sql:
+        script = sql.read()
+
+    if script.startswith("-- migrate: no-transaction"):
+        if not run_sql_script_without_transaction(sql_file_path):
+            return False
+        mark_migration_applied(version)
+        return True
+
+    with engine.begin() as connection:
+        connection.execute(script)
+        connection.execute(sqlalchemy.text("INSERT INTO schema_migration (version) VALUES (:version)"), {"version": version})
+    return True
+
+
+def mark_migration_applied(version):
+    """
+    Record a migration as applied without running it, e.g. when the schema it creates was built from scratch.
+    Args:
+        version: the version of the migration
+    """
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text("""
+            INSERT INTO schema_migration (version)
+                 VALUES (:version)
+            ON CONFLICT DO NOTHING
+        """), {"version": version})
@@ -0,0 +1,58 @@
+# The asyncio counterparts of db.lucky_draw and db.user, backed by an asyncpg connection pool.
+# The functions have the same names, arguments and return values as the blocking ones, but are coroutines,
+# and the functions which yield rows are async generators. They share the caches of the blocking modules.
+import asyncio
+import functools
+
+import asyncpg
+
+import config
+from db.statements import to_positional
+
+pool = None
+
+
+async def init_db_pool(connect_str):
+    """Create the pool of connections used by the coroutines of this package, in the current event loop.
+    Args:
+        connect_str: the URI of the database to connect to
+    """
+    global pool
+    while True:
+        try:
+            pool = await asyncpg.create_pool(
+                connect_str,
+                min_size=config.ASYNC_DB_POOL_MIN_SIZE,
+                max_size=config.ASYNC_DB_POOL_MAX_SIZE,
+                max_inactive_connection_lifetime=config.SQLALCHEMY_POOL_RECYCLE,
+            )
+            break
+        except (OSError, asyncpg.PostgresError) as e:
+            print("Couldn't establish connection to db: {}".format(str(e)))
+            print("Sleeping 2 seconds and trying again...")
+            await asyncio.sleep(2)
+
+
+async def close_db_pool():
+    """Close the connections of the pool, waiting for the ones in use to be released."""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+def bind(query: str, params: dict) -> tuple:
+    """Convert a query with ``:name`` parameters, as used with ``sqlalchemy.text``, to the ``$1`` style used by asyncpg.
+    Args:
+        query: the SQL query
+        params: the values of the parameters, by name. Those which aren't used by the query are ignored.
+    Returns:
+        A tuple of the converted query followed by the values of its parameters, to be passed
+        as ``connection.fetch(*bind(query, params))``.
+    """
+    query, names = _to_positional(query)
+    return (query,) + tuple(params[name] for name in names)
+
+
+# The queries are those of the registered statements, so only a few are ever converted
+_to_positional = functools.lru_cache(maxsize=256)(to_positional)
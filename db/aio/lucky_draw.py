@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta, timezone
+import logging
+import random
+from typing import AsyncIterator, Optional, Tuple
+
+import config
+import db.aio
+from db.aio import bind
+from db.lucky_draw import EntryOutcome, RAFFLE_CREATED_CHANNEL, listing_cache, _COUNT_RAFFLE_APPLICANTS, \
+    _CREATE_RAFFLE, _DRAW_TICKETS, _ENTER_WITH_NEXT_TICKET, _GET_ENTRY_COUNTS, _GET_NEXT_UPCOMING_RAFFLES, \
+    _GET_NEXT_VALID_TICKET_FOR_USER, _GET_ONGOING_RAFFLES, _GET_RAFFLE, _GET_RAFFLE_APPLICANT, _GET_RAFFLE_APPLICANTS, \
+    _GET_RAFFLE_VERSION, _GET_RAFFLES_VERSION, _GET_SECONDS_TO_NEXT_CHANGE, _GET_TICKETS_FOR_USER, _GET_UPCOMING_RAFFLES, \
+    _INSERT_TICKETS, _NOTIFY_RAFFLE_CREATED, _SAVE_RAFFLE_SUMMARY, _past_raffles_query, _ticket_batches, _version_from_row
+from db.statements import Statement
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# The results of raffles are computed by the result scheduler, which uses the blocking functions of db.lucky_draw,
+# so only the functions used to serve the API are implemented here. They run the statements registered by
+# db.lucky_draw, which asyncpg prepares and caches on each connection.
+
+
+async def create_raffle(title: str, description: str, prize: str, prize_picture_url: str, start_time: str, closing_time: str) -> int:
+    """Create a new lucky draw raffle. Its ID is sent on ``RAFFLE_CREATED_CHANNEL`` once it is committed.
+    See ``db.lucky_draw.create_raffle``.
+    """
+    async with db.aio.pool.acquire() as connection:
+        async with connection.transaction():
+            raffle_id = await connection.fetchval(*bind(_CREATE_RAFFLE.sql, {
+                "title": title,
+                "description": description,
+                "prize":  prize,
+                "prize_picture_url":  prize_picture_url,
+                "start_time": start_time,
+                "closing_time": closing_time,
+            }))
+            await connection.execute(*bind(_SAVE_RAFFLE_SUMMARY.sql, {"raffle_id": raffle_id}))
+            await connection.execute(*bind(_NOTIFY_RAFFLE_CREATED.sql, {
+                "channel": RAFFLE_CREATED_CHANNEL,
+                "raffle_id": str(raffle_id),
+            }))
+
+    listing_cache.clear()
+    return raffle_id
+
+
+async def enter_raffle_with_next_ticket(raffle_id: int, user_id: int) -> Tuple[EntryOutcome, Optional[int]]:
+    """Enter the given user into the raffle with their earliest valid non-redeemed ticket.
+    See ``db.lucky_draw.enter_raffle_with_next_ticket``.
+    """
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_ENTER_WITH_NEXT_TICKET.sql, {
+            "raffle_id": raffle_id,
+            "user_id": user_id,
+            "shard": random.randrange(config.ENTRY_COUNTER_SHARDS),
+        }))
+
+        return EntryOutcome(row["outcome"]), row["ticket_no"]
+
+
+async def get_raffle(raffle_id: int, show_email: bool = False) -> Optional[dict]:
+    """Get the details for a given raffle. See ``db.lucky_draw.get_raffle``."""
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET_RAFFLE[show_email].sql, {"raffle_id": raffle_id}))
+
+        return dict(row) if row else None
+
+
+async def get_raffle_version(raffle_id: int, user_id: int = None) -> Optional[dict]:
+    """Get the data which the details of a raffle depend on. See ``db.lucky_draw.get_raffle_version``."""
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET_RAFFLE_VERSION.sql, {
+            "raffle_id": raffle_id,
+            "user_id": user_id,
+        }))
+
+        return _version_from_row(row) if row else None
+
+
+async def get_raffle_applicants(raffle_id: int, user_id: int = None) -> list:
+    """Get a list of applicants for a given raffle. See ``db.lucky_draw.get_raffle_applicants``."""
+    statement = _GET_RAFFLE_APPLICANT if user_id else _GET_RAFFLE_APPLICANTS
+    async with db.aio.pool.acquire() as connection:
+        rows = await connection.fetch(*bind(statement.sql, {"raffle_id": raffle_id, "user_id": user_id}))
+
+        return [dict(row) for row in rows]
+
+
+async def iter_raffle_applicants(raffle_id: int) -> AsyncIterator[dict]:
+    """Get the applicants of a given raffle without loading them all into memory.
+    See ``db.lucky_draw.iter_raffle_applicants``.
+    """
+    async with db.aio.pool.acquire() as connection:
+        async with connection.transaction():
+            async for row in connection.cursor(*bind(_GET_RAFFLE_APPLICANTS.sql, {"raffle_id": raffle_id}),
+                                               prefetch=config.STREAM_CHUNK_SIZE):
+                yield dict(row)
+
+
+async def count_raffle_applicants(raffle_id: int) -> int:
+    """Get the no. of applicants of a given raffle. See ``db.lucky_draw.count_raffle_applicants``."""
+    async with db.aio.pool.acquire() as connection:
+        return await connection.fetchval(*bind(_COUNT_RAFFLE_APPLICANTS.sql, {"raffle_id": raffle_id}))
+
+
+async def get_past_raffles(show_email: bool = False, days: int = None, limit: int = None, after: tuple = None) -> list:
+    """Get the details of the closed raffles, latest first. See ``db.lucky_draw.get_past_raffles``."""
+    statement, params = _past_raffles_query(show_email=show_email, days=days, limit=limit, after=after)
+    if after:
+        async with db.aio.pool.acquire() as connection:
+            return [dict(row) for row in await connection.fetch(*bind(statement.sql, params))]
+
+    return await _get_listing(("past", show_email, days, limit), statement, params, days=days)
+
+
+async def iter_past_raffles(show_email: bool = False, days: int = None) -> AsyncIterator[dict]:
+    """Get the details of the closed raffles, latest first, without loading them all into memory.
+    See ``db.lucky_draw.iter_past_raffles``.
+    """
+    statement, params = _past_raffles_query(show_email=show_email, days=days)
+    async with db.aio.pool.acquire() as connection:
+        async with connection.transaction():
+            async for row in connection.cursor(*bind(statement.sql, params), prefetch=config.STREAM_CHUNK_SIZE):
+                yield dict(row)
+
+
+async def get_upcoming_raffles(limit: int = None) -> list:
+    """Get a list of upcoming raffles. See ``db.lucky_draw.get_upcoming_raffles``."""
+    statement = _GET_NEXT_UPCOMING_RAFFLES if limit else _GET_UPCOMING_RAFFLES
+    return await _get_listing(("upcoming", limit), statement, {"limit": limit})
+
+
+async def get_ongoing_raffles() -> list:
+    """Get a list of ongoing raffles. See ``db.lucky_draw.get_ongoing_raffles``."""
+    return await _get_listing(("ongoing",), _GET_ONGOING_RAFFLES, {})
+
+
+async def get_entry_counts(raffle_ids: list) -> dict:
+    """Get the no. of entries in each of the given raffles so far. See ``db.lucky_draw.get_entry_counts``."""
+    if not raffle_ids:
+        return {}
+
+    async with db.aio.pool.acquire() as connection:
+        rows = await connection.fetch(*bind(_GET_ENTRY_COUNTS.sql, {"raffle_ids": list(raffle_ids)}))
+
+        return {row["raffle_id"]: row["entry_count"] for row in rows if row["entry_count"]}
+
+
+async def get_raffles_version(days: int = None) -> dict:
+    """Get the data which the raffle listings depend on. See ``db.lucky_draw.get_raffles_version``."""
+    key = ("version", days)
+    version = listing_cache.get(key)
+    if version is not None:
+        return version
+
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET_RAFFLES_VERSION.sql, {"days": days}))
+        version = _version_from_row(row)
+
+    ttl = listing_cache.ttl
+    if version["seconds_to_next_change"] is not None:
+        ttl = min(ttl, version["seconds_to_next_change"])
+    listing_cache.set(key, version, ttl=ttl)
+    return version
+
+
+async def _get_listing(key: tuple, statement: Statement, params: dict, days: int = None) -> list:
+    """Get a list of raffles from ``listing_cache``, running ``statement`` if it isn't cached.
+    See ``db.lucky_draw._get_listing``.
+    """
+    raffles = listing_cache.get(key)
+    if raffles is not None:
+        return raffles
+
+    async with db.aio.pool.acquire() as connection:
+        raffles = [dict(row) for row in await connection.fetch(*bind(statement.sql, params))]
+
+        seconds_to_next_change = await connection.fetchval(*bind(_GET_SECONDS_TO_NEXT_CHANGE.sql, {"days": days}))
+
+    ttl = listing_cache.ttl
+    if seconds_to_next_change is not None:
+        ttl = min(ttl, float(seconds_to_next_change))
+    listing_cache.set(key, raffles, ttl=ttl)
+    return raffles
+
+
+async def draw_ticket(user_id: int) -> dict:
+    """Insert a new ticket for the given user. See ``db.lucky_draw.draw_ticket``."""
+    valid_upto = datetime.now(timezone.utc) + timedelta(days=config.TICKET_VALIDITY)
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_INSERT_TICKETS.sql, {
+            "user_ids": [user_id],
+            "valid_upto": valid_upto,
+        }))
+
+        return {"ticket_no": row["ticket_no"], "valid_upto": row["valid_upto"]}
+
+
+async def draw_tickets(user_ids: list, count: int = 1) -> AsyncIterator[dict]:
+    """Insert ``count`` new tickets for each of the given users. See ``db.lucky_draw.draw_tickets``."""
+    valid_upto = datetime.now(timezone.utc) + timedelta(days=config.TICKET_VALIDITY)
+    for batch_user_ids, batch_count in _ticket_batches(user_ids, count):
+        async with db.aio.pool.acquire() as connection:
+            rows = await connection.fetch(*bind(_DRAW_TICKETS.sql, {
+                "user_ids": batch_user_ids,
+                "count": batch_count,
+                "valid_upto": valid_upto,
+            }))
+
+        for row in rows:
+            yield dict(row)
+
+
+async def get_tickets_for_user(user_id: int) -> list:
+    """Get list of tickets drawn by a given user. See ``db.lucky_draw.get_tickets_for_user``."""
+    async with db.aio.pool.acquire() as connection:
+        rows = await connection.fetch(*bind(_GET_TICKETS_FOR_USER.sql, {"user_id": user_id}))
+
+        return [dict(row) for row in rows]
+
+
+async def get_next_vaild_ticket_for_user(user_id: int) -> Optional[int]:
+    """Get the earliest valid and non-redeemed ticket for the user. See ``db.lucky_draw.get_next_vaild_ticket_for_user``."""
+    async with db.aio.pool.acquire() as connection:
+        return await connection.fetchval(*bind(_GET_NEXT_VALID_TICKET_FOR_USER.sql, {"user_id": user_id}))
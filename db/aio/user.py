@@ -0,0 +1,100 @@
+import logging
+import random
+from typing import Optional
+import uuid
+
+import config
+import db.aio
+from db.aio import bind
+from db.password import hash_password_async, needs_rehash, verify_password_async
+from db.user import _CREATE, _DELETE, _GET, _GET_BY_EMAIL_ID, _GET_BY_TOKEN, _NOTIFY_USER_INVALIDATED, _REHASH_PASSWORD, \
+    _ROTATE_AUTH_TOKEN, invalidation_params, token_cache, user_cache
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+async def create(name: str, email_id: str, password: str) -> int:
+    """Create a new user. See ``db.user.create``."""
+    password_hash = await hash_password_async(password)
+    async with db.aio.pool.acquire() as connection:
+        return await connection.fetchval(*bind(_CREATE.sql, {
+            "name": name,
+            "email_id": email_id,
+            "password_hash":  password_hash,
+            "token": str(uuid.uuid4()),
+        }))
+
+
+async def get(id: int) -> Optional[dict]:
+    """Get user with a specified ID. See ``db.user.get``."""
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET.sql, {"id": id}))
+        return dict(row) if row else None
+
+
+async def get_by_email_id_and_password(email_id: str, password: str) -> Optional[dict]:
+    """Get user with a specified email ID amd password. See ``db.user.get_by_email_id_and_password``."""
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET_BY_EMAIL_ID.sql, {
+            "email_id": email_id,
+        }))
+
+    if row is None or not await verify_password_async(password, row["password"]):
+        return None
+
+    user = dict(row)
+    password_hash = user.pop("password")
+    if needs_rehash(password_hash):
+        await _rehash_password(user["id"], password, password_hash)
+    return user
+
+
+async def _rehash_password(id: int, password: str, old_password_hash: str):
+    """Replace the password hash of a user, unless the password was changed in the meantime."""
+    password_hash = await hash_password_async(password)
+    async with db.aio.pool.acquire() as connection:
+        await connection.execute(*bind(_REHASH_PASSWORD.sql, {
+            "id": id,
+            "password_hash": password_hash,
+            "old_password_hash": old_password_hash,
+        }))
+
+
+async def get_by_token(auth_token: str) -> Optional[dict]:
+    """Get user with a specified authorization token. See ``db.user.get_by_token``."""
+    async with db.aio.pool.acquire() as connection:
+        row = await connection.fetchrow(*bind(_GET_BY_TOKEN.sql, {
+            "auth_token": auth_token,
+        }))
+        return dict(row) if row else None
+
+
+async def rotate_auth_token(id: int) -> Optional[str]:
+    """Replace the authorization token of a user with a new one. See ``db.user.rotate_auth_token``."""
+    async with db.aio.pool.acquire() as connection, connection.transaction():
+        row = await connection.fetchrow(*bind(_ROTATE_AUTH_TOKEN.sql, {
+            "id": id,
+            "token": str(uuid.uuid4()),
+        }))
+        if row is not None:
+            await connection.execute(*bind(_NOTIFY_USER_INVALIDATED.sql, invalidation_params(id, row["old_token"])))
+
+    if row is None:
+        return None
+    token_cache.delete(row["old_token"])
+    user_cache.delete(id)
+    return row["new_token"]
+
+
+async def delete(id: int):
+    """Delete a user along with their tickets and raffle entries. See ``db.user.delete``."""
+    async with db.aio.pool.acquire() as connection, connection.transaction():
+        row = await connection.fetchrow(*bind(_DELETE.sql, {"id": id, "shard": random.randrange(config.ENTRY_COUNTER_SHARDS)}))
+        if row is not None:
+            await connection.execute(*bind(_NOTIFY_USER_INVALIDATED.sql, invalidation_params(id, row["auth_token"])))
+
+    if row is not None:
+        token_cache.delete(row["auth_token"])
+    user_cache.delete(id)
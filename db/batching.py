@@ -0,0 +1,119 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from typing import Callable
+
+import config
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+WRITE_BATCH_SIZE = metrics.Histogram("bingo_db_write_batch_size", "No. of writes coalesced into each transaction by a write batcher.",
+                                     labelnames=("batcher",), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class WriteBatcher:
+    """ Coalesces the writes made by many threads at the same time into batches, each written by a single
+    transaction, so that the DB commits, and flushes its WAL, once per batch instead of once per write.
+    A batch is written once it has ``max_size`` writes, or ``max_delay`` seconds after its first write was queued.
+    The batches are written one at a time by a thread of each process, started on the first write.
+    Args:
+        name: the name of the batcher, e.g. in its metrics
+        write: the function writing a batch, called with a connection in a transaction and the list of items
+               to write, and returning the list of their results in the same order
+        max_size: the max. no. of items written by a transaction
+        max_delay: the max. time in seconds for which an item waits for more items to be written with
+        timeout (optional): the max. time in seconds for which ``submit`` waits for an item to be written,
+                            defaults to ``WRITE_BATCH_TIMEOUT`` from the config
+    """
+
+    def __init__(self, name: str, write: Callable, max_size: int, max_delay: float, timeout: float = None):
+        self.name = name
+        self.write = write
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.timeout = timeout or config.WRITE_BATCH_TIMEOUT
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """ Queue an item to be written with the next batch, and wait for it to be written.
+        Returns:
+            The result of writing the item.
+        Raises:
+            The error raised by writing the item, e.g. a ``sqlalchemy.exc.IntegrityError`` if it violates a constraint,
+            even when other items of its batch are written.
+            ``concurrent.futures.TimeoutError`` if the item isn't written within ``timeout`` seconds. The item is
+            then dropped, unless it was already being written, in which case it may still be written.
+        """
+        future = Future()
+        self._get_queue().put((item, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            logger.warning("Writing an item with %s timed out after %s seconds", self.name, self.timeout)
+            raise
+
+    def _get_queue(self):
+        with self._lock:
+            # The thread doesn't survive a fork, so each process starts its own
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, args=(self._queue,), name="write-batcher-" + self.name, daemon=True).start()
+            return self._queue
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            try:
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(pending.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                # Items whose callers timed out are skipped, and the others can't be cancelled any more
+                batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:
+                # Keep the thread alive for the next batches, and don't leave the callers of this one waiting
+                logger.exception("Unexpected error while writing a batch with %s", self.name)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _write_batch(self, batch):
+        WRITE_BATCH_SIZE.observe(len(batch), batcher=self.name)
+        try:
+            with db.engine.begin() as connection:
+                results = self.write(connection, [item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError("%s returned %s results for %s items" % (self.name, len(results), len(batch)))
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # The first failing item, e.g. one violating a constraint, rolls back the whole batch, so both halves
+            # of it are written again, and so on, for every caller to get their own result or error. A failing item
+            # costs about 2 * log2(len(batch)) more transactions instead of one per item.
+            logger.info("Writing a batch of %s items with %s failed, writing it in halves: %s", len(batch), self.name, e)
+            middle = len(batch) // 2
+            self._write_batch(batch[:middle])
+            self._write_batch(batch[middle:])
+            return
+
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
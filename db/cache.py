@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """ A thread safe, size bounded LRU cache whose entries expire after a given time.
+    The cache lives in the memory of the current process. It is emptied in child
+    processes after a fork(), so every worker process builds up its own entries.
+    Args:
+        maxsize: the maximum number of entries to keep, the least recently used entry is evicted first
+        ttl: the number of seconds after which an entry expires
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def get(self, key, default=None):
+        """ Get the value stored for ``key``, or ``default`` if it is missing or expired. """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        """ Store ``value`` for ``key``.
+        Args:
+            ttl (optional): the number of seconds after which this entry expires, if different from the cache default.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """ Get the value stored for ``key``, calling ``loader()`` to get and store it if it isn't cached.
+        ``None`` returned by the loader is not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def delete(self, key):
+        """ Remove the entry for ``key`` if there is one. """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all the entries. """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Get the usage statistics of the cache.
+        Returns:
+            {
+                "size": <no. of entries in the cache>,
+                "maxsize": <maximum no. of entries>,
+                "hits": <no. of lookups answered from the cache>,
+                "misses": <no. of lookups not found in the cache>,
+            }
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
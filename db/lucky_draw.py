@@ -1,17 +1,107 @@
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, timezone
+from enum import Enum
 import logging
-from typing import Optional
+import random
+from typing import Iterator, Optional, Tuple
 import sqlalchemy
 
 import db
 import config
+from db import statements
+from db.batching import WriteBatcher
+from db.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Raffle listings only change when a raffle is created, a result is saved or the clock passes
+# the start or closing time of a raffle. They are cached until the next such time, or at most for
+# RAFFLE_LISTING_CACHE_MAX_TTL seconds so that changes made by other processes are picked up.
+# The cached lists are shared between callers and must not be modified.
+listing_cache = TTLCache(maxsize=config.RAFFLE_LISTING_CACHE_SIZE, ttl=config.RAFFLE_LISTING_CACHE_MAX_TTL)
+
+# First key of the advisory locks taken on raffles while their results are computed
+RESULT_LOCK_NAMESPACE = 1
+
+# Channel on which the ID of every new raffle is sent with NOTIFY
+RAFFLE_CREATED_CHANNEL = "lucky_draw_raffle_created"
+
+# Writes the lucky_draw.raffle_summary rows of the raffles matching a WHERE clause appended to it, from the
+# raffles, their results and winners. The no. of entries is only recorded once the result is saved, as raffles
+# get no entries after that, and is kept from then on: the entries of the raffle may have been archived since,
+# see db.partitions.archive_partitions. Rows which are already up to date are left alone.
+_SAVE_RAFFLE_SUMMARY_QUERY = """
+    INSERT INTO lucky_draw.raffle_summary (raffle_id, title, description, prize, prize_picture_url, start_time, closing_time,
+                                           winner_user_id, winner_name, winner_email_id, winner_ticket_no, entry_count)
+         SELECT raffle.id, title, description, prize, prize_picture_url, start_time, closing_time,
+                result.user_id, "user".name, "user".email_id, result.ticket_no,
+                CASE WHEN result.raffle_id IS NOT NULL
+                     THEN (SELECT COUNT(*) FROM lucky_draw.entry WHERE entry.raffle_id = raffle.id)
+                END
+           FROM lucky_draw.raffle AS raffle
+      LEFT JOIN lucky_draw.result AS result
+             ON raffle.id = result.raffle_id
+      LEFT JOIN "user"
+             ON result.user_id = "user".id
+          {where}
+    ON CONFLICT (raffle_id) DO UPDATE
+            SET (title, description, prize, prize_picture_url, start_time, closing_time,
+                 winner_user_id, winner_name, winner_email_id, winner_ticket_no)
+              = (EXCLUDED.title, EXCLUDED.description, EXCLUDED.prize, EXCLUDED.prize_picture_url,
+                 EXCLUDED.start_time, EXCLUDED.closing_time, EXCLUDED.winner_user_id, EXCLUDED.winner_name,
+                 EXCLUDED.winner_email_id, EXCLUDED.winner_ticket_no)
+              , entry_count = CASE WHEN EXCLUDED.entry_count IS NOT NULL
+                                   THEN COALESCE(raffle_summary.entry_count, EXCLUDED.entry_count)
+                              END
+          WHERE (raffle_summary.title, raffle_summary.description, raffle_summary.prize, raffle_summary.prize_picture_url,
+                 raffle_summary.start_time, raffle_summary.closing_time, raffle_summary.winner_user_id,
+                 raffle_summary.winner_name, raffle_summary.winner_email_id, raffle_summary.winner_ticket_no,
+                 raffle_summary.entry_count IS NULL)
+                IS DISTINCT FROM
+                (EXCLUDED.title, EXCLUDED.description, EXCLUDED.prize, EXCLUDED.prize_picture_url,
+                 EXCLUDED.start_time, EXCLUDED.closing_time, EXCLUDED.winner_user_id, EXCLUDED.winner_name,
+                 EXCLUDED.winner_email_id, EXCLUDED.winner_ticket_no, EXCLUDED.entry_count IS NULL)
+"""
+
+
+# The no. of entries of the raffle with the ID :raffle_id, from its sharded entry counter. Once its result is saved,
+# the count recorded in its summary is used instead, which is kept when its entries are archived.
+_ENTRY_COUNT_EXPRESSION = """
+    COALESCE(
+        (SELECT entry_count FROM lucky_draw.raffle_summary WHERE raffle_id = :raffle_id),
+        (SELECT SUM(entry_count) FROM lucky_draw.raffle_entry_count WHERE raffle_id = :raffle_id),
+        0
+    )
+"""
+
+
+class TicketNotRedeemableError(Exception):
+    """ Raised by ``enter_raflle`` when a ticket is already redeemed or doesn't belong to the user entering with it. """
+
+
+class EntryOutcome(Enum):
+    """ The outcome of an attempt to enter a raffle with ``enter_raffle_with_next_ticket``. """
+    OK = "ok"
+    NO_TICKET = "no_ticket"
+    NO_RAFFLE = "no_raffle"
+    CLOSED = "closed"
+    ALREADY_ENTERED = "already_entered"
+
+
+_CREATE_RAFFLE = statements.register("lucky_draw_create_raffle", """
+    INSERT INTO lucky_draw.raffle (title, description, prize, prize_picture_url, start_time, closing_time)
+         VALUES (:title, :description, :prize, :prize_picture_url,
+                 CAST(CAST(:start_time AS TEXT) AS TIMESTAMPTZ), CAST(CAST(:closing_time AS TEXT) AS TIMESTAMPTZ))
+      RETURNING id
+""")
+
+_NOTIFY_RAFFLE_CREATED = statements.register("lucky_draw_notify_raffle_created", """
+    SELECT pg_notify(:channel, :raffle_id)
+""")
+
 
 def create_raffle(title: str, description: str, prize: str, prize_picture_url: str, start_time: str, closing_time: str) -> int:
-    """Create a new lucky draw raffle.
+    """Create a new lucky draw raffle. Its ID is sent on ``RAFFLE_CREATED_CHANNEL`` once it is committed.
     Args:
         title: the title of he raffle
         description (optional): the description of the raffle
@@ -22,12 +112,8 @@ def create_raffle(title: str, description: str, prize: str, prize_picture_url: s
     Returns:
         ID of newly created raffle.
     """
-    with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            INSERT INTO lucky_draw.raffle (title, description, prize, prize_picture_url, start_time, closing_time)
-                 VALUES (:title, :description, :prize, :prize_picture_url, :start_time, :closing_time)
-              RETURNING id
-        """), {
+    with db.engine.begin() as connection:
+        result = _CREATE_RAFFLE.execute(connection, {
             "title": title,
             "description": description,
             "prize":  prize,
@@ -35,26 +121,209 @@ def create_raffle(title: str, description: str, prize: str, prize_picture_url: s
             "start_time": start_time,
             "closing_time": closing_time,
         })
-        return result.fetchone()["id"]
+        raffle_id = result.fetchone()["id"]
+        _save_raffle_summary(connection, raffle_id)
+        _NOTIFY_RAFFLE_CREATED.execute(connection, {
+            "channel": RAFFLE_CREATED_CHANNEL,
+            "raffle_id": str(raffle_id),
+        })
+
+    listing_cache.clear()
+    return raffle_id
 
 
 def enter_raflle(raffle_id: int, ticket_no: int, user_id: int):
     """Add an entry into the raffle for the given user with with the given user ticket.
+    The entry counter of the raffle is incremented in the same transaction. With ``WRITE_BATCHING_ENABLED``,
+    the entry is inserted along with those made by other threads at the same time, see ``db.batching``.
     Args:
         raffle_id: The DB ID of the raffle
         ticket_no: The user ticket with which they enter the raffle
         user_id: The DB ID of the user.
+    Raises:
+        TicketNotRedeemableError: if the ticket is already redeemed or doesn't belong to the user
     """
-    with db.engine.connect() as connection:
-        connection.execute(sqlalchemy.text("""
-            INSERT INTO lucky_draw.entry (raffle_id, ticket_no, user_id)
-                 VALUES (:raffle_id, :ticket_no, :user_id)
-        """), {
+    if config.WRITE_BATCHING_ENABLED:
+        _entry_batcher.submit((raffle_id, ticket_no, user_id))
+        return
+
+    with db.engine.begin() as connection:
+        _insert_entries(connection, [(raffle_id, ticket_no, user_id)])
+
+
+_INSERT_ENTRIES = statements.register("lucky_draw_insert_entries", """
+    WITH new_entry AS (
+        INSERT INTO lucky_draw.entry (raffle_id, ticket_no, user_id)
+             SELECT raffle_id, ticket_no, user_id
+               FROM unnest(CAST(:raffle_ids AS INT[]), CAST(:ticket_nos AS INT[]), CAST(:user_ids AS INT[]))
+                 AS new_entry (raffle_id, ticket_no, user_id)
+           ORDER BY raffle_id, user_id
+          RETURNING raffle_id, ticket_no, user_id
+    ), counted_entry AS (
+        INSERT INTO lucky_draw.raffle_entry_count AS counter (raffle_id, shard, entry_count)
+             SELECT raffle_id, :shard, COUNT(*)
+               FROM new_entry
+           GROUP BY raffle_id
+           ORDER BY raffle_id
+        ON CONFLICT (raffle_id, shard)
+          DO UPDATE SET entry_count = counter.entry_count + EXCLUDED.entry_count
+    ), redeemed_ticket AS (
+        UPDATE lucky_draw.ticket
+           SET redeemed_raffle_id = new_entry.raffle_id
+          FROM new_entry
+         WHERE ticket.ticket_no = new_entry.ticket_no
+           AND ticket.user_id = new_entry.user_id
+           AND ticket.redeemed_raffle_id IS NULL
+     RETURNING ticket.ticket_no
+    )
+    SELECT (SELECT COUNT(*) FROM new_entry) AS entries
+         , (SELECT COUNT(*) FROM redeemed_ticket) AS redeemed
+""")
+
+
+def _insert_entries(connection, entries: list) -> list:
+    """Insert entries into raffles with a single statement, incrementing the same shard of the entry counter
+    of each raffle. The entries are inserted in the order of the raffle IDs and user IDs, and the counters
+    are locked in the order of the raffle IDs, so that concurrent batches don't deadlock.
+    Args:
+        connection: the connection to insert them with, in a transaction
+        entries: tuples of the raffle ID, ticket no. and user ID of each entry
+    Returns:
+        A list of None for each entry.
+    Raises:
+        TicketNotRedeemableError: if any of the tickets is already redeemed, is used by more than one of the entries
+                                  or doesn't belong to the user. The transaction has to be rolled back.
+    """
+    raffle_ids, ticket_nos, user_ids = zip(*entries)
+    result = _INSERT_ENTRIES.execute(connection, {
+        "raffle_ids": list(raffle_ids),
+        "ticket_nos": list(ticket_nos),
+        "user_ids": list(user_ids),
+        "shard": random.randrange(config.ENTRY_COUNTER_SHARDS),
+    })
+    row = result.fetchone()
+    if row["redeemed"] < row["entries"]:
+        raise TicketNotRedeemableError("%s of %s tickets are already redeemed or belong to other users" % (
+            row["entries"] - row["redeemed"], row["entries"]))
+    return [None] * len(entries)
+
+
+_entry_batcher = WriteBatcher("enter_raflle", _insert_entries, config.WRITE_BATCH_MAX_SIZE, config.WRITE_BATCH_MAX_DELAY_MS / 1000)
+
+
+def enter_raffle_with_next_ticket(raffle_id: int, user_id: int) -> Tuple[EntryOutcome, Optional[int]]:
+    """Enter the given user into the raffle with their earliest valid non-redeemed ticket.
+    The raffle is checked, the ticket is claimed, the entry is inserted, the ticket is marked as redeemed
+    and the entry counter of the raffle is incremented by a single statement. Concurrent calls for the
+    same user skip the tickets claimed by each other, and a ticket can be used for only one entry.
+    With ``WRITE_BATCHING_ENABLED``, the statement is run in the same transaction as those of other
+    threads entering raffles at the same time, see ``db.batching``.
+    Args:
+        raffle_id: The DB ID of the raffle
+        user_id: The DB ID of the user.
+    Returns:
+        A tuple of the outcome of the attempt and the ticket no. used to enter the raffle, if the entry was made.
+        The outcome is checked in the following order:
+            EntryOutcome.NO_TICKET: The user has no valid non-redeemed tickets
+            EntryOutcome.NO_RAFFLE: The raffle doesn't exist
+            EntryOutcome.CLOSED: The raffle entries are closed
+            EntryOutcome.ALREADY_ENTERED: The user has already entered the raffle
+    """
+    if config.WRITE_BATCHING_ENABLED:
+        return _next_ticket_entry_batcher.submit((raffle_id, user_id))
+
+    with db.engine.begin() as connection:
+        return _enter_with_next_tickets(connection, [(raffle_id, user_id)])[0]
+
+
+_ENTER_WITH_NEXT_TICKET = statements.register("lucky_draw_enter_with_next_ticket", """
+    WITH raffle AS (
+        SELECT closing_time > NOW() AS is_open
+          FROM lucky_draw.raffle
+         WHERE id = :raffle_id
+    ), next_ticket AS (
+        SELECT ticket_no, valid_upto
+          FROM lucky_draw.ticket
+         WHERE user_id = :user_id
+           AND valid_upto > NOW()
+           AND redeemed_raffle_id IS NULL
+      ORDER BY created
+         LIMIT 1
+           FOR UPDATE SKIP LOCKED
+    ), new_entry AS (
+        INSERT INTO lucky_draw.entry (raffle_id, ticket_no, user_id)
+             SELECT :raffle_id, next_ticket.ticket_no, :user_id
+               FROM next_ticket, raffle
+              WHERE raffle.is_open
+        ON CONFLICT DO NOTHING
+          RETURNING ticket_no
+    ), redeemed_ticket AS (
+        UPDATE lucky_draw.ticket
+           SET redeemed_raffle_id = :raffle_id
+          FROM next_ticket
+         WHERE ticket.ticket_no = next_ticket.ticket_no
+           AND ticket.valid_upto = next_ticket.valid_upto
+           AND EXISTS (SELECT 1 FROM new_entry)
+    ), counted_entry AS (
+        INSERT INTO lucky_draw.raffle_entry_count AS counter (raffle_id, shard, entry_count)
+             SELECT :raffle_id, :shard, 1
+               FROM new_entry
+        ON CONFLICT (raffle_id, shard)
+          DO UPDATE SET entry_count = counter.entry_count + EXCLUDED.entry_count
+    )
+    SELECT CASE
+               WHEN EXISTS (SELECT 1 FROM new_entry) THEN 'ok'
+               WHEN NOT EXISTS (SELECT 1 FROM next_ticket) THEN 'no_ticket'
+               WHEN NOT EXISTS (SELECT 1 FROM raffle) THEN 'no_raffle'
+               WHEN NOT (SELECT is_open FROM raffle) THEN 'closed'
+               ELSE 'already_entered'
+           END AS outcome
+         , (SELECT ticket_no FROM new_entry) AS ticket_no
+""")
+
+
+def _enter_with_next_tickets(connection, attempts: list) -> list:
+    """Enter users into raffles with their next tickets, one statement at a time in the given transaction,
+    incrementing the same shard of the entry counter of each raffle. The attempts are made in the order
+    of the raffle IDs and user IDs, so that the counters and the entries of each user are locked in that order
+    and concurrent batches don't deadlock.
+    Args:
+        connection: the connection to enter them with, in a transaction
+        attempts: tuples of the raffle ID and user ID of each attempt
+    Returns:
+        A list of the outcome and ticket no. of each attempt, see ``enter_raffle_with_next_ticket``.
+    """
+    shard = random.randrange(config.ENTRY_COUNTER_SHARDS)
+    outcomes = [None] * len(attempts)
+    for index in sorted(range(len(attempts)), key=lambda index: attempts[index]):
+        raffle_id, user_id = attempts[index]
+        result = _ENTER_WITH_NEXT_TICKET.execute(connection, {
             "raffle_id": raffle_id,
-            "ticket_no": ticket_no,
             "user_id": user_id,
+            "shard": shard,
         })
 
+        row = result.fetchone()
+        outcomes[index] = (EntryOutcome(row["outcome"]), row["ticket_no"])
+    return outcomes
+
+
+_next_ticket_entry_batcher = WriteBatcher("enter_raffle_with_next_ticket", _enter_with_next_tickets,
+                                          config.WRITE_BATCH_MAX_SIZE, config.WRITE_BATCH_MAX_DELAY_MS / 1000)
+
+
+# The details of a raffle, by whether the email of the winner is shown
+_GET_RAFFLE = {
+    show_email: statements.register("lucky_draw_get_raffle" + ("_with_email" if show_email else ""), """
+        SELECT title, description, prize, prize_picture_url, start_time, closing_time, winner_name, winner_ticket_no
+               {email}
+             , {entry_count} AS entry_count
+          FROM lucky_draw.raffle_summary
+         WHERE raffle_id = :raffle_id
+    """.format(email=", winner_email_id" if show_email else "", entry_count=_ENTRY_COUNT_EXPRESSION))
+    for show_email in (False, True)
+}
+
 
 def get_raffle(raffle_id: int, show_email: bool = False) -> Optional[dict]:
     """Get the details for a given raffle.
@@ -73,27 +342,73 @@ def get_raffle(raffle_id: int, show_email: bool = False) -> Optional[dict]:
             "winner_name": <name of the raffle winner> (if result is declared)
             "winner_ticket_no": <winning ticket no.> (if result is declared)
             "winner_email_id": <email ID of the raffle winner> (if result is declared, visible only to admins)
+            "entry_count": <no. of entries in the raffle so far>
         }
     """
-    cols = "title, description, prize, prize_picture_url, start_time, closing_time, name AS winner_name, ticket_no AS winner_ticket_no"
-    if show_email:
-        cols += ", email_id AS winner_email_id"
-
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT {cols}
-              FROM lucky_draw.raffle AS raffle
-         LEFT JOIN lucky_draw.result AS result
-                ON raffle.id = result.raffle_id
-         LEFT JOIN "user"
-                ON result.user_id = "user".id
-             WHERE raffle.id = :raffle_id
-        """.format(cols=cols)), {"raffle_id": raffle_id})
+        result = _GET_RAFFLE[show_email].execute(connection, {"raffle_id": raffle_id})
 
         row = result.fetchone()
         return dict(row) if row else None
 
 
+_GET_RAFFLE_VERSION = statements.register("lucky_draw_get_raffle_version", """
+    SELECT GREATEST(
+               modified,
+               CASE WHEN start_time <= NOW() THEN start_time END,
+               CASE WHEN closing_time <= NOW() THEN closing_time END
+           ) AS last_modified
+         , EXTRACT(EPOCH FROM LEAST(
+               CASE WHEN start_time > NOW() THEN start_time END,
+               CASE WHEN closing_time > NOW() THEN closing_time END
+           ) - NOW()) AS seconds_to_next_change
+         , (SELECT ticket_no FROM lucky_draw.entry WHERE raffle_id = :raffle_id AND user_id = :user_id) AS entry_ticket_no
+         , {entry_count} AS entry_count
+      FROM lucky_draw.raffle
+     WHERE id = :raffle_id
+""".format(entry_count=_ENTRY_COUNT_EXPRESSION))
+
+
+def get_raffle_version(raffle_id: int, user_id: int = None) -> Optional[dict]:
+    """Get the data which the details of a raffle returned by the API depend on, without fetching them,
+    so that clients which already have them can be told they haven't changed.
+    Args:
+        raffle_id: The DB ID of the raffle
+        user_id (optional): Get the entry of the user with the given ID in the raffle too.
+    Returns:
+        None if the raffle doesn't exist, else
+        {
+            "last_modified": <the last time the raffle was created, started, closed or got its result>,
+            "seconds_to_next_change": <no. of seconds till the raffle starts or closes, None if it's closed>,
+            "entry_ticket_no": <ticket no. of the user's entry, if any>,
+            "entry_count": <no. of entries in the raffle so far>,
+        }
+    """
+    with db.engine.connect() as connection:
+        result = _GET_RAFFLE_VERSION.execute(connection, {
+            "raffle_id": raffle_id,
+            "user_id": user_id,
+        })
+
+        row = result.fetchone()
+        return _version_from_row(row) if row else None
+
+
+_RAFFLE_APPLICANTS_QUERY = """
+    SELECT name, email_id, ticket_no, user_id
+      FROM lucky_draw.entry AS entry
+ LEFT JOIN "user"
+        ON entry.user_id = "user".id
+     WHERE entry.raffle_id = :raffle_id
+"""
+
+_GET_RAFFLE_APPLICANTS = statements.register("lucky_draw_get_raffle_applicants", _RAFFLE_APPLICANTS_QUERY)
+
+_GET_RAFFLE_APPLICANT = statements.register("lucky_draw_get_raffle_applicant", _RAFFLE_APPLICANTS_QUERY + """
+       AND user_id = :user_id
+""")
+
+
 def get_raffle_applicants(raffle_id: int, user_id: int = None) -> list:
     """Get a list of applicants for a given raffle.
     Args:
@@ -110,31 +425,67 @@ def get_raffle_applicants(raffle_id: int, user_id: int = None) -> list:
         ...
         ]
     """
-    query = """
-            SELECT name, email_id, ticket_no, user_id
-              FROM lucky_draw.entry AS entry
-         LEFT JOIN "user"
-                ON entry.user_id = "user".id
-             WHERE entry.raffle_id = :raffle_id
-        """
-    if user_id:
-        query += "AND user_id = :user_id"
-
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text(query), {"raffle_id": raffle_id, "user_id": user_id})
+        if user_id:
+            result = _GET_RAFFLE_APPLICANT.execute(connection, {"raffle_id": raffle_id, "user_id": user_id})
+        else:
+            result = _GET_RAFFLE_APPLICANTS.execute(connection, {"raffle_id": raffle_id})
 
         return [dict(row) for row in result.fetchall()]
 
 
-def get_past_raffles(show_email: bool = False, days: int = None) -> list:
-    """Get the details for a given raffle.
+def iter_raffle_applicants(raffle_id: int) -> Iterator[dict]:
+    """Get the applicants of a given raffle without loading them all into memory.
+    The applicants are read from a server side cursor, ``STREAM_CHUNK_SIZE`` rows at a time.
+    Args:
+        raffle_id: The DB ID of the raffle
+    Yields:
+        The details of each applicant, as returned by ``get_raffle_applicants``.
+    """
+    with db.engine.connect() as connection:
+        # Server side cursors can't run prepared statements
+        result = connection.execution_options(stream_results=True).execute(_GET_RAFFLE_APPLICANTS.text, {"raffle_id": raffle_id})
+        while True:
+            rows = result.fetchmany(config.STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+
+_COUNT_RAFFLE_APPLICANTS = statements.register("lucky_draw_count_raffle_applicants", """
+    SELECT {entry_count} AS count
+""".format(entry_count=_ENTRY_COUNT_EXPRESSION))
+
+
+def count_raffle_applicants(raffle_id: int) -> int:
+    """Get the no. of applicants of a given raffle, from its entry counter. Once its result is saved,
+    the count recorded in its summary is returned instead.
+    Args:
+        raffle_id: The DB ID of the raffle
+    Returns:
+        The no. of entries in the raffle.
+    """
+    with db.engine.connect() as connection:
+        result = _COUNT_RAFFLE_APPLICANTS.execute(connection, {"raffle_id": raffle_id})
+
+        return result.fetchone()["count"]
+
+
+def get_past_raffles(show_email: bool = False, days: int = None, limit: int = None, after: tuple = None) -> list:
+    """Get the details of the closed raffles, latest first. Only the first page is cached in ``listing_cache``,
+    as each later page is requested by few clients and would evict the listings which many of them request.
     Args:
         show_email (optional): Show the email of the winner, in case the details are being accessed by an admin.
         days (optional): Limit the past raffles to past ``days`` days.
+        limit (optional): Limit the no. of raffles returned.
+        after (optional): A tuple of the ``closing_time`` and ``id`` of a raffle, to get the raffles which come after it,
+                          e.g. the last raffle of the previous page.
     Returns:
         A list of dictionaries with the following structure:
         [
             {
+                "id": <DB ID of the raffle>,
                 "title": <raffle title>,
                 "description": <raffle description>,
                 "prize": <prize for the raffle winner>
@@ -148,27 +499,90 @@ def get_past_raffles(show_email: bool = False, days: int = None) -> list:
             ...
         ]
     """
-    cols = "title, description, prize, prize_picture_url, start_time, closing_time, name AS winner_name, result.ticket_no AS winner_ticket_no"
-    if show_email:
-        cols += ", email_id AS winner_email_id"
+    statement, params = _past_raffles_query(show_email=show_email, days=days, limit=limit, after=after)
+    if after:
+        with db.engine.connect() as connection:
+            result = statement.execute(connection, params)
+            return [dict(row) for row in result.fetchall()]
+
+    return _get_listing(("past", show_email, days, limit), statement, params, days=days)
 
+
+def iter_past_raffles(show_email: bool = False, days: int = None) -> Iterator[dict]:
+    """Get the details of the closed raffles, latest first, without loading them all into memory.
+    The raffles are read from a server side cursor, ``STREAM_CHUNK_SIZE`` rows at a time.
+    Args:
+        show_email (optional): Show the email of the winner, in case the details are being accessed by an admin.
+        days (optional): Limit the past raffles to past ``days`` days.
+    Yields:
+        The details of each raffle, as returned by ``get_past_raffles``.
+    """
+    statement, params = _past_raffles_query(show_email=show_email, days=days)
+    with db.engine.connect() as connection:
+        # Server side cursors can't run prepared statements
+        result = connection.execution_options(stream_results=True).execute(statement.text, params)
+        while True:
+            rows = result.fetchmany(config.STREAM_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+
+def _past_raffles_sql(show_email: bool, days: bool, limit: bool, after: bool) -> str:
+    """Build the query of the closed raffles, with the filters which are used."""
     query = """
-            SELECT {cols}
-              FROM lucky_draw.raffle AS raffle
-         LEFT JOIN lucky_draw.result AS result
-                ON raffle.id = result.raffle_id
-         LEFT JOIN "user"
-                ON result.user_id = "user".id
-             WHERE raffle.closing_time < NOW()
-        """.format(cols=cols)
+        SELECT raffle_id AS id, title, description, prize, prize_picture_url, start_time, closing_time, winner_name, winner_ticket_no
+               {email}
+          FROM lucky_draw.raffle_summary
+         WHERE closing_time < NOW()
+    """.format(email=", winner_email_id" if show_email else "")
 
     if days:
-        query += "AND raffle.closing_time > NOW() - INTERVAL ':days' DAY"
+        query += "   AND closing_time > NOW() - make_interval(days => :days)\n"
 
-    with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text(query), {"days": days})
+    if after:
+        query += "   AND (closing_time, raffle_id) < (CAST(:after_closing_time AS TIMESTAMPTZ), :after_id)\n"
 
-        return [dict(row) for row in result.fetchall()]
+    query += "  ORDER BY closing_time DESC, raffle_id DESC\n"
+
+    if limit:
+        query += "     LIMIT :limit\n"
+
+    return query
+
+
+# The queries of the closed raffles, by whether the email of the winner is shown and whether they are limited
+# to the past days, limited in no. and come after a given raffle
+_GET_PAST_RAFFLES = {
+    (show_email, days, limit, after): statements.register(
+        "lucky_draw_get_past_raffles" + "".join(suffix for suffix, used in (
+            ("_with_email", show_email), ("_in_days", days), ("_limited", limit), ("_after", after)) if used),
+        _past_raffles_sql(show_email, days, limit, after))
+    for show_email in (False, True) for days in (False, True) for limit in (False, True) for after in (False, True)
+}
+
+
+def _past_raffles_query(show_email: bool, days: int = None, limit: int = None, after: tuple = None) -> Tuple[statements.Statement, dict]:
+    params = {"days": days, "limit": limit}
+    if after:
+        params["after_closing_time"], params["after_id"] = after
+
+    return _GET_PAST_RAFFLES[(bool(show_email), bool(days), bool(limit), bool(after))], params
+
+
+_UPCOMING_RAFFLES_QUERY = """
+    SELECT title, description, prize, prize_picture_url, start_time, closing_time
+      FROM lucky_draw.raffle_summary
+     WHERE start_time > NOW()
+  ORDER BY start_time
+"""
+
+_GET_UPCOMING_RAFFLES = statements.register("lucky_draw_get_upcoming_raffles", _UPCOMING_RAFFLES_QUERY)
+
+_GET_NEXT_UPCOMING_RAFFLES = statements.register("lucky_draw_get_next_upcoming_raffles", _UPCOMING_RAFFLES_QUERY + """
+     LIMIT :limit
+""")
 
 
 def get_upcoming_raffles(limit: int = None) -> list:
@@ -189,27 +603,26 @@ def get_upcoming_raffles(limit: int = None) -> list:
             ...
         ]
     """
-    query = """
-            SELECT title, description, prize, prize_picture_url, start_time, closing_time
-              FROM lucky_draw.raffle AS raffle
-             WHERE raffle.start_time > NOW()
-          ORDER BY start_time
-        """
-    if limit:
-        query += "LIMIT :limit"
+    statement = _GET_NEXT_UPCOMING_RAFFLES if limit else _GET_UPCOMING_RAFFLES
+    return _get_listing(("upcoming", limit), statement, {"limit": limit})
 
-    with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text(query), {"limit": limit})
 
-        return [dict(row) for row in result.fetchall()]
+_GET_ONGOING_RAFFLES = statements.register("lucky_draw_get_ongoing_raffles", """
+    SELECT raffle_id AS id, title, description, prize, prize_picture_url, start_time, closing_time
+      FROM lucky_draw.raffle_summary
+     WHERE start_time < NOW()
+       AND closing_time > NOW()
+""")
 
 
 def get_ongoing_raffles() -> list:
-    """Get a list of ongoing raffles.
+    """Get a list of ongoing raffles. Their no. of entries changes all the time, and is got separately
+    with ``get_entry_counts`` so that the list can be cached.
     Returns:
         A list of dictionaries with the following structure:
         [
             {
+                "id": <DB ID of the raffle>,
                 "title": <raffle title>,
                 "description": <raffle description>,
                 "prize": <prize for the raffle winner>
@@ -220,15 +633,128 @@ def get_ongoing_raffles() -> list:
             ...
         ]
     """
+    return _get_listing(("ongoing",), _GET_ONGOING_RAFFLES, {})
+
+
+_GET_ENTRY_COUNTS = statements.register("lucky_draw_get_entry_counts", """
+      SELECT raffle_id, SUM(entry_count) AS entry_count
+        FROM lucky_draw.raffle_entry_count
+       WHERE raffle_id = ANY(:raffle_ids)
+    GROUP BY raffle_id
+""")
+
+
+def get_entry_counts(raffle_ids: list) -> dict:
+    """Get the no. of entries in each of the given raffles so far, from their entry counters.
+    Meant for raffles which are open, as the counters of raffles whose entries are archived may be removed
+    by ``rebuild_entry_counts``, see ``count_raffle_applicants`` for those.
+    Args:
+        raffle_ids: the DB IDs of the raffles
+    Returns:
+        A dictionary of the no. of entries by raffle ID, without the raffles which have no entries.
+    """
+    if not raffle_ids:
+        return {}
+
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT title, description, prize, prize_picture_url, start_time, closing_time
-              FROM lucky_draw.raffle AS raffle
-             WHERE raffle.start_time < NOW()
-               AND raffle.closing_time > NOW()
-        """))
+        result = _GET_ENTRY_COUNTS.execute(connection, {"raffle_ids": list(raffle_ids)})
 
-        return [dict(row) for row in result.fetchall()]
+        return {row["raffle_id"]: row["entry_count"] for row in result if row["entry_count"]}
+
+
+_GET_RAFFLES_VERSION = statements.register("lucky_draw_get_raffles_version", """
+    SELECT GREATEST(
+               (SELECT MAX(modified) FROM lucky_draw.raffle),
+               (SELECT MAX(start_time) FROM lucky_draw.raffle WHERE start_time <= NOW()),
+               (SELECT MAX(closing_time) FROM lucky_draw.raffle WHERE closing_time <= NOW()),
+               (SELECT MAX(closing_time) FROM lucky_draw.raffle
+                 WHERE closing_time <= NOW() - make_interval(days => CAST(:days AS INT))
+               ) + make_interval(days => CAST(:days AS INT))
+           ) AS last_modified
+         , EXTRACT(EPOCH FROM LEAST(
+               (SELECT MIN(start_time) FROM lucky_draw.raffle WHERE start_time > NOW()),
+               (SELECT MIN(closing_time) FROM lucky_draw.raffle WHERE closing_time > NOW()),
+               (SELECT MIN(closing_time) FROM lucky_draw.raffle
+                 WHERE closing_time > NOW() - make_interval(days => CAST(:days AS INT))
+               ) + make_interval(days => CAST(:days AS INT))
+           ) - NOW()) AS seconds_to_next_change
+""")
+
+
+def get_raffles_version(days: int = None) -> dict:
+    """Get the data which the raffle listings depend on, without fetching them, so that clients which already
+    have a listing can be told it hasn't changed. Listings only change when a raffle is created, starts or closes,
+    or gets its result. The version is cached in ``listing_cache`` along with the listings.
+    Args:
+        days (optional): The listing is limited to raffles closed in the past ``days`` days, so it also
+                         changes when the earliest of them drops out.
+    Returns:
+        {
+            "last_modified": <the last time any of these happened, None if there are no raffles>,
+            "seconds_to_next_change": <no. of seconds till the next time a raffle starts or closes, if any>,
+        }
+    """
+    key = ("version", days)
+    version = listing_cache.get(key)
+    if version is not None:
+        return version
+
+    with db.engine.connect() as connection:
+        result = _GET_RAFFLES_VERSION.execute(connection, {"days": days})
+        version = _version_from_row(result.fetchone())
+
+    ttl = listing_cache.ttl
+    if version["seconds_to_next_change"] is not None:
+        ttl = min(ttl, version["seconds_to_next_change"])
+    listing_cache.set(key, version, ttl=ttl)
+    return version
+
+
+def _version_from_row(row) -> dict:
+    version = dict(row)
+    if version["seconds_to_next_change"] is not None:
+        version["seconds_to_next_change"] = float(version["seconds_to_next_change"])
+    return version
+
+
+_GET_SECONDS_TO_NEXT_CHANGE = statements.register("lucky_draw_get_seconds_to_next_change", """
+    SELECT EXTRACT(EPOCH FROM LEAST(
+               (SELECT MIN(start_time) FROM lucky_draw.raffle WHERE start_time > NOW()),
+               (SELECT MIN(closing_time) FROM lucky_draw.raffle WHERE closing_time > NOW()),
+               (SELECT MIN(closing_time) FROM lucky_draw.raffle
+                 WHERE closing_time > NOW() - make_interval(days => CAST(:days AS INT))
+               ) + make_interval(days => CAST(:days AS INT))
+           ) - NOW()) AS seconds_to_next_change
+""")
+
+
+def _get_listing(key: tuple, statement: statements.Statement, params: dict, days: int = None) -> list:
+    """Get a list of raffles from ``listing_cache``, running ``statement`` if it isn't cached.
+    Args:
+        key: the cache key of the listing
+        statement: the statement which returns the listing
+        params: the parameters of the statement
+        days (optional): The listing is limited to raffles closed in the past ``days`` days, so it also
+                         changes when the earliest of them drops out.
+    Returns:
+        A list of dictionaries of the rows returned by ``statement``.
+    """
+    raffles = listing_cache.get(key)
+    if raffles is not None:
+        return raffles
+
+    with db.engine.connect() as connection:
+        result = statement.execute(connection, params)
+        raffles = [dict(row) for row in result.fetchall()]
+
+        result = _GET_SECONDS_TO_NEXT_CHANGE.execute(connection, {"days": days})
+        seconds_to_next_change = result.fetchone()["seconds_to_next_change"]
+
+    ttl = listing_cache.ttl
+    if seconds_to_next_change is not None:
+        ttl = min(ttl, float(seconds_to_next_change))
+    listing_cache.set(key, raffles, ttl=ttl)
+    return raffles
 
 
 def draw_ticket(user_id: int) -> dict:
@@ -240,23 +766,113 @@ def draw_ticket(user_id: int) -> dict:
             "ticket_no": <ticket no.>,
             "valid_upto": <date and time till which the ticket is valid>,
         },
+    With ``WRITE_BATCHING_ENABLED``, the ticket is inserted along with those drawn by other threads
+    at the same time, see ``db.batching``.
     """
-    valid_upto = datetime.now() + timedelta(days=config.TICKET_VALIDITY)
+    if config.WRITE_BATCHING_ENABLED:
+        return _ticket_batcher.submit(user_id)
+
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            INSERT INTO lucky_draw.ticket (user_id, valid_upto)
-                 VALUES (:user_id, :valid_upto)
-              RETURNING ticket_no, valid_upto
-        """), {
-            "user_id": user_id,
-            "valid_upto": valid_upto,
-        })
+        return _insert_tickets(connection, [user_id])[0]
+
+
+_INSERT_TICKETS = statements.register("lucky_draw_insert_tickets", """
+    INSERT INTO lucky_draw.ticket (user_id, valid_upto)
+         SELECT user_id, :valid_upto
+           FROM unnest(CAST(:user_ids AS INT[])) AS user_ids (user_id)
+      RETURNING user_id, ticket_no, valid_upto
+""")
+
+
+def _insert_tickets(connection, user_ids: list) -> list:
+    """Insert a new ticket for each of the given user IDs, which may repeat, with a single statement.
+    Args:
+        connection: the connection to insert them with
+        user_ids: the DB IDs of the users
+    Returns:
+        A list of the ticket no. and validity of each ticket, see ``draw_ticket``.
+    """
+    result = _INSERT_TICKETS.execute(connection, {
+        "user_ids": list(user_ids),
+        "valid_upto": datetime.now(timezone.utc) + timedelta(days=config.TICKET_VALIDITY),
+    })
+
+    tickets = {}
+    for row in result:
+        tickets.setdefault(row["user_id"], []).append({"ticket_no": row["ticket_no"], "valid_upto": row["valid_upto"]})
+    return [tickets[user_id].pop() for user_id in user_ids]
+
+
+_ticket_batcher = WriteBatcher("draw_ticket", _insert_tickets, config.WRITE_BATCH_MAX_SIZE, config.WRITE_BATCH_MAX_DELAY_MS / 1000)
+
+
+_DRAW_TICKETS = statements.register("lucky_draw_draw_tickets", """
+    INSERT INTO lucky_draw.ticket (user_id, valid_upto)
+         SELECT "user".id, :valid_upto
+           FROM unnest(CAST(:user_ids AS INT[])) AS user_ids (user_id)
+           JOIN "user"
+             ON "user".id = user_ids.user_id
+     CROSS JOIN generate_series(1, :count)
+      RETURNING user_id, ticket_no, valid_upto
+""")
+
+
+def draw_tickets(user_ids: list, count: int = 1) -> Iterator[dict]:
+    """Insert ``count`` new tickets for each of the given users.
+    The tickets are inserted by multi-row INSERT statements of up to ``BULK_TICKET_BATCH_SIZE`` tickets,
+    each committed on its own, and yielded as soon as each statement returns. User IDs which don't
+    belong to a user are skipped.
+    Args:
+        user_ids: the DB IDs of the users.
+        count (optional): the no. of tickets to issue to each user.
+    Yields:
+        {
+            "user_id": <DB ID of the user>,
+            "ticket_no": <ticket no.>,
+            "valid_upto": <date and time till which the ticket is valid>,
+        }
+    """
+    valid_upto = datetime.now(timezone.utc) + timedelta(days=config.TICKET_VALIDITY)
+    for batch_user_ids, batch_count in _ticket_batches(user_ids, count):
+        with db.engine.connect() as connection:
+            result = _DRAW_TICKETS.execute(connection, {
+                "user_ids": batch_user_ids,
+                "count": batch_count,
+                "valid_upto": valid_upto,
+            })
+
+            for row in result:
+                yield dict(row)
+
+
+def _ticket_batches(user_ids: list, count: int):
+    """Split the issue of ``count`` tickets to each of ``user_ids`` into batches of at most
+    ``BULK_TICKET_BATCH_SIZE`` tickets.
+    Yields:
+        Tuples of the user IDs in a batch and the no. of tickets to issue to each of them.
+    """
+    batch_size = config.BULK_TICKET_BATCH_SIZE
+    if count >= batch_size:
+        for user_id in user_ids:
+            for issued in range(0, count, batch_size):
+                yield [user_id], min(batch_size, count - issued)
+    else:
+        users_per_batch = batch_size // count
+        for start in range(0, len(user_ids), users_per_batch):
+            yield user_ids[start:start + users_per_batch], count
 
-        return dict(result.fetchone())
+
+_GET_TICKETS_FOR_USER = statements.register("lucky_draw_get_tickets_for_user", """
+    SELECT ticket_no
+          , valid_upto
+          , redeemed_raffle_id IS NOT NULL AS redeemed
+      FROM lucky_draw.ticket
+     WHERE user_id = :user_id
+""")
 
 
 def get_tickets_for_user(user_id: int) -> list:
-    """Get list of tickets drawn by a given user.
+    """Get list of tickets drawn by a given user, except those in archived partitions.
     Args:
         user_id (int): The DB ID of a user.
     Returns:
@@ -271,17 +887,22 @@ def get_tickets_for_user(user_id: int) -> list:
         ]
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT ticket_no
-                  , valid_upto
-                  , ticket_no IN (SELECT ticket_no FROM lucky_draw.entry where user_id = :user_id) AS redeemed
-              FROM lucky_draw.ticket
-             WHERE user_id = :user_id
-        """), {"user_id": user_id})
+        result = _GET_TICKETS_FOR_USER.execute(connection, {"user_id": user_id})
 
         return [dict(row) for row in result.fetchall()]
 
 
+_GET_NEXT_VALID_TICKET_FOR_USER = statements.register("lucky_draw_get_next_valid_ticket_for_user", """
+      SELECT ticket_no
+        FROM lucky_draw.ticket
+       WHERE user_id = :user_id
+         AND valid_upto > NOW()
+         AND redeemed_raffle_id IS NULL
+    ORDER BY created
+       LIMIT 1
+""")
+
+
 def get_next_vaild_ticket_for_user(user_id: int) -> Optional[int]:
     """Get the earliest valid and non-redeemed ticket for the user.
     Args:
@@ -290,48 +911,191 @@ def get_next_vaild_ticket_for_user(user_id: int) -> Optional[int]:
         The ticket number of the earliest valid and non-redeemed ticket.
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT ticket_no
-              FROM lucky_draw.ticket
-             WHERE user_id = :user_id
-               AND  ticket_no NOT IN (SELECT ticket_no FROM lucky_draw.entry where user_id = :user_id)
-               AND valid_upto > NOW()
-          ORDER BY created
-             LIMIT 1
-        """), {"user_id": user_id})
+        result = _GET_NEXT_VALID_TICKET_FOR_USER.execute(connection, {"user_id": user_id})
 
         row = result.fetchone()
         return row["ticket_no"] if row else None
 
 
+_GET_RAFFLES_TO_COMPUTE_RESULTS = statements.register("lucky_draw_get_raffles_to_compute_results", """
+    SELECT id
+      FROM lucky_draw.raffle AS raffle
+     WHERE raffle.closing_time < NOW()
+       AND raffle.closing_time > NOW() - make_interval(hours => :no_of_hours)
+       AND NOT EXISTS (SELECT 1 FROM lucky_draw.result AS result WHERE result.raffle_id = raffle.id)
+""")
+
+
 def get_raffles_to_compute_results() -> list:
     """Get a list of raffle IDs whose results are to be coomputed.
     Returns:
         A list of raffle IDs.
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT id
-              FROM lucky_draw.raffle AS raffle
-             WHERE raffle.closing_time < NOW()
-               AND raffle.closing_time > NOW() - INTERVAL ':no_of_hours' HOUR
-        """), {"no_of_hours": config.TIME_TO_STOP_ACCEPTING_SUBMISSIONS})
+        result = _GET_RAFFLES_TO_COMPUTE_RESULTS.execute(connection, {"no_of_hours": config.TIME_TO_STOP_ACCEPTING_SUBMISSIONS})
 
         return [dict(row)["id"] for row in result.fetchall()]
 
 
+_GET_RAFFLES_AWAITING_CLOSING = statements.register("lucky_draw_get_raffles_awaiting_closing", """
+    SELECT id
+         , EXTRACT(EPOCH FROM closing_time - NOW()) AS seconds_to_close
+      FROM lucky_draw.raffle AS raffle
+     WHERE raffle.closing_time > NOW()
+       AND NOT EXISTS (SELECT 1 FROM lucky_draw.result AS result WHERE result.raffle_id = raffle.id)
+""")
+
+
+def get_raffles_awaiting_closing() -> list:
+    """Get the raffles which are yet to close and have no result.
+    Returns:
+        A list of dictionaries with the following structure:
+        [
+            {
+                "id": <DB ID of the raffle>,
+                "seconds_to_close": <no. of seconds from now, by the DB clock, till the raffle closes>,
+            },
+            ...
+        ]
+    """
+    with db.engine.connect() as connection:
+        result = _GET_RAFFLES_AWAITING_CLOSING.execute(connection)
+
+        return [{"id": row["id"], "seconds_to_close": float(row["seconds_to_close"])} for row in result.fetchall()]
+
+
+_SAVE_RAFFLE_RESULT = statements.register("lucky_draw_save_raffle_result", """
+    INSERT INTO lucky_draw.result (raffle_id, ticket_no, user_id)
+         VALUES (:raffle_id, :ticket_no, :user_id)
+""")
+
+
+_TOUCH_RAFFLE = statements.register("lucky_draw_touch_raffle", """
+    UPDATE lucky_draw.raffle
+       SET modified = NOW()
+     WHERE id = :raffle_id
+""")
+
+
 def save_raffle_results(raffle_id: int, ticket_no: int, user_id: int):
     """Save the results of a raffle.
     Args:
         raffle_id: The DB ID of the raffle
         ticket_no: The winning ticket no,
     """
-    with db.engine.connect() as connection:
-        connection.execute(sqlalchemy.text("""
-            INSERT INTO lucky_draw.result (raffle_id, ticket_no, user_id)
-                 VALUES (:raffle_id, :ticket_no, :user_id)
-        """), {
+    with db.engine.begin() as connection:
+        _SAVE_RAFFLE_RESULT.execute(connection, {
             "raffle_id": raffle_id,
             "ticket_no": ticket_no,
             "user_id": user_id,
         })
+        _TOUCH_RAFFLE.execute(connection, {"raffle_id": raffle_id})
+        _save_raffle_summary(connection, raffle_id)
+
+    listing_cache.clear()
+
+
+_LOCK_RAFFLE_RESULT = statements.register("lucky_draw_lock_raffle_result", """
+    SELECT pg_try_advisory_xact_lock(:namespace, :raffle_id) AS locked
+""")
+
+
+_DRAW_RAFFLE_WINNER = statements.register("lucky_draw_draw_raffle_winner", """
+    WITH winner AS (
+        SELECT ticket_no, user_id
+          FROM lucky_draw.entry
+         WHERE raffle_id = :raffle_id
+        OFFSET FLOOR(RANDOM() * (SELECT COUNT(*) FROM lucky_draw.entry WHERE raffle_id = :raffle_id))
+         LIMIT 1
+    ), new_result AS (
+        INSERT INTO lucky_draw.result (raffle_id, ticket_no, user_id)
+             SELECT :raffle_id, ticket_no, user_id
+               FROM winner
+        ON CONFLICT (raffle_id) DO NOTHING
+          RETURNING raffle_id, ticket_no, user_id
+    ), touched_raffle AS (
+        UPDATE lucky_draw.raffle
+           SET modified = NOW()
+         WHERE id IN (SELECT raffle_id FROM new_result)
+    )
+    SELECT ticket_no, user_id
+      FROM new_result
+""")
+
+
+def draw_raffle_winner(raffle_id: int) -> Optional[dict]:
+    """Pick a random entry of the raffle as its winner and save the result.
+    The winner is sampled uniformly inside the database and saved by the same statement,
+    so the entries of the raffle are never loaded into memory. The raffle is claimed with an
+    advisory lock first, so that concurrent workers never compute the same result.
+    Args:
+        raffle_id: The DB ID of the raffle
+    Returns:
+        None if the raffle has no entries, its result is already saved or is being computed
+        by another worker, else
+        {
+            "ticket_no": <winning ticket no.>,
+            "user_id": <DB ID of the winner>,
+        }
+    """
+    with db.engine.begin() as connection:
+        result = _LOCK_RAFFLE_RESULT.execute(connection, {"namespace": RESULT_LOCK_NAMESPACE, "raffle_id": raffle_id})
+        if not result.fetchone()["locked"]:
+            return None
+
+        result = _DRAW_RAFFLE_WINNER.execute(connection, {"raffle_id": raffle_id})
+        row = result.fetchone()
+        if row is not None:
+            _save_raffle_summary(connection, raffle_id)
+
+    if row is None:
+        return None
+    listing_cache.clear()
+    return dict(row)
+
+
+_SAVE_RAFFLE_SUMMARY = statements.register("lucky_draw_save_raffle_summary",
+                                           _SAVE_RAFFLE_SUMMARY_QUERY.format(where="WHERE raffle.id = :raffle_id"))
+
+
+def _save_raffle_summary(connection, raffle_id: int):
+    """Write the summary of a raffle, in the transaction in which it was created or its result saved."""
+    _SAVE_RAFFLE_SUMMARY.execute(connection, {"raffle_id": raffle_id})
+
+
+def rebuild_raffle_summary() -> int:
+    """Write the summaries of all the raffles again, to repair ones which have drifted from the raffles
+    and their results, e.g. after they were edited by hand. Results can't be saved while this runs.
+    The no. of entries recorded in the summary of a raffle with a result is kept as it is, since the entries
+    of the raffle may be archived: after ``archive_partitions``, the summaries of the archived raffles keep
+    their counts, and only the ones which got a result without a recorded count are counted again.
+    Returns:
+        The no. of summaries which were missing or out of date.
+    """
+    with db.engine.begin() as connection:
+        # Keeps the results, and with them the winners and entry counts, from changing under the rebuild
+        connection.execute(sqlalchemy.text("LOCK TABLE lucky_draw.result IN SHARE MODE"))
+        result = connection.execute(sqlalchemy.text(_SAVE_RAFFLE_SUMMARY_QUERY.format(where="WHERE TRUE")))
+        repaired = result.rowcount
+
+    listing_cache.clear()
+    return repaired
+
+
+def rebuild_entry_counts() -> int:
+    """Count the entries of every raffle again into its entry counter, e.g. after entries were copied in
+    directly. Counters of raffles without entries, e.g. because their entries are archived, are removed.
+    Raffles can't be entered while this runs.
+    Returns:
+        The no. of raffles with entries.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text("LOCK TABLE lucky_draw.entry IN SHARE MODE"))
+        connection.execute(sqlalchemy.text("DELETE FROM lucky_draw.raffle_entry_count"))
+        result = connection.execute(sqlalchemy.text("""
+            INSERT INTO lucky_draw.raffle_entry_count (raffle_id, shard, entry_count)
+                 SELECT raffle_id, 0, COUNT(*)
+                   FROM lucky_draw.entry
+               GROUP BY raffle_id
+        """))
+        return result.rowcount
@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta, timezone
+import logging
+import re
+from typing import List, Tuple
+import sqlalchemy
+
+import db
+import config
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Schema into which expired partitions are moved once detached
+ARCHIVE_SCHEMA = "lucky_draw_archive"
+
+# Names of the monthly partitions of lucky_draw.ticket, e.g. ticket_2026_10 for the tickets expiring in October 2026 (UTC),
+# and of the partitions of lucky_draw.entry, e.g. entry_1000_2000 for the entries of raffles 1000 to 1999
+_TICKET_PARTITION_NAME = re.compile(r"^ticket_(\d{4})_(\d{2})$")
+_ENTRY_PARTITION_NAME = re.compile(r"^entry_(\d+)_(\d+)$")
+
+
+def create_partitions() -> List[str]:
+    """Create the partitions of lucky_draw.ticket and lucky_draw.entry which are needed by the rows in their
+    default partitions, by the tickets issued and raffles created now, and ``TICKET_PARTITIONS_AHEAD``
+    and ``ENTRY_PARTITIONS_AHEAD`` more. The rows in the default partitions are moved into the new partitions.
+    Returns:
+        The names of the partitions created.
+    """
+    created = []
+    for start, end in _ticket_ranges_to_create():
+        name = "ticket_%04d_%02d" % (start.year, start.month)
+        _create_partition("ticket", "valid_upto", name, start, end)
+        created.append(name)
+
+    for start, end in _entry_ranges_to_create():
+        name = "entry_%d_%d" % (start, end)
+        _create_partition("entry", "raffle_id", name, start, end)
+        created.append(name)
+
+    return created
+
+
+def archive_partitions() -> List[str]:
+    """Detach the partitions of lucky_draw.ticket whose tickets expired more than ``TICKET_ARCHIVE_AFTER`` days ago, and
+    the partitions of lucky_draw.entry whose raffles all closed more than ``ENTRY_ARCHIVE_AFTER`` days ago, and move them
+    into the lucky_draw_archive schema. The no. of entries of archived raffles is kept in lucky_draw.raffle_summary.
+    Returns:
+        The names of the partitions archived.
+    """
+    archived = []
+    with db.engine.connect() as connection:
+        now = connection.execute(sqlalchemy.text("SELECT NOW()")).scalar()
+        max_raffle_id = connection.execute(sqlalchemy.text("SELECT COALESCE(MAX(id), 0) FROM lucky_draw.raffle")).scalar()
+
+        expired_tickets = []
+        if config.TICKET_ARCHIVE_AFTER is not None:
+            cutoff = now - timedelta(days=config.TICKET_ARCHIVE_AFTER)
+            expired_tickets = [name for name, (start, end) in _ticket_partitions(connection).items() if end <= cutoff]
+
+        expired_entries = []
+        if config.ENTRY_ARCHIVE_AFTER is not None:
+            cutoff = now - timedelta(days=config.ENTRY_ARCHIVE_AFTER)
+            for name, (start, end) in _entry_partitions(connection).items():
+                # New raffles get IDs above the existing ones, so no more entries go into ranges below them
+                if end > max_raffle_id + 1:
+                    continue
+                result = connection.execute(sqlalchemy.text("""
+                    SELECT NOT EXISTS (
+                        SELECT 1
+                          FROM lucky_draw.raffle
+                         WHERE id >= :start AND id < :end
+                           AND closing_time > :cutoff
+                    ) AS expired
+                """), {"start": start, "end": end, "cutoff": cutoff})
+                if result.fetchone()["expired"]:
+                    expired_entries.append(name)
+
+    for table, names in (("ticket", expired_tickets), ("entry", expired_entries)):
+        for name in names:
+            _archive_partition(table, name)
+            archived.append(name)
+
+    return archived
+
+
+def _ticket_ranges_to_create() -> List[Tuple[datetime, datetime]]:
+    """Get the months of the ticket partitions to create, as the UTC start of each month and of the next one."""
+    with db.engine.connect() as connection:
+        now = connection.execute(sqlalchemy.text("SELECT NOW()")).scalar()
+        result = connection.execute(sqlalchemy.text("""
+            SELECT DISTINCT date_trunc('month', valid_upto, 'UTC') AS month
+              FROM lucky_draw.ticket_default
+        """))
+        months = {row["month"].astimezone(timezone.utc) for row in result}
+        existing = set(start for start, _ in _ticket_partitions(connection).values())
+
+    month = _month_start(now)
+    last = _month_start(now + timedelta(days=config.TICKET_VALIDITY))
+    for _ in range(config.TICKET_PARTITIONS_AHEAD):
+        last = _next_month(last)
+    while month <= last:
+        months.add(month)
+        month = _next_month(month)
+
+    return [(month, _next_month(month)) for month in sorted(months - existing)]
+
+
+def _entry_ranges_to_create() -> List[Tuple[int, int]]:
+    """Get the ranges of raffle IDs of the entry partitions to create, as aligned ranges of ``ENTRY_PARTITION_SIZE``
+    IDs which don't overlap the existing partitions.
+    """
+    size = config.ENTRY_PARTITION_SIZE
+    with db.engine.connect() as connection:
+        max_raffle_id = connection.execute(sqlalchemy.text("SELECT COALESCE(MAX(id), 0) FROM lucky_draw.raffle")).scalar()
+        result = connection.execute(sqlalchemy.text("""
+            SELECT DISTINCT raffle_id / :size AS range_no
+              FROM lucky_draw.entry_default
+        """), {"size": size})
+        range_nos = {row["range_no"] for row in result}
+        existing = list(_entry_partitions(connection).values())
+
+    range_nos.update(range(max_raffle_id // size, max_raffle_id // size + config.ENTRY_PARTITIONS_AHEAD + 1))
+    ranges = [(range_no * size, (range_no + 1) * size) for range_no in sorted(range_nos)]
+    return [(start, end) for start, end in ranges
+            if not any(start < existing_end and existing_start < end for existing_start, existing_end in existing)]
+
+
+def _ticket_partitions(connection) -> dict:
+    """Get the start and end of the month of each partition of lucky_draw.ticket, by the name of the partition."""
+    partitions = {}
+    for name in _partition_names(connection, "ticket"):
+        match = _TICKET_PARTITION_NAME.match(name)
+        if match:
+            start = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+            partitions[name] = (start, _next_month(start))
+    return partitions
+
+
+def _entry_partitions(connection) -> dict:
+    """Get the range of raffle IDs of each partition of lucky_draw.entry, by the name of the partition."""
+    partitions = {}
+    for name in _partition_names(connection, "entry"):
+        match = _ENTRY_PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = (int(match.group(1)), int(match.group(2)))
+    return partitions
+
+
+def _partition_names(connection, table: str) -> List[str]:
+    result = connection.execute(sqlalchemy.text("""
+        SELECT partition.relname
+          FROM pg_inherits
+          JOIN pg_class AS partition
+            ON partition.oid = pg_inherits.inhrelid
+         WHERE pg_inherits.inhparent = CAST(:table AS REGCLASS)
+    """), {"table": "lucky_draw." + table})
+    return [row["relname"] for row in result]
+
+
+def _create_partition(table: str, column: str, name: str, start, end):
+    """Create a partition of a lucky_draw table for the values of ``column`` from ``start`` up to ``end``,
+    moving the rows in that range from the default partition into it. The default partition is locked
+    meanwhile, so that no rows are inserted into it in that range.
+    """
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text("LOCK TABLE lucky_draw.{table} IN SHARE UPDATE EXCLUSIVE MODE".format(table=table)))
+        connection.execute(sqlalchemy.text("LOCK TABLE lucky_draw.{table}_default IN ACCESS EXCLUSIVE MODE".format(table=table)))
+        connection.execute(sqlalchemy.text("""
+            CREATE TABLE lucky_draw.{name} (LIKE lucky_draw.{table})
+        """.format(name=name, table=table)))
+        result = connection.execute(sqlalchemy.text("""
+            WITH moved AS (
+                DELETE FROM lucky_draw.{table}_default
+                      WHERE {column} >= :start AND {column} < :end
+                  RETURNING *
+            )
+            INSERT INTO lucky_draw.{name}
+                 SELECT *
+                   FROM moved
+        """.format(name=name, table=table, column=column)), {"start": start, "end": end})
+        connection.execute(sqlalchemy.text("""
+            ALTER TABLE lucky_draw.{table} ATTACH PARTITION lucky_draw.{name} FOR VALUES FROM (:start) TO (:end)
+        """.format(name=name, table=table)), {"start": start, "end": end})
+
+    logger.info("Created partition lucky_draw.%s with %s rows from the default partition", name, result.rowcount)
+
+
+def _archive_partition(table: str, name: str):
+    """Detach a partition of a lucky_draw table and move it into the archive schema."""
+    with db.engine.begin() as connection:
+        connection.execute(sqlalchemy.text("""
+            ALTER TABLE lucky_draw.{table} DETACH PARTITION lucky_draw.{name}
+        """.format(table=table, name=name)))
+        connection.execute(sqlalchemy.text("""
+            ALTER TABLE lucky_draw.{name} SET SCHEMA {schema}
+        """.format(name=name, schema=ARCHIVE_SCHEMA)))
+
+    logger.info("Archived partition lucky_draw.%s into %s", name, ARCHIVE_SCHEMA)
+
+
+def _month_start(time: datetime) -> datetime:
+    time = time.astimezone(timezone.utc)
+    return datetime(time.year, time.month, 1, tzinfo=timezone.utc)
+
+
+def _next_month(month: datetime) -> datetime:
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
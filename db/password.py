@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import config
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def hash_password(password: str) -> str:
+    """Hash a password with bcrypt, with ``PASSWORD_HASH_ROUNDS`` as the cost factor.
+    The hash is computed on a pool of ``PASSWORD_HASHING_WORKERS`` threads, so that no more than that many
+    hashes are computed at a time by each process however many requests are waiting for one.
+    Args:
+        password: the password in plain text
+    Returns:
+        The bcrypt hash of the password, with its salt and cost factor.
+    """
+    return _get_executor().submit(_hash, password).result()
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password against its bcrypt hash, on the same pool of threads as ``hash_password``.
+    Hashes made by pgcrypto's ``CRYPT(password, gen_salt('bf'))`` are bcrypt hashes too and are verified as well.
+    Args:
+        password: the password in plain text
+        password_hash: the hash it is checked against
+    Returns:
+        True if the password matches the hash.
+    """
+    return _get_executor().submit(_verify, password, password_hash).result()
+
+
+async def hash_password_async(password: str) -> str:
+    """The asyncio counterpart of ``hash_password``."""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), _hash, password)
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    """The asyncio counterpart of ``verify_password``."""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), _verify, password, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Check if a hash was made with a cost factor other than ``PASSWORD_HASH_ROUNDS``, or by pgcrypto,
+    in which case it should be replaced the next time the password is known, i.e. on login.
+    """
+    try:
+        prefix, rounds, _ = password_hash.split("$")[1:]
+        return prefix != "2b" or int(rounds) != config.PASSWORD_HASH_ROUNDS
+    except ValueError:
+        return True
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=config.PASSWORD_HASH_ROUNDS)).decode("ascii")
+
+
+def _verify(password, password_hash):
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("ascii"))
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # The threads of the pool don't survive a fork, so each process starts its own
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=config.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing")
+            _executor_pid = os.getpid()
+        return _executor
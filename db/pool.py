@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """ A QueuePool which keeps track of how many connections have been checked out
+    and how long callers had to wait to get one.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        connection = super()._do_get()
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+        return connection
+
+    def stats(self) -> dict:
+        """ Get the usage statistics of the pool.
+        Returns:
+            Dictionary with the following structure:
+            {
+                "pool_size": <no. of connections kept open in the pool>,
+                "max_overflow": <no. of connections allowed above pool_size>,
+                "checked_in": <no. of idle connections in the pool>,
+                "checked_out": <no. of connections currently in use>,
+                "overflow": <no. of connections currently open above pool_size>,
+                "checkouts": <total no. of checkouts since the pool was created>,
+                "wait_time": <total seconds spent waiting for a connection>,
+                "max_wait_time": <longest wait for a connection in seconds>,
+            }
+        """
+        with self._stats_lock:
+            return {
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "wait_time": self.wait_time,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+def add_fork_protection(engine):
+    """ Make sure that a connection opened in one process is never used by another.
+    Pooled connections inherited across a fork() are discarded on checkout, without
+    closing them, so that the parent process can keep using its own connections.
+    See https://docs.sqlalchemy.org/en/13/core/pooling.html#using-connection-pools-with-multiprocessing
+    """
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        connection_record.info["pid"] = os.getpid()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pid = os.getpid()
+        if connection_record.info["pid"] != pid:
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                "Connection record belongs to pid %s, attempting to check out in pid %s" %
+                (connection_record.info["pid"], pid)
+            )
@@ -0,0 +1,153 @@
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+import psycopg2
+from sqlalchemy import event
+
+import config
+from db import statements
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Modules whose functions are reported as the source of a slow query
+_INTERNAL_MODULES = {"db", "db.pool", "db.slow_query", "db.statements"}
+
+# Statements which can be explained, the others (e.g. DDL, COPY or LISTEN) are only logged
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+# Statements which write or lock rows, which are only explained without being run again
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|FOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE))\b", re.IGNORECASE)
+
+# Parameters holding credentials, whose values are neither logged nor explained
+_SENSITIVE = re.compile(r"token|password|secret", re.IGNORECASE)
+
+_REDACTED = "<redacted>"
+
+_explain_queue = queue.Queue(maxsize=100)
+_explain_worker_pid = None
+_explain_worker_lock = threading.Lock()
+
+
+def add_slow_query_log(engine):
+    """ Log the statements of the given engine which take longer than ``SLOW_QUERY_THRESHOLD_MS``,
+    with the DB function which made them, their parameters and duration. A ``SLOW_QUERY_EXPLAIN_SAMPLE_RATE``
+    fraction of them is explained in a background thread and the plans are logged too, see ``explain``. The log is written to ``SLOW_QUERY_LOG_FILE``.
+    """
+    _add_file_handler()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.slow_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is None or not hasattr(context, "slow_query_start"):
+            return
+        duration_ms = (time.perf_counter() - context.slow_query_start) * 1000
+        if duration_ms < config.SLOW_QUERY_THRESHOLD_MS:
+            return
+
+        # Prepared statements are logged and explained as the queries they run
+        statement = statements.unprepared(statement)
+        caller = _caller()
+        logger.warning("Slow query in %s took %.1fms with parameters %r:\n%s",
+                       caller, duration_ms, redact(parameters), statement.strip())
+        if not executemany and statement.lstrip().upper().startswith(_EXPLAINABLE) \
+                and random.random() < config.SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+            _explain_later(engine, caller, statement, redact(parameters))
+
+
+def redact(parameters):
+    """ Replace the values of the parameters whose names contain "token", "password" or "secret". """
+    if isinstance(parameters, dict):
+        return {name: _REDACTED if _SENSITIVE.search(str(name)) else value for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], dict):
+        return [redact(p) for p in parameters]
+    return parameters
+
+
+def _explain_later(engine, caller, statement, parameters):
+    global _explain_worker_pid
+    with _explain_worker_lock:
+        # The worker thread doesn't survive a fork, so each process starts its own
+        if _explain_worker_pid != os.getpid():
+            _explain_worker_pid = os.getpid()
+            threading.Thread(target=_explain_worker, daemon=True).start()
+    try:
+        _explain_queue.put_nowait((engine, caller, statement, parameters))
+    except queue.Full:
+        logger.debug("Too many slow queries waiting to be explained, skipping one from %s", caller)
+
+
+def _explain_worker():
+    while True:
+        engine, caller, statement, parameters = _explain_queue.get()
+        try:
+            plan = explain(engine, statement, parameters)
+        except Exception as e:
+            logger.warning("Couldn't explain slow query in %s: %s", caller, str(e))
+            continue
+        logger.warning("Plan of slow query in %s:\n%s", caller, plan)
+
+
+def explain(engine, statement, parameters) -> str:
+    """ Run a read only statement with ``EXPLAIN (ANALYZE, BUFFERS)`` in a transaction which is rolled back.
+    Statements which write or lock rows are only planned with ``EXPLAIN``, as running them again would
+    take their locks against live traffic, use up sequence values or repeat their side effects.
+    Args:
+        engine: the engine to get a connection from
+        statement: the SQL statement as sent to the DB
+        parameters: the DB-API parameters of the statement
+    Returns:
+        The plan of the statement as text.
+    """
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Don't wait behind the locks held by the transaction of the slow query itself
+        cursor.execute("SET LOCAL lock_timeout = %s", (config.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+        cursor.execute("SET LOCAL statement_timeout = %s", (config.SLOW_QUERY_EXPLAIN_TIMEOUT_MS,))
+        options = "" if _WRITES.search(statement) else "(ANALYZE, BUFFERS) "
+        cursor.execute("EXPLAIN " + options + statement, parameters)
+        return "\n".join(row[0] for row in cursor.fetchall())
+    finally:
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            pass
+        connection.close()
+
+
+def _caller():
+    """ Get the name of the outermost function in the ``db`` package in the current stack,
+    i.e. the one called by the rest of the app which made the current query.
+    """
+    caller = "unknown"
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("db.") and module not in _INTERNAL_MODULES:
+            caller = "%s.%s" % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return caller
+
+
+def _add_file_handler():
+    if not config.SLOW_QUERY_LOG_FILE:
+        return
+    path = os.path.abspath(config.SLOW_QUERY_LOG_FILE)
+    for handler in logger.handlers:
+        if isinstance(handler, RotatingFileHandler) and handler.baseFilename == path:
+            return
+    handler = RotatingFileHandler(path, maxBytes=config.SLOW_QUERY_LOG_MAX_BYTES, backupCount=config.SLOW_QUERY_LOG_BACKUP_COUNT)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(process)d %(levelname)s %(message)s"))
+    logger.addHandler(handler)
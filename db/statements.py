@@ -0,0 +1,136 @@
+import re
+from typing import Tuple
+
+import sqlalchemy
+from sqlalchemy.pool import NullPool
+
+import config
+
+# Named parameters of a statement, as recognised by sqlalchemy.text: not those of ``::`` casts, nor ones
+# directly followed by a cast like ``:name::INT``, which have to be written as ``CAST(:name AS INT)``
+_BIND_PARAM = re.compile(r"(?<![:\w\x5c]):(\w+)(?!:)", re.UNICODE)
+
+# Statements which write, and have to be committed when they aren't run in a transaction. SQLAlchemy only
+# commits statements starting with INSERT, UPDATE or DELETE by itself, not ``EXECUTE``.
+_WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+_EXECUTE = re.compile(r"^\s*EXECUTE\s+(\w+)")
+
+# Key of the names of the statements prepared on a DB connection, in the info of its connection record,
+# which is cleared when the connection is replaced
+_PREPARED_KEY = "prepared_statements"
+
+_registry = {}
+
+
+class Statement:
+    """ A query registered under a unique name, run as a server side prepared statement so that Postgres
+    parses it once per DB connection, and plans it once per connection too unless its parameters call for
+    custom plans. It is prepared on each pooled connection the first time it is run on it.
+    Statements are created with ``register``.
+    Args:
+        name: the name of the statement, unique across the registry
+        sql: the query, with named parameters like those of ``sqlalchemy.text``
+    """
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.text = sqlalchemy.text(sql)
+
+        positional_sql, params = to_positional(sql)
+        self.prepare_sql = "PREPARE {name} AS {sql}".format(name=name, sql=positional_sql)
+        execute = "EXECUTE " + name
+        if params:
+            execute += "(" + ", ".join(":" + param for param in params) + ")"
+        self._execute = sqlalchemy.text(execute)
+        if _WRITE.search(sql):
+            self.text = self.text.execution_options(autocommit=True)
+            self._execute = self._execute.execution_options(autocommit=True)
+
+        # The query, and the EXECUTE of the prepared statement, as they are sent to psycopg2
+        self.unprepared_sql = _BIND_PARAM.sub(lambda match: "%({})s".format(match.group(1)), sql.replace("%", "%%"))
+        self.execute_sql = _BIND_PARAM.sub(lambda match: "%({})s".format(match.group(1)), execute)
+
+    def execute(self, connection, params: dict = None):
+        """ Run the statement, preparing it on the DB connection first if it hasn't been yet. The plain query is
+        run instead when ``PREPARED_STATEMENTS_ENABLED`` is off or connections aren't pooled, as a statement
+        prepared on a connection which is closed right after only costs an extra round trip.
+        Args:
+            connection: the SQLAlchemy connection to run the statement on
+            params (optional): the values of the parameters of the statement
+        Returns:
+            The ``ResultProxy`` of the statement.
+        """
+        if not config.PREPARED_STATEMENTS_ENABLED or isinstance(connection.engine.pool, NullPool):
+            return connection.execute(self.text, params or {})
+
+        prepared = connection.info.setdefault(_PREPARED_KEY, set())
+        if self.name not in prepared:
+            # Not through SQLAlchemy, so that the query isn't parsed for parameters nor counted as one
+            cursor = connection.connection.cursor()
+            try:
+                cursor.execute(self.prepare_sql)
+            finally:
+                cursor.close()
+            prepared.add(self.name)
+        return connection.execute(self._execute, params or {})
+
+
+def to_positional(sql: str) -> Tuple[str, tuple]:
+    """ Convert the named parameters of a query, as used with ``sqlalchemy.text``, to the ``$1`` style of
+    Postgres, as used by prepared statements and asyncpg. A parameter used more than once keeps its number.
+    Args:
+        sql: the query, with named parameters like ``:raffle_id``
+    Returns:
+        A tuple of the converted query and the names of its parameters, in the order of their numbers.
+    """
+    names = []
+
+    def replace(match):
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return "$%d" % (names.index(name) + 1)
+
+    return _BIND_PARAM.sub(replace, sql), tuple(names)
+
+
+def register(name: str, sql: str) -> Statement:
+    """ Add a query to the registry of prepared statements. Meant to be called once per query, or per variant
+    of a query, when a module is imported.
+    Args:
+        name: the name of the statement, e.g. ``lucky_draw_get_raffle``, which must be a valid SQL identifier
+              and unique across the registry
+        sql: the query, with named parameters like those of ``sqlalchemy.text``
+    Returns:
+        The ``Statement``.
+    """
+    if not re.match(r"^[a-z_][a-z0-9_]*$", name):
+        raise ValueError("Invalid statement name: %r" % name)
+    if name in _registry:
+        raise ValueError("A statement named %r is already registered" % name)
+    statement = Statement(name, sql)
+    _registry[name] = statement
+    return statement
+
+
+def get(name: str) -> Statement:
+    """ Get the statement registered under the given name. """
+    return _registry[name]
+
+
+def get_all() -> list:
+    """ Get all the registered statements, in the order they were registered. """
+    return list(_registry.values())
+
+
+def unprepared(statement: str) -> str:
+    """ Get the query run by an ``EXECUTE`` of a registered statement, with the same parameters, e.g. to log
+    or explain it. Other statements are returned as they are.
+    """
+    match = _EXECUTE.match(statement)
+    if match and match.group(1) in _registry:
+        return _registry[match.group(1)].unprepared_sql
+    return statement
+
@@ -0,0 +1,125 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from contextlib import contextmanager
+from unittest import mock
+
+import db
+from db.batching import WriteBatcher
+
+
+class FakeEngine:
+    """ Stands in for ``db.engine``, counting the transactions begun and committed. """
+
+    def __init__(self):
+        self.begun = 0
+        self.committed = 0
+
+    @contextmanager
+    def begin(self):
+        self.begun += 1
+        yield mock.sentinel.connection
+        self.committed += 1
+
+
+class WriteBatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = FakeEngine()
+        patcher = mock.patch.object(db, "engine", self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.batches = []
+
+    def write(self, connection, items):
+        """ Write the items as upper case, failing the batch if any of them is "bad". """
+        self.assertIs(connection, mock.sentinel.connection)
+        self.batches.append(list(items))
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item.upper() for item in items]
+
+    def submit_all(self, batcher, items):
+        """ Submit each item from a thread of its own, returning their results or errors in order. """
+        def submit(item):
+            try:
+                return batcher.submit(item)
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(len(items)) as executor:
+            return list(executor.map(submit, items))
+
+    def test_batch_is_written_once_full(self):
+        batcher = WriteBatcher("test", self.write, max_size=3, max_delay=10)
+        start = time.monotonic()
+        results = self.submit_all(batcher, ["a", "b", "c"])
+
+        self.assertEqual(results, ["A", "B", "C"])
+        self.assertEqual(len(self.batches), 1)
+        self.assertCountEqual(self.batches[0], ["a", "b", "c"])
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(self.engine.committed, 1)
+
+    def test_batch_is_written_after_delay(self):
+        batcher = WriteBatcher("test", self.write, max_size=100, max_delay=0.5)
+        start = time.monotonic()
+        results = self.submit_all(batcher, ["a", "b"])
+
+        self.assertEqual(results, ["A", "B"])
+        self.assertEqual(len(self.batches), 1)
+        self.assertCountEqual(self.batches[0], ["a", "b"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.5)
+
+    def test_failing_item_only_fails_its_caller(self):
+        batcher = WriteBatcher("test", self.write, max_size=4, max_delay=10)
+        results = self.submit_all(batcher, ["a", "bad", "c", "d"])
+
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual([results[0], results[2], results[3]], ["A", "C", "D"])
+        # The batch is split in halves until the bad item is written on its own
+        self.assertEqual(sorted(map(len, self.batches)), [1, 1, 2, 2, 4])
+        self.assertIn(["bad"], self.batches)
+        self.assertEqual(self.engine.committed, 2)
+
+    def test_timeout_cancels_queued_item(self):
+        writing = threading.Event()
+        release = threading.Event()
+
+        def write(connection, items):
+            self.batches.append(list(items))
+            if "slow" in items:
+                writing.set()
+                release.wait(10)
+            return [item.upper() for item in items]
+
+        batcher = WriteBatcher("test", write, max_size=1, max_delay=0, timeout=0.2)
+        with ThreadPoolExecutor(1) as executor:
+            slow = executor.submit(batcher.submit, "slow")
+            self.assertTrue(writing.wait(5))
+            with self.assertRaises(TimeoutError), self.assertLogs("db.batching", "WARNING"):
+                batcher.submit("queued")
+            release.set()
+            # The slow item was already being written, so it may still be written after its caller gave up
+            with self.assertRaises(TimeoutError):
+                slow.result()
+
+        self.assertEqual(batcher.submit("next"), "NEXT")
+        self.assertEqual(self.batches, [["slow"], ["next"]])
+
+    def test_thread_survives_wrong_no_of_results(self):
+        def write(connection, items):
+            return [] if "short" in items else [item.upper() for item in items]
+
+        batcher = WriteBatcher("test", write, max_size=10, max_delay=0)
+        with self.assertRaises(RuntimeError):
+            batcher.submit("short")
+        self.assertEqual(batcher.submit("a"), "A")
+
+    def test_thread_survives_unexpected_error(self):
+        batcher = WriteBatcher("test", self.write, max_size=10, max_delay=0)
+        with mock.patch("db.batching.WRITE_BATCH_SIZE.observe", side_effect=ZeroDivisionError):
+            with self.assertRaises(ZeroDivisionError), self.assertLogs("db.batching", "ERROR"):
+                batcher.submit("a")
+        self.assertEqual(batcher.submit("b"), "B")
@@ -0,0 +1,90 @@
+import re
+import unittest
+
+import db.lucky_draw
+import db.user
+from db import statements
+from db.aio import bind
+from db.statements import Statement, to_positional
+
+
+class ToPositionalTestCase(unittest.TestCase):
+
+    def test_numbers_parameters_in_order(self):
+        self.assertEqual(to_positional("SELECT * FROM t WHERE a = :a AND b = :b"),
+                         ("SELECT * FROM t WHERE a = $1 AND b = $2", ("a", "b")))
+
+    def test_repeated_parameter_keeps_its_number(self):
+        self.assertEqual(to_positional("SELECT :b, :a, :b, :a_b"), ("SELECT $1, $2, $1, $3", ("b", "a", "a_b")))
+
+    def test_ignores_casts(self):
+        self.assertEqual(to_positional("SELECT x::INT, CAST(:a AS INT[]), y::TEXT = :b"),
+                         ("SELECT x::INT, CAST($1 AS INT[]), y::TEXT = $2", ("a", "b")))
+
+    def test_parameter_followed_by_cast_is_not_a_parameter(self):
+        # Like sqlalchemy.text, which sends it as it is
+        self.assertEqual(to_positional("SELECT :a::INT"), ("SELECT :a::INT", ()))
+
+    def test_ignores_escaped_colons_and_timestamps(self):
+        self.assertEqual(to_positional(r"SELECT '10:30', '\:a', :a"), (r"SELECT '10:30', '\:a', $1", ("a",)))
+
+    def test_keeps_percent_literals(self):
+        self.assertEqual(to_positional("SELECT mod(:a, 2), '100%' LIKE :b"), ("SELECT mod($1, 2), '100%' LIKE $2", ("a", "b")))
+
+
+class StatementTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.statement = Statement("test_statement", """
+            SELECT id, '50%' AS discount
+              FROM t
+             WHERE x::TEXT = CAST(:a AS TEXT) AND y = :b OR z = :a
+        """)
+
+    def test_prepare_sql(self):
+        self.assertEqual(self.statement.prepare_sql.split(), """
+            PREPARE test_statement AS
+            SELECT id, '50%' AS discount
+              FROM t
+             WHERE x::TEXT = CAST($1 AS TEXT) AND y = $2 OR z = $1
+        """.split())
+
+    def test_execute_sql(self):
+        self.assertEqual(self.statement.execute_sql, "EXECUTE test_statement(%(a)s, %(b)s)")
+
+    def test_execute_sql_without_parameters(self):
+        self.assertEqual(Statement("test_no_params", "SELECT 1").execute_sql, "EXECUTE test_no_params")
+
+    def test_unprepared_sql(self):
+        # As sent to psycopg2, which needs % to be doubled
+        self.assertEqual(self.statement.unprepared_sql.split(), """
+            SELECT id, '50%%' AS discount
+              FROM t
+             WHERE x::TEXT = CAST(%(a)s AS TEXT) AND y = %(b)s OR z = %(a)s
+        """.split())
+
+    def test_unprepared_gets_query_of_execute(self):
+        self.assertEqual(statements.unprepared(db.user._GET.execute_sql), db.user._GET.unprepared_sql)
+        self.assertEqual(statements.unprepared("SELECT 1"), "SELECT 1")
+
+    def test_register_rejects_duplicate_and_invalid_names(self):
+        with self.assertRaises(ValueError):
+            statements.register("user_get", "SELECT 1")
+        with self.assertRaises(ValueError):
+            statements.register("user get; DROP", "SELECT 1")
+
+
+class BindTestCase(unittest.TestCase):
+
+    def test_bind(self):
+        self.assertEqual(bind("SELECT :b, :a::TEXT, CAST(:a AS INT), '5%', :b", {"a": 1, "b": 2, "unused": 3}),
+                         ("SELECT $1, :a::TEXT, CAST($2 AS INT), '5%', $1", 2, 1))
+
+    def test_bind_converts_registered_statements_like_prepare(self):
+        for statement in statements.get_all():
+            with self.subTest(statement=statement.name):
+                query, names = to_positional(statement.sql)
+                self.assertEqual(bind(statement.sql, {name: name for name in names}), (query,) + names)
+                self.assertEqual(statement.prepare_sql, "PREPARE %s AS %s" % (statement.name, query))
+                # No named parameter is left behind, e.g. one followed by a cast
+                self.assertIsNone(re.search(r"(?<![:\w]):\w", query), query)
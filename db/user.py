@@ -1,17 +1,105 @@
+import json
 import logging
+import os
+import random
+import select
+import threading
+import time
 from typing import Optional
-import sqlalchemy
 import uuid
 
+import psycopg2
+
 import db
+import config
+from db import statements
+from db.cache import TTLCache
+from db.password import hash_password, needs_rehash, verify_password
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Users looked up by their authorization token. The entry of a token is removed when it
+# is rotated or its user is deleted, in every process, see listen_for_invalidations.
+token_cache = TTLCache(maxsize=config.AUTH_TOKEN_CACHE_SIZE, ttl=config.AUTH_TOKEN_CACHE_TTL)
+
+# Users of logged in sessions looked up by their ID, see webserver.login.load_user. The entry of a user is
+# removed when they log out, their token is rotated or they are deleted, in every process for the latter two.
+user_cache = TTLCache(maxsize=config.SESSION_USER_CACHE_SIZE, ttl=config.SESSION_USER_CACHE_TTL)
+
+# Channel on which the ID and old authorization token of a user are sent with NOTIFY when the token is rotated
+# or the user is deleted, so that every process evicts them from its caches
+USER_INVALIDATED_CHANNEL = "user_invalidated"
+
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+_NOTIFY_USER_INVALIDATED = statements.register("user_notify_invalidated", """
+    SELECT pg_notify(:channel, :payload)
+""")
+
+
+def invalidation_params(id: int, auth_token: str) -> dict:
+    """Get the parameters of the NOTIFY sent on ``USER_INVALIDATED_CHANNEL`` when a user's token is rotated
+    or the user is deleted."""
+    return {"channel": USER_INVALIDATED_CHANNEL, "payload": json.dumps({"id": id, "auth_token": auth_token})}
+
+
+def listen_for_invalidations():
+    """Start a thread evicting the users and tokens sent on ``USER_INVALIDATED_CHANNEL`` by any process from
+    ``token_cache`` and ``user_cache``, unless one is already running in this process. Meant to be called before
+    the caches are read. The caches are emptied whenever the thread (re)connects, as it may have missed evictions.
+    """
+    global _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        # The thread doesn't survive a fork, so each process starts its own
+        if _listener_pid != os.getpid():
+            _listener_pid = os.getpid()
+            threading.Thread(target=_listen, name="user-invalidation-listener", daemon=True).start()
+
+
+def _listen():
+    while True:
+        connection = None
+        try:
+            connection = psycopg2.connect(config.SQLALCHEMY_DATABASE_URI)
+            connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with connection.cursor() as cursor:
+                cursor.execute("LISTEN %s" % USER_INVALIDATED_CHANNEL)
+            token_cache.clear()
+            user_cache.clear()
+
+            while True:
+                if select.select([connection], [], [], 60) == ([], [], []):
+                    continue
+                connection.poll()
+                for notify in connection.notifies:
+                    invalidated = json.loads(notify.payload)
+                    token_cache.delete(invalidated["auth_token"])
+                    user_cache.delete(invalidated["id"])
+                connection.notifies.clear()
+        except Exception as e:
+            logger.warning("Lost the connection used to listen for user invalidations, retrying: %s", str(e))
+            if connection is not None:
+                try:
+                    connection.close()
+                except psycopg2.Error:
+                    pass
+            time.sleep(2)
+
+
+_CREATE = statements.register("user_create", """
+    INSERT INTO "user" (name, email_id, password, auth_token)
+         VALUES (:name, :email_id, :password_hash, :token)
+      RETURNING id
+""")
+
 
 def create(name: str, email_id: str, password: str) -> int:
-    """Create a new user.
+    """Create a new user. The password is hashed with ``db.password.hash_password``.
     Args:
         name : the name of the user
         email_id: the email ID of the user
@@ -19,20 +107,24 @@ def create(name: str, email_id: str, password: str) -> int:
     Returns:
         ID of newly created user.
     """
+    password_hash = hash_password(password)
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            INSERT INTO "user" (name, email_id, password, auth_token)
-                 VALUES (:name, :email_id, CRYPT(:password, gen_salt('bf')), :token)
-              RETURNING id
-        """), {
+        result = _CREATE.execute(connection, {
             "name": name,
             "email_id": email_id,
-            "password":  password,
+            "password_hash":  password_hash,
             "token": str(uuid.uuid4()),
         })
         return result.fetchone()["id"]
 
 
+_GET = statements.register("user_get", """
+    SELECT id, name, email_id, auth_token
+      FROM "user"
+     WHERE id = :id
+""")
+
+
 def get(id: int) -> Optional[dict]:
     """Get user with a specified ID.
     Args:
@@ -47,17 +139,22 @@ def get(id: int) -> Optional[dict]:
         }
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT id, name, email_id, auth_token
-              FROM "user"
-             WHERE id = :id
-        """), {"id": id})
+        result = _GET.execute(connection, {"id": id})
         row = result.fetchone()
         return dict(row) if row else None
 
 
+_GET_BY_EMAIL_ID = statements.register("user_get_by_email_id", """
+    SELECT id, name, email_id, auth_token, password
+      FROM "user"
+     WHERE email_id = :email_id
+""")
+
+
 def get_by_email_id_and_password(email_id: str, password: str) -> Optional[dict]:
     """Get user with a specified email ID amd password.
+    The password is verified with ``db.password.verify_password``. If its hash was made by pgcrypto or with
+    another cost factor than ``PASSWORD_HASH_ROUNDS``, it is replaced with a new hash.
     Args:
         email_id: the email ID of the user
         password: The password for the user.
@@ -71,17 +168,45 @@ def get_by_email_id_and_password(email_id: str, password: str) -> Optional[dict]
         }
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT id, name, email_id, auth_token
-              FROM "user"
-             WHERE email_id = :email_id
-               AND password = CRYPT(:password, password);
-        """), {
+        result = _GET_BY_EMAIL_ID.execute(connection, {
             "email_id": email_id,
-            "password": password
         })
         row = result.fetchone()
-        return dict(row) if row else None
+
+    if row is None or not verify_password(password, row["password"]):
+        return None
+
+    user = dict(row)
+    password_hash = user.pop("password")
+    if needs_rehash(password_hash):
+        _rehash_password(user["id"], password, password_hash)
+    return user
+
+
+_REHASH_PASSWORD = statements.register("user_rehash_password", """
+    UPDATE "user"
+       SET password = :password_hash
+     WHERE id = :id
+       AND password = :old_password_hash
+""")
+
+
+def _rehash_password(id: int, password: str, old_password_hash: str):
+    """Replace the password hash of a user, unless the password was changed in the meantime."""
+    password_hash = hash_password(password)
+    with db.engine.connect() as connection:
+        _REHASH_PASSWORD.execute(connection, {
+            "id": id,
+            "password_hash": password_hash,
+            "old_password_hash": old_password_hash,
+        })
+
+
+_GET_BY_TOKEN = statements.register("user_get_by_token", """
+    SELECT id, name, email_id, auth_token
+      FROM "user"
+     WHERE auth_token = :auth_token
+""")
 
 
 def get_by_token(auth_token: str) -> Optional[dict]:
@@ -99,12 +224,88 @@ def get_by_token(auth_token: str) -> Optional[dict]:
         }
     """
     with db.engine.connect() as connection:
-        result = connection.execute(sqlalchemy.text("""
-            SELECT id, name, email_id, auth_token
-              FROM "user"
-             WHERE auth_token = :auth_token
-        """), {
+        result = _GET_BY_TOKEN.execute(connection, {
             "auth_token": auth_token,
         })
         row = result.fetchone()
         return dict(row) if row else None
+
+
+_ROTATE_AUTH_TOKEN = statements.register("user_rotate_auth_token", """
+       UPDATE "user"
+          SET auth_token = :token
+         FROM (SELECT id, auth_token FROM "user" WHERE id = :id FOR UPDATE) AS old
+        WHERE "user".id = old.id
+    RETURNING old.auth_token AS old_token, "user".auth_token AS new_token
+""")
+
+
+def rotate_auth_token(id: int) -> Optional[str]:
+    """Replace the authorization token of a user with a new one. The old token is evicted from the caches
+    of every process, see ``listen_for_invalidations``.
+    Args:
+        id (int): The DB ID of a user.
+    Returns:
+        The new authorization token, or None if the user doesn't exist.
+    """
+    with db.engine.begin() as connection:
+        result = _ROTATE_AUTH_TOKEN.execute(connection, {
+            "id": id,
+            "token": str(uuid.uuid4()),
+        })
+        row = result.fetchone()
+        if row is not None:
+            _NOTIFY_USER_INVALIDATED.execute(connection, invalidation_params(id, row["old_token"]))
+
+    if row is None:
+        return None
+    token_cache.delete(row["old_token"])
+    user_cache.delete(id)
+    return row["new_token"]
+
+
+_DELETE = statements.register("user_delete", """
+    WITH won_raffle AS (
+        UPDATE lucky_draw.raffle
+           SET modified = NOW()
+         WHERE id IN (SELECT raffle_id FROM lucky_draw.result WHERE user_id = :id)
+    ), entered_raffle_summary AS (
+        UPDATE lucky_draw.raffle_summary
+           SET winner_user_id = CASE WHEN winner_user_id = :id THEN NULL ELSE winner_user_id END
+             , winner_name = CASE WHEN winner_user_id = :id THEN NULL ELSE winner_name END
+             , winner_email_id = CASE WHEN winner_user_id = :id THEN NULL ELSE winner_email_id END
+             , winner_ticket_no = CASE WHEN winner_user_id = :id THEN NULL ELSE winner_ticket_no END
+             , entry_count = CASE WHEN winner_user_id = :id THEN NULL ELSE entry_count - 1 END
+         WHERE raffle_id IN (SELECT raffle_id FROM lucky_draw.entry WHERE user_id = :id)
+    ), entry_counter AS (
+        INSERT INTO lucky_draw.raffle_entry_count AS counter (raffle_id, shard, entry_count)
+             SELECT raffle_id, :shard, -1
+               FROM lucky_draw.entry
+              WHERE user_id = :id
+           ORDER BY raffle_id
+        ON CONFLICT (raffle_id, shard)
+          DO UPDATE SET entry_count = counter.entry_count + EXCLUDED.entry_count
+    )
+    DELETE FROM "user"
+          WHERE id = :id
+      RETURNING auth_token
+""")
+
+
+def delete(id: int):
+    """Delete a user along with their tickets and raffle entries. The results of the raffles they won
+    are deleted too, so those raffles are marked as modified, and the summaries and entry counters
+    of the raffles they entered are updated. The user and their token are evicted from the caches
+    of every process, see ``listen_for_invalidations``.
+    Args:
+        id (int): The DB ID of a user.
+    """
+    with db.engine.begin() as connection:
+        result = _DELETE.execute(connection, {"id": id, "shard": random.randrange(config.ENTRY_COUNTER_SHARDS)})
+        row = result.fetchone()
+        if row is not None:
+            _NOTIFY_USER_INVALIDATED.execute(connection, invalidation_params(id, row["auth_token"]))
+
+    if row is not None:
+        token_cache.delete(row["auth_token"])
+    user_cache.delete(id)
@@ -7,10 +7,16 @@ function setup_cron {
     echo "Adding cron entry..."
     crontab -l -u bingo > results-crontab
     echo "* * * * * cd '$PWD' && source bingo/bin/activate && /usr/bin/python3 compute_results.py >> >/dev/null 2>&1" >> results-crontab
+    echo "0 3 * * * cd '$PWD' && source bingo/bin/activate && /usr/bin/python3 manage.py maintain_partitions >/dev/null 2>&1" >> results-crontab
     crontab -u bingo results-crontab
     rm results-crontab
 }
 
+function run_scheduler {
+    echo "Starting result scheduler..."
+    python3 manage.py run_scheduler "$@"
+}
+
 function init_db {
     echo "Initalizing DB..."
     python3 manage.py init_db "$@"
@@ -21,7 +27,7 @@ function run_prod {
     npm run build:prod
 
     echo "Starting Flask server..."
-    python3 manage.py run_server  "$@"
+    python3 manage.py run_production_server  "$@"
 }
 
 function run_dev {
@@ -33,6 +39,8 @@ function run_dev {
 
 if [[ "$1" == "cron" ]]; then
     setup_cron
+elif [[ "$1" == "scheduler" ]]; then shift
+    run_scheduler "$@"
 elif [[ "$1" == "init_db" ]]; then shift
     init_db "$@"
 elif [[ "$1" == "-d" ]]; then
@@ -12,6 +12,13 @@ def cli():
 
 ADMIN_SQL_DIR = os.path.join(os.path.dirname(
     os.path.realpath(__file__)), 'admin', 'sql')
+MIGRATIONS_DIR = os.path.join(ADMIN_SQL_DIR, 'migrations')
+
+
+def get_migrations():
+    """ Get the versions and paths of the migrations, in the order they are to be applied. """
+    return [(os.path.splitext(name)[0], os.path.join(MIGRATIONS_DIR, name))
+            for name in sorted(os.listdir(MIGRATIONS_DIR)) if name.endswith('.sql')]
 
 
 @cli.command(name="run_server")
@@ -33,6 +40,186 @@ def runserver(host, port, debug=False):
     )
 
 
+@cli.command(name="run_production_server")
+@click.option("--host", "-h", default="0.0.0.0", show_default=True)
+@click.option("--port", "-p", default=8080, show_default=True)
+@click.option("--workers", "-w", type=int, help="No. of worker processes. Defaults to SERVER_WORKERS from the config.")
+@click.option("--threads", "-t", type=int, help="No. of threads of each worker. Defaults to SERVER_THREADS from the config.")
+@click.option("--metrics-port", type=int,
+              help="First port the workers serve their Prometheus metrics on. Defaults to SERVER_METRICS_PORT from the config.")
+def run_production_server(host, port, workers, threads, metrics_port):
+    """Runs Flask server with multiple worker processes. Send HUP to reload the workers and TERM to drain and stop."""
+    from webserver.production import ProductionServer
+
+    ProductionServer(host, port, workers=workers, threads=threads, metrics_port=metrics_port).run()
+
+
+@cli.command(name="run_async_server")
+@click.option("--host", "-h", default="0.0.0.0", show_default=True)
+@click.option("--port", "-p", default=8080, show_default=True)
+@click.option("--workers", "-w", default=1, show_default=True, help="No. of worker processes, each running an event loop.")
+def run_async_server(host, port, workers):
+    """Runs the lucky draw API on asyncio with Quart and Hypercorn."""
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    config = Config()
+    config.application_path = "webserver.aio:create_app()"
+    config.bind = ["%s:%s" % (host, port)]
+    config.workers = workers
+    config.accesslog = "-"
+    run(config)
+
+
+@cli.command(name="run_scheduler")
+@click.option("--workers", "-w", type=int, help="No. of raffles whose results are computed concurrently.")
+@click.option("--poll-interval", type=float, help="Seconds between reloads of the raffles from the DB.")
+@click.option("--metrics-port", type=int, help="Port to serve the Prometheus metrics of the scheduler on.")
+def run_scheduler(workers, poll_interval, metrics_port):
+    """Computes the result of each raffle as soon as it closes."""
+    import logging
+    import metrics
+    from result_scheduler import ResultScheduler
+
+    logging.basicConfig()
+    if metrics_port:
+        metrics.serve(metrics_port)
+    ResultScheduler(workers=workers, poll_interval=poll_interval).run()
+
+
+@cli.command(name="issue_tickets")
+@click.option("--user-id", "-u", "user_ids", type=int, multiple=True, help="DB ID of a user to issue tickets to.")
+@click.option("--users-file", type=click.File(), help="File with the DB ID of a user on each line.")
+@click.option("--count", "-c", default=1, show_default=True, type=click.IntRange(min=1),
+              help="No. of tickets to issue to each user.")
+def issue_tickets(user_ids, users_file, count):
+    """Issues tickets to many users at once, printing the user ID, ticket no.
+    and validity of each new ticket as CSV."""
+    import config
+    import db.lucky_draw as db_lucky_draw
+
+    user_ids = list(user_ids)
+    if users_file:
+        user_ids += [int(line) for line in users_file if line.strip()]
+    if not user_ids:
+        raise click.UsageError("Specify at least one user with --user-id or --users-file.")
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    for ticket in db_lucky_draw.draw_tickets(user_ids=user_ids, count=count):
+        click.echo("{user_id},{ticket_no},{valid_upto}".format(**ticket))
+
+
+@cli.command(name="rebuild_raffle_summary")
+def rebuild_raffle_summary():
+    """Writes the summaries of all the raffles again from the raffles and their results, repairing any which are out of date."""
+    import config
+    import db.lucky_draw as db_lucky_draw
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    print("PG: Rebuilding raffle summaries...")
+    repaired = db_lucky_draw.rebuild_raffle_summary()
+    print("PG: Repaired %s raffle summaries." % repaired)
+
+
+@cli.command(name="rebuild_entry_counts")
+def rebuild_entry_counts():
+    """Counts the entries of all the raffles again into their entry counters, repairing any which are out of date."""
+    import config
+    import db.lucky_draw as db_lucky_draw
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    print("PG: Rebuilding entry counters...")
+    counted = db_lucky_draw.rebuild_entry_counts()
+    print("PG: Counted the entries of %s raffles." % counted)
+
+
+@cli.command(name="maintain_partitions")
+@click.option("--no-archive", is_flag=True, help="Only create partitions, without archiving the expired ones.")
+def maintain_partitions(no_archive):
+    """Creates the ticket and entry partitions needed in the near future and archives the expired ones.
+    Should be run daily, e.g. by cron."""
+    import config
+    import db.partitions as db_partitions
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    print("PG: Creating partitions...")
+    for name in db_partitions.create_partitions():
+        print("PG: Created partition %s" % name)
+
+    if not no_archive:
+        print("PG: Archiving expired partitions...")
+        for name in db_partitions.archive_partitions():
+            print("PG: Archived partition %s into %s" % (name, db_partitions.ARCHIVE_SCHEMA))
+
+    print("Done!")
+
+
+@cli.command(name="seed")
+@click.option("--users", default=100000, show_default=True, help="No. of users to add.")
+@click.option("--tickets-per-user", default=10.0, show_default=True, help="Average no. of tickets drawn by each user.")
+@click.option("--raffles", default=10000, show_default=True, help="No. of raffles to add.")
+@click.option("--entries-per-raffle", default=100, show_default=True, help="Average no. of entries in each raffle.")
+@click.option("--skew", default=1.0, show_default=True, help="How much some users are more active than others, 0 for none.")
+@click.option("--random-seed", type=int, help="Seed of the random data, to get the same data every time.")
+def seed(users, tickets_per_user, raffles, entries_per_raffle, skew, random_seed):
+    """Bulk loads synthetic data into the database, for benchmarks."""
+    import config
+    import seed as seeder
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    counts = seeder.seed(users=users, tickets_per_user=tickets_per_user, raffles=raffles,
+                         entries_per_raffle=entries_per_raffle, skew=skew, random_seed=random_seed)
+    for table, count in counts.items():
+        print("PG: Added %s rows to %s" % (count, table))
+
+
+@cli.command(name="benchmark")
+@click.option("--requests", "-n", default=200, show_default=True, help="No. of requests to make to each endpoint.")
+@click.option("--concurrency", "-c", default=8, show_default=True, help="No. of requests in flight at a time.")
+@click.option("--route", "-r", "routes", multiple=True, help="Name of an endpoint to benchmark, e.g. lucky_draw.get_raffle. All by default.")
+@click.option("--output", "-o", default="benchmark.json", show_default=True, help="File to write the results to.")
+@click.option("--compare", type=click.File(), help="Results of an earlier run to check for regressions.")
+@click.option("--tolerance", default=0.1, show_default=True, help="Fraction by which a metric can get worse before it's a regression.")
+def benchmark(requests, concurrency, routes, output, compare, tolerance):
+    """Benchmarks the API endpoints and the result computation against the configured database."""
+    import json
+    import benchmark as bench
+
+    results = bench.run_benchmark(requests_per_route=requests, concurrency=concurrency, routes=list(routes))
+    bench.write_results(results, output)
+
+    print("%-40s %8s %9s %9s %9s %8s" % ("endpoint", "req/s", "p50 (ms)", "p95 (ms)", "p99 (ms)", "queries"))
+    for endpoint, route in sorted(results["routes"].items()):
+        print("%-40s %8.1f %9.2f %9.2f %9.2f %8.2f" % (endpoint, route["requests_per_second"], route["p50"] * 1000,
+                                                      route["p95"] * 1000, route["p99"] * 1000, route["queries_per_request"]))
+    print("Result computation: %(raffles)s raffles in %(duration).3fs" % results["result_computation"])
+
+    if compare:
+        regressions = bench.compare_results(json.load(compare), results, tolerance=tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+@cli.command(name="benchmark_statements")
+@click.option("--executions", "-n", default=500, show_default=True, help="No. of times to run each statement each way.")
+def benchmark_statements(executions):
+    """Compares running the read only queries of the db package as prepared statements and as they are."""
+    import config
+    import benchmark as bench
+
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    results = bench.run_statement_benchmark(executions=executions)
+
+    print("%-45s %10s %10s %15s %15s" % ("statement", "plain (ms)", "prep. (ms)", "plain plan (ms)", "prep. plan (ms)"))
+    for name, result in sorted(results.items()):
+        print("%-45s %10.3f %10.3f %15.3f %15.3f" % (name, result["unprepared"] * 1000, result["prepared"] * 1000,
+                                                     result["unprepared_planning"] * 1000, result["prepared_planning"] * 1000))
+    print("Total planning time saved per run of each statement: %.3fms" % (
+        sum(result["unprepared_planning"] - result["prepared_planning"] for result in results.values()) * 1000))
+
+
 @cli.command(name="init_db")
 @click.option("--force", "-f", is_flag=True, help="Drop existing database and user.")
 @click.option("--create-db", is_flag=True, help="Create the database and user.")
@@ -42,9 +229,12 @@ def init_db(force, create_db):
     1. Table structure is created.
     2. Primary keys and foreign keys are created.
     3. Indexes are created.
+    4. The ticket and entry partitions are created.
+    5. All the migrations are marked as applied.
     """
     import config
-    db.init_db_connection(config.POSTGRES_ADMIN_URI)
+    import db.partitions as db_partitions
+    db.init_db_connection(config.POSTGRES_ADMIN_URI, use_pool=False)
     if force:
         res = db.run_sql_script_without_transaction(
             os.path.join(ADMIN_SQL_DIR, 'drop_db.sql'))
@@ -83,8 +273,40 @@ def init_db(force, create_db):
         print('PG: Creating indexes...')
         db.run_sql_script(os.path.join(ADMIN_SQL_DIR, 'create_indexes.sql'))
 
+        print('PG: Creating partitions...')
+        db_partitions.create_partitions()
+
+        print('PG: Marking migrations as applied...')
+        db.get_applied_migrations()
+        for version, _ in get_migrations():
+            db.mark_migration_applied(version)
+
         print("Done!")
 
 
+@cli.command(name="migrate")
+@click.option("--list", "list_only", is_flag=True, help="List the migrations which are yet to be applied, without applying them.")
+def migrate(list_only):
+    """Applies the migrations in admin/sql/migrations which haven't been applied yet."""
+    import config
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+
+    applied = db.get_applied_migrations()
+    pending = [(version, path) for version, path in get_migrations() if version not in applied]
+    if not pending:
+        print("PG: No migrations to apply.")
+        return
+
+    for version, path in pending:
+        if list_only:
+            print(version)
+            continue
+        print('PG: Applying migration %s...' % version)
+        if not db.apply_migration(path, version):
+            raise Exception('Failed to apply migration %s!' % version)
+
+    print("Done!")
+
+
 if __name__ == '__main__':
     cli()
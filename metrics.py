@@ -0,0 +1,148 @@
+# A minimal, thread safe registry of Prometheus metrics, rendered in the Prometheus text format.
+# Metrics are kept in the memory of each process, so each worker process exposes its own, see ``serve``.
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors = []
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = ["# HELP %s %s" % (self.name, self.documentation), "# TYPE %s %s" % (self.name, self.type)]
+        for name, labels, value in self._samples():
+            lines.append("%s%s %s" % (name, _format_labels(labels), _format_value(value)))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """ A value which only goes up, e.g. the no. of requests served. """
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            return [(self.name, zip(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """ The distribution of observed values, e.g. request durations, counted in cumulative buckets. """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, the +Inf bucket, and the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                labels = list(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                    cumulative += count
+                    samples.append((self.name + "_bucket", labels + [("le", _format_value(bound))], cumulative))
+                samples.append((self.name + "_sum", labels, counts[-1]))
+                samples.append((self.name + "_count", labels, cumulative))
+        return samples
+
+
+def register_collector(collector):
+    """ Register a function which returns metrics computed when they are rendered, e.g. gauges of pool usage.
+    The function must return a list of tuples of the name, type, documentation and samples of each metric,
+    where the samples are a list of tuples of a dictionary of labels and the value.
+    """
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """ Render all the metrics in the Prometheus text format. """
+    parts = [metric.render() for metric in _metrics]
+    for collector in _collectors:
+        for name, metric_type, documentation, samples in collector():
+            lines = ["# HELP %s %s" % (name, documentation), "# TYPE %s %s" % (name, metric_type)]
+            for labels, value in samples:
+                lines.append("%s%s %s" % (name, _format_labels(labels.items()), _format_value(value)))
+            parts.append("\n".join(lines))
+    return "\n".join(parts) + "\n"
+
+
+def serve(port: int, host: str = "0.0.0.0"):
+    """ Serve the metrics on ``/metrics`` from a background thread, for processes which don't run the webserver
+    or which share its port with others, like the workers of the production server.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _format_labels(labels) -> str:
+    labels = ['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+              for name, value in labels]
+    return "{%s}" % ",".join(labels) if labels else ""
+
+
+def _format_value(value) -> str:
+    if isinstance(value, str):
+        return value
+    if value is None:
+        return "NaN"
+    return repr(float(value))
+
+
+# Result computation, from compute_results.py
+RESULT_COMPUTATION_SECONDS = Histogram("bingo_result_computation_seconds", "Time taken to compute the result of a raffle.",
+                                       labelnames=("outcome",))
+RESULT_COMPUTATION_PASS_SECONDS = Histogram("bingo_result_computation_pass_seconds",
+                                            "Time taken to compute the results of all the due raffles.")
@@ -0,0 +1,134 @@
+import heapq
+import logging
+import select
+import time
+
+import psycopg2
+
+import config
+import db.lucky_draw as db_lucky_draw
+from compute_results import ResultComupter
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Seconds to wait after the closing time of a raffle before computing its result,
+# so that the raffle is closed by the DB clock too.
+CLOSING_GRACE_PERIOD = 0.5
+
+
+class ResultScheduler:
+    """ Computes the result of each raffle as soon as it closes.
+    The closing times of the open raffles are kept in memory and the scheduler sleeps till
+    the next one. New raffles are picked up as soon as they are created, from the notifications
+    sent by ``db.lucky_draw.create_raffle``. The raffles are also reloaded from the DB every
+    ``poll_interval`` seconds, in case a notification is missed or the DB connection used to
+    listen for them is lost. The results which are due are computed on every such reload too, so that
+    raffles which closed while the scheduler was down, or whose results failed to be computed, are
+    caught up with.
+    Args:
+        workers (optional): The no. of raffles whose results are computed concurrently.
+        poll_interval (optional): Seconds between reloads of the raffles from the DB.
+                                  Defaults to ``RESULT_SCHEDULER_POLL_INTERVAL`` from the config.
+    """
+
+    def __init__(self, workers: int = None, poll_interval: float = None):
+        self.computer = ResultComupter(workers=workers)
+        self.poll_interval = poll_interval or config.RESULT_SCHEDULER_POLL_INTERVAL
+        self._schedule = []
+        self._next_reload = 0
+        self._listener = None
+
+    def run(self):
+        """ Run the scheduler until the process is stopped. """
+        logger.info("Starting result scheduler, polling every %ss", self.poll_interval)
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Error while scheduling results: %s", str(e), exc_info=True)
+                self._close_listener()
+                self._next_reload = 0
+                time.sleep(2)
+
+    def run_once(self):
+        """ Compute the results which are due and then sleep till the next raffle closes,
+        a new raffle is created or the schedule needs to be reloaded.
+        """
+        if self._listener is None:
+            self._listen()
+
+        if time.monotonic() >= self._next_reload:
+            self._reload_schedule()
+            # Raffles which are no longer in the schedule, as they closed while the scheduler was down
+            # or the previous pass failed
+            self.computer.compute_results()
+
+        if self._schedule and self._schedule[0][0] <= time.monotonic():
+            while self._schedule and self._schedule[0][0] <= time.monotonic():
+                heapq.heappop(self._schedule)
+            self.computer.compute_results()
+            self._reload_schedule()
+
+        wakeup = self._next_reload
+        if self._schedule:
+            wakeup = min(wakeup, self._schedule[0][0])
+        if self._wait_for_new_raffles(max(wakeup - time.monotonic(), 0)):
+            self._reload_schedule()
+
+    def _reload_schedule(self):
+        now = time.monotonic()
+        self._schedule = [(now + raffle["seconds_to_close"] + CLOSING_GRACE_PERIOD, raffle["id"])
+                          for raffle in db_lucky_draw.get_raffles_awaiting_closing()]
+        heapq.heapify(self._schedule)
+        self._next_reload = now + self.poll_interval
+        logger.debug("Loaded %s raffles awaiting results", len(self._schedule))
+
+    def _listen(self):
+        try:
+            self._listener = psycopg2.connect(config.SQLALCHEMY_DATABASE_URI)
+            self._listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with self._listener.cursor() as cursor:
+                cursor.execute("LISTEN %s" % db_lucky_draw.RAFFLE_CREATED_CHANNEL)
+        except psycopg2.OperationalError as e:
+            logger.warning("Couldn't listen for new raffles, polling instead: %s", str(e))
+            self._close_listener()
+            return
+        # Raffles created while no one was listening
+        self._next_reload = 0
+
+    def _wait_for_new_raffles(self, timeout: float) -> bool:
+        """ Sleep for ``timeout`` seconds or until a new raffle is created.
+        Returns:
+            True if a new raffle was created.
+        """
+        if self._listener is None:
+            time.sleep(timeout)
+            return False
+
+        try:
+            if select.select([self._listener], [], [], timeout) == ([], [], []):
+                return False
+            self._listener.poll()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logger.warning("Lost the connection used to listen for new raffles: %s", str(e))
+            self._close_listener()
+            return True
+
+        created = [notify.payload for notify in self._listener.notifies]
+        self._listener.notifies.clear()
+        logger.debug("New raffles created: %s", created)
+        return bool(created)
+
+    def _close_listener(self):
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except psycopg2.Error:
+                pass
+        self._listener = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig()
+    ResultScheduler().run()
@@ -0,0 +1,183 @@
+import csv
+import io
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy
+
+import config
+import db
+import db.lucky_draw as db_lucky_draw
+import db.partitions as db_partitions
+from db.password import hash_password
+
+# Password of every seeded user
+SEED_PASSWORD = "password"
+
+
+class _IteratorFile(io.TextIOBase):
+    """ A read-only file whose contents are generated by an iterator of strings,
+    so that rows can be streamed to COPY without building them all in memory.
+    """
+
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._iterator)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _copy(cursor, table, columns, rows):
+    """ Load rows into a table with COPY, streaming them as CSV. """
+    cursor.copy_expert(
+        "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)".format(table=table, columns=", ".join(columns)),
+        _IteratorFile(_csv_lines(rows)),
+    )
+
+
+def _skewed_index(rng, n, skew):
+    """ Pick an index in [0, n). With a skew of 0 every index is equally likely, the larger the skew
+    the more the low indexes are favoured, e.g. with a skew of 1 the first 10% of the indexes are
+    picked about 30% of the time.
+    """
+    return min(int(n * rng.random() ** (1 + skew)), n - 1)
+
+
+def seed(users: int, tickets_per_user: float, raffles: int, entries_per_raffle: int, skew: float = 1.0, random_seed: int = None) -> dict:
+    """ Bulk load synthetic users, raffles, tickets, entries and results into the database with COPY.
+    The rows are added to the existing ones.
+    Args:
+        users: the no. of users to add
+        tickets_per_user: the average no. of tickets drawn by each user
+        raffles: the no. of raffles to add, 70% of them closed, 10% ongoing and 20% upcoming
+        entries_per_raffle: the average no. of entries in each closed or ongoing raffle
+        skew (optional): How much some users are more active than others, 0 for all users being equally active.
+        random_seed (optional): the seed of the random data, to get the same data every time.
+    Returns:
+        A dictionary with the no. of rows added to each table.
+    """
+    rng = random.Random(random_seed)
+    now = datetime.now(timezone.utc)
+    counts = {}
+
+    password = hash_password(SEED_PASSWORD)
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM "user"')
+        first_user_id = cursor.fetchone()[0] + 1
+        user_ids = range(first_user_id, first_user_id + users)
+        _copy(cursor, '"user"', ["id", "email_id", "name", "password", "auth_token"], (
+            (user_id, "seed-user-%s@example.com" % user_id, "Seed User %s" % user_id, password,
+             str(uuid.UUID(int=rng.getrandbits(128), version=4)))
+            for user_id in user_ids
+        ))
+        counts["user"] = users
+
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM lucky_draw.raffle")
+        first_raffle_id = cursor.fetchone()[0] + 1
+        raffle_times = {}
+        for raffle_id in range(first_raffle_id, first_raffle_id + raffles):
+            position = rng.random()
+            if position < 0.7:
+                closing_time = now - timedelta(days=365 * rng.random())
+            elif position < 0.8:
+                closing_time = now + timedelta(days=config.TICKET_VALIDITY * rng.random())
+            else:
+                closing_time = now + timedelta(days=30 * rng.random() + config.TICKET_VALIDITY)
+            start_time = closing_time - timedelta(days=1 + 6 * rng.random())
+            raffle_times[raffle_id] = (start_time, closing_time)
+        _copy(cursor, "lucky_draw.raffle", ["id", "title", "description", "prize", "prize_picture_url", "start_time", "closing_time"], (
+            (raffle_id, "Raffle %s" % raffle_id, "Seeded raffle no. %s" % raffle_id, "Prize %s" % raffle_id, None,
+             start_time.isoformat(), closing_time.isoformat())
+            for raffle_id, (start_time, closing_time) in raffle_times.items()
+        ))
+        counts["raffle"] = raffles
+
+        cursor.execute("SELECT COALESCE(MAX(ticket_no), 0) FROM lucky_draw.ticket")
+        first_ticket_no = cursor.fetchone()[0] + 1
+        tickets_of_user = {}
+        ticket_count = int(users * tickets_per_user) if users else 0
+
+        def tickets():
+            for ticket_no in range(first_ticket_no, first_ticket_no + ticket_count):
+                user_id = first_user_id + _skewed_index(rng, users, skew)
+                tickets_of_user.setdefault(user_id, []).append(ticket_no)
+                created = now - timedelta(days=365 * rng.random())
+                yield ticket_no, user_id, created.isoformat(), (created + timedelta(days=config.TICKET_VALIDITY)).isoformat()
+
+        _copy(cursor, "lucky_draw.ticket", ["ticket_no", "user_id", "created", "valid_upto"], tickets())
+        counts["ticket"] = ticket_count
+
+        entries = []
+        results = []
+        for raffle_id, (start_time, closing_time) in raffle_times.items():
+            if start_time > now or not tickets_of_user:
+                continue
+            raffle_entries = []
+            entered = set()
+            for _ in range(int(entries_per_raffle * 2 * rng.random())):
+                user_id = first_user_id + _skewed_index(rng, users, skew)
+                if user_id in entered or not tickets_of_user.get(user_id):
+                    continue
+                entered.add(user_id)
+                raffle_entries.append((raffle_id, tickets_of_user[user_id].pop(), user_id))
+            entries.extend(raffle_entries)
+            if raffle_entries and closing_time < now:
+                results.append(rng.choice(raffle_entries))
+
+        _copy(cursor, "lucky_draw.entry", ["raffle_id", "ticket_no", "user_id"], iter(entries))
+        _copy(cursor, "lucky_draw.result", ["raffle_id", "ticket_no", "user_id"], iter(results))
+        counts["entry"] = len(entries)
+        cursor.execute("""
+            UPDATE lucky_draw.ticket
+               SET redeemed_raffle_id = entry.raffle_id
+              FROM lucky_draw.entry
+             WHERE entry.ticket_no = ticket.ticket_no
+               AND entry.ticket_no >= %s
+        """, (first_ticket_no,))
+        counts["result"] = len(results)
+
+        cursor.execute("""SELECT setval(pg_get_serial_sequence('"user"', 'id'), MAX(id)) FROM "user" """)
+        cursor.execute("SELECT setval(pg_get_serial_sequence('lucky_draw.raffle', 'id'), MAX(id)) FROM lucky_draw.raffle")
+        cursor.execute("SELECT setval(pg_get_serial_sequence('lucky_draw.ticket', 'ticket_no'), MAX(ticket_no)) FROM lucky_draw.ticket")
+        connection.commit()
+    finally:
+        connection.close()
+
+    # The raffles, results and entries are copied in directly, so their summaries and entry counters are written afterwards
+    counts["raffle_summary"] = db_lucky_draw.rebuild_raffle_summary()
+    counts["raffle_entry_count"] = db_lucky_draw.rebuild_entry_counts()
+    # The tickets and entries are copied into the default partitions, and moved into partitions of their own here
+    db_partitions.create_partitions()
+
+    with db.engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT").execute(sqlalchemy.text("ANALYZE"))
+
+    return counts
@@ -1,5 +1,6 @@
 import os
 from flask import Flask, json
+from webserver.json_encoder import JSONEncoder
 from werkzeug.exceptions import HTTPException
 
 
@@ -8,6 +9,7 @@ def create_app(config_path=None, debug=None):
     In the Flask app returned, blueprints are registered.
     """
     app = Flask(import_name=__name__)
+    app.json_encoder = JSONEncoder
 
     # Add login manager
     from webserver.login import login_manager
@@ -24,6 +26,16 @@ def create_app(config_path=None, debug=None):
     import db
     db.init_db_connection(app.config['SQLALCHEMY_DATABASE_URI'])
 
+    # Request and DB metrics
+    if app.config['METRICS_ENABLED']:
+        from webserver.metrics import init_metrics
+        init_metrics(app)
+
+    # Compression of JSON and CSV responses
+    if app.config['COMPRESSION_MIN_SIZE'] is not None:
+        from webserver.compression import init_compression
+        init_compression(app)
+
     # Error handing as JSON
     @app.errorhandler(HTTPException)
     def handle_exception(e):
@@ -63,3 +75,6 @@ def _register_blueprints(app):
     app.register_blueprint(admin_bp, url_prefix="/admin")
     from webserver.views.lucky_draw import lucky_draw_bp
     app.register_blueprint(lucky_draw_bp, url_prefix="/lucky-draw")
+    if app.config['METRICS_ENABLED']:
+        from webserver.views.metrics import metrics_bp
+        app.register_blueprint(metrics_bp)
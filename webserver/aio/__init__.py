@@ -0,0 +1,73 @@
+import os
+
+from quart import Quart, json
+from quart.exceptions import HTTPException as QuartHTTPException
+from werkzeug.exceptions import HTTPException, default_exceptions
+
+from webserver.json_encoder import JSONEncoder
+
+
+def create_app(config_path=None, debug=None):
+    """ Generate a Quart app serving the ``lucky_draw_bp`` endpoints on asyncio, with the same URLs and
+    responses as the Flask app returned by ``webserver.create_app``. The app connects to the DB when it starts serving.
+    """
+    app = Quart(import_name=__name__)
+    app.json_encoder = JSONEncoder
+
+    # Load configs
+    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'config.py')
+    app.config.from_pyfile(config_file)
+
+    if debug is not None:
+        app.debug = debug
+
+    # Connect DB
+    import db.aio
+
+    @app.before_serving
+    async def init_db_pool():
+        await db.aio.init_db_pool(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    @app.after_serving
+    async def close_db_pool():
+        await db.aio.close_db_pool()
+
+    # Compression of JSON and CSV responses
+    if app.config['COMPRESSION_MIN_SIZE'] is not None:
+        from webserver.aio.compression import init_compression
+        init_compression(app)
+
+    # Error handing as JSON
+    @app.errorhandler(HTTPException)
+    async def handle_exception(e):
+        """Return JSON instead of HTML for HTTP errors."""
+        response = await app.make_response((json.dumps({
+            "code": e.code,
+            "name": e.name,
+            "description": e.description,
+        }), e.code))
+        response.content_type = "application/json"
+        return response
+
+    @app.errorhandler(QuartHTTPException)
+    async def handle_quart_exception(e):
+        """Return JSON instead of HTML for the HTTP errors raised by Quart itself, e.g. 404 for unknown URLs,
+        with the same descriptions as Flask.
+        """
+        error = default_exceptions[e.status_code]() if e.status_code in default_exceptions else e
+        response = await app.make_response((json.dumps({
+            "code": e.status_code,
+            "name": error.name,
+            "description": error.description,
+        }), e.status_code, e.get_headers()))
+        response.content_type = "application/json"
+        return response
+
+    _register_blueprints(app)
+    return app
+
+
+def _register_blueprints(app):
+    """ Register blueprints for the given Quart app. """
+    from webserver.aio.views.lucky_draw import lucky_draw_bp
+    app.register_blueprint(lucky_draw_bp, url_prefix="/lucky-draw")
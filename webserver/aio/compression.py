@@ -0,0 +1,46 @@
+from quart import request
+from quart.wrappers.response import IterableBody
+
+import config
+from webserver.compression import add_vary_header, choose_encoding, compressor, is_compressible, set_encoding_headers, \
+    set_not_modified_headers, stream_compressor
+
+
+def init_compression(app):
+    """ Compress the JSON and CSV responses of the given Quart app like ``webserver.compression.init_compression``. """
+    app.after_request(_compress_response)
+
+
+async def _compress_response(response):
+    if response.status_code == 304:
+        set_not_modified_headers(request, response)
+        return response
+    if not is_compressible(response):
+        return response
+    add_vary_header(response)
+
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+
+    if isinstance(response.response, IterableBody):
+        response.response = IterableBody(_compress_stream(response.response, *stream_compressor(encoding)))
+        response.headers.pop("Content-Length", None)
+    else:
+        compress, _, finish = compressor(encoding)
+        data = await response.get_data(raw=True)
+        if len(data) < config.COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(compress(data) + finish())
+
+    set_encoding_headers(response, encoding)
+    return response
+
+
+async def _compress_stream(body, compress, finish):
+    async with body as chunks:
+        async for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+    yield finish()
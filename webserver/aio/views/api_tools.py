@@ -0,0 +1,37 @@
+from quart import request
+from werkzeug.exceptions import Unauthorized
+import db.aio.user as db_user
+import db.user
+from webserver.login import User
+
+
+async def validate_auth_header():
+    """
+    Examine the current request headers for an Authorization: Token <uuid>
+    header that identifies a user and then load the corresponding user
+    object from the database and return it, if successful. Otherwise return 401.
+    Users are cached by their token in ``db.user.token_cache``, shared with the Flask app.
+    Returns:
+        - user: the user record for the given token.
+    Status:
+        - Unauthorized(401): if the authorization token is missing or invalid.
+    """
+
+    auth_token = request.headers.get("Authorization")
+    if not auth_token:
+        raise Unauthorized("You need to provide an Authorization header.")
+    try:
+        auth_token = auth_token.split(" ")[1]
+    except IndexError:
+        raise Unauthorized("Provided Authorization header is invalid.")
+
+    db.user.listen_for_invalidations()
+    user = db_user.token_cache.get(auth_token)
+    if user is None:
+        row = await db_user.get_by_token(auth_token=auth_token)
+        if row is None:
+            raise Unauthorized("Invalid authorization token.")
+        user = User.from_dbrow(row)
+        db_user.token_cache.set(auth_token, user)
+
+    return user
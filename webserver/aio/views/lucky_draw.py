@@ -0,0 +1,275 @@
+import csv
+import io
+from quart import Blueprint, Response, jsonify, json, current_app, request, stream_with_context
+from werkzeug.exceptions import BadRequest, Conflict, Unauthorized
+
+import db.aio.lucky_draw as db_lucky_draw
+from webserver.aio.views.api_tools import validate_auth_header
+from webserver.conditional import cache_headers, is_not_modified, make_etag
+from webserver.views.lucky_draw import _decode_cursor, _encode_cursor
+
+# The same endpoints as webserver.views.lucky_draw, see there for their documentation.
+lucky_draw_bp = Blueprint("lucky_draw", __name__)
+
+
+@lucky_draw_bp.route("/raffle/<int:raffle_id>", methods=["GET", "OPTIONS"])
+async def get_raffle(raffle_id):
+    """ Get raffle with the given ``raffle_id``. """
+    user = await validate_auth_header()
+    show_email = user.email_id in current_app.config["ADMINS"]
+
+    headers = {}
+    version = await db_lucky_draw.get_raffle_version(raffle_id=raffle_id, user_id=None if show_email else user.id)
+    if version:
+        etag = make_etag(request, show_email, version["last_modified"],
+                         version["entry_ticket_no"], version["entry_count"])
+        headers = cache_headers(etag, version, private=True)
+        if is_not_modified(request, etag, version["last_modified"], etag_only=True):
+            return Response("", status=304, headers=headers)
+
+    if show_email:
+        raffle = await db_lucky_draw.get_raffle(raffle_id=raffle_id, show_email=True)
+
+        if raffle:
+            raffle["applicant_count"] = raffle["entry_count"]
+
+    else:
+        raffle = await db_lucky_draw.get_raffle(raffle_id=raffle_id)
+
+        if raffle:
+            raffle_entry = await db_lucky_draw.get_raffle_applicants(raffle_id=raffle_id, user_id=user.id)
+            raffle["entry"] = raffle_entry[0] if raffle_entry else None
+
+    return jsonify({"raffle": raffle}), headers
+
+
+@lucky_draw_bp.route("/raffle/<int:raffle_id>/applicants", methods=["GET", "OPTIONS"])
+async def export_raffle_applicants(raffle_id):
+    """ Export the applicants of the raffle with the given ``raffle_id``. This endpoint is admin only. """
+    user = await validate_auth_header()
+    if user.email_id not in current_app.config["ADMINS"]:
+        raise Unauthorized("You are not allowed to access admin APIs.")
+
+    export_format = request.args.get("format", "ndjson")
+
+    if export_format == "ndjson":
+        @stream_with_context
+        async def generate():
+            async for applicant in db_lucky_draw.iter_raffle_applicants(raffle_id=raffle_id):
+                yield (json.dumps(applicant) + "\n").encode()
+
+        return Response(generate(), mimetype="application/x-ndjson")
+
+    if export_format == "csv":
+        @stream_with_context
+        async def generate():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=["name", "email_id", "ticket_no", "user_id"])
+            writer.writeheader()
+            i = 0
+            async for applicant in db_lucky_draw.iter_raffle_applicants(raffle_id=raffle_id):
+                writer.writerow(applicant)
+                i += 1
+                if i % current_app.config["STREAM_CHUNK_SIZE"] == 0:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode()
+
+        return Response(generate(), mimetype="text/csv", headers={
+            "Content-Disposition": "attachment; filename=raffle-%s-applicants.csv" % raffle_id,
+        })
+
+    raise BadRequest("Format must be ndjson or csv.")
+
+
+@lucky_draw_bp.route("/past-raffles", methods=["GET", "OPTIONS"])
+async def get_past_raffles():
+    """ Get a list of past raffles, latest first. Returns the winner email ID too, in case the user is an admin. """
+    user = await validate_auth_header()
+
+    show_email = False
+    if user.email_id in current_app.config["ADMINS"]:
+        show_email = True
+
+    version = await db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, show_email, version["last_modified"])
+    headers = cache_headers(etag, version, private=True)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response("", status=304, headers=headers)
+
+    if "limit" not in request.args:
+        @stream_with_context
+        async def generate():
+            yield b'{"raffles": ['
+            i = 0
+            async for raffle in db_lucky_draw.iter_past_raffles(show_email=show_email):
+                yield (("," if i else "") + json.dumps(raffle)).encode()
+                i += 1
+            yield b"]}"
+
+        return Response(generate(), mimetype="application/json", headers=headers)
+
+    try:
+        limit = int(request.args["limit"])
+    except ValueError:
+        raise BadRequest("Limit must be an integer.")
+    if not 1 <= limit <= current_app.config["PAST_RAFFLES_MAX_PAGE_SIZE"]:
+        raise BadRequest("Limit must be between 1 and %s." % current_app.config["PAST_RAFFLES_MAX_PAGE_SIZE"])
+
+    after = _decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+
+    # Get a raffle more than asked for to find out if there is another page
+    raffles = await db_lucky_draw.get_past_raffles(show_email=show_email, limit=limit + 1, after=after)
+    next_cursor = _encode_cursor(raffles[limit - 1]) if len(raffles) > limit else None
+    return jsonify({"raffles": raffles[:limit], "next_cursor": next_cursor}), headers
+
+
+@lucky_draw_bp.route("/last-week-raffles", methods=["GET", "OPTIONS"])
+async def get_last_week_raffles():
+    """ Get a list of last week raffles. """
+    user = await validate_auth_header()
+
+    show_email = False
+    if user.email_id in current_app.config["ADMINS"]:
+        show_email = True
+
+    version = await db_lucky_draw.get_raffles_version(days=7)
+    etag = make_etag(request, show_email, version["last_modified"])
+    headers = cache_headers(etag, version, private=True)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response("", status=304, headers=headers)
+
+    raffles = await db_lucky_draw.get_past_raffles(show_email=show_email, days=7)
+    return jsonify({"raffles": raffles}), headers
+
+
+@lucky_draw_bp.route("/next-raffle", methods=["GET", "OPTIONS"])
+async def get_next_raffle():
+    """ Get the next raffle. """
+    version = await db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, version["last_modified"])
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response("", status=304, headers=headers)
+
+    raffles = await db_lucky_draw.get_upcoming_raffles(limit=1)
+    return jsonify({"raffle": raffles[0]}), headers
+
+
+@lucky_draw_bp.route("/upcoming-raffles", methods=["GET", "OPTIONS"])
+async def get_upcoming_raffles():
+    """ Get a list of upcoming raffles. """
+    version = await db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, version["last_modified"])
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response("", status=304, headers=headers)
+
+    raffles = await db_lucky_draw.get_upcoming_raffles()
+    return jsonify({"raffles": raffles}), headers
+
+
+@lucky_draw_bp.route("/ongoing-raffles", methods=["GET", "OPTIONS"])
+async def get_ongoing_raffles():
+    """ Get a list of ongoing raffles. """
+    version = await db_lucky_draw.get_raffles_version()
+    raffles = await db_lucky_draw.get_ongoing_raffles()
+    entry_counts = await db_lucky_draw.get_entry_counts([raffle["id"] for raffle in raffles])
+    etag = make_etag(request, version["last_modified"], sorted(entry_counts.items()))
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"], etag_only=True):
+        return Response("", status=304, headers=headers)
+
+    raffles = [dict(raffle, entry_count=entry_counts.get(raffle["id"], 0)) for raffle in raffles]
+    return jsonify({"raffles": raffles}), headers
+
+
+@lucky_draw_bp.route("/draw-ticket", methods=["POST", "OPTIONS"])
+async def draw_ticket():
+    """ Draw a new ticket for the given user. """
+    user = await validate_auth_header()
+    ticket = await db_lucky_draw.draw_ticket(user_id=user.id)
+    return jsonify({"status": "ok", "ticket": ticket})
+
+
+@lucky_draw_bp.route("/draw-tickets", methods=["POST", "OPTIONS"])
+async def draw_tickets():
+    """ Draw tickets for many users at once. This endpoint is admin only. """
+    user = await validate_auth_header()
+    if user.email_id not in current_app.config["ADMINS"]:
+        raise Unauthorized("You are not allowed to access admin APIs.")
+
+    form = await request.form
+    try:
+        user_ids = [int(user_id) for user_id in form.get("user_ids", "").split(",") if user_id.strip()]
+        count = int(form.get("count", 1))
+    except ValueError:
+        raise BadRequest("User IDs and count must be integers.")
+
+    if not user_ids or count < 1:
+        raise BadRequest("At least one user ID and a positive count are required.")
+
+    @stream_with_context
+    async def generate():
+        async for ticket in db_lucky_draw.draw_tickets(user_ids=user_ids, count=count):
+            yield (json.dumps(ticket) + "\n").encode()
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@lucky_draw_bp.route("/tickets", methods=["GET", "OPTIONS"])
+async def get_tickets_for_user():
+    """ Get a given user"s tickets. """
+    user = await validate_auth_header()
+    tickets = await db_lucky_draw.get_tickets_for_user(user_id=user.id)
+    return jsonify({"tickets": tickets})
+
+
+@lucky_draw_bp.route("/raffle/<int:raffle_id>/enter", methods=["POST", "OPTIONS"])
+async def enter_raffle(raffle_id):
+    """ Create an entry for the given user for the raffle ``raffle_id``. """
+    user = await validate_auth_header()
+    outcome, _ = await db_lucky_draw.enter_raffle_with_next_ticket(raffle_id=raffle_id, user_id=user.id)
+
+    if outcome == db_lucky_draw.EntryOutcome.NO_TICKET:
+        raise BadRequest("You don't have any tickets left.")
+
+    if outcome == db_lucky_draw.EntryOutcome.NO_RAFFLE:
+        raise BadRequest("The raffle with id %s doesn't exist." % raffle_id)
+
+    # Submissions close 1 hour prior to scheduled result time
+    if outcome == db_lucky_draw.EntryOutcome.CLOSED:
+        raise BadRequest("Entries for raffle with id %s are closed." % raffle_id)
+
+    if outcome == db_lucky_draw.EntryOutcome.ALREADY_ENTERED:
+        raise Conflict("You have already signed up for this raffle.")
+
+    return jsonify({"status": "ok"})
+
+
+@lucky_draw_bp.route("/create-raffle", methods=["POST", "OPTIONS"])
+async def create_raffle():
+    """ Create a new raffle. This endpoint is admin only. """
+    user = await validate_auth_header()
+    if user.email_id not in current_app.config["ADMINS"]:
+        raise Unauthorized("You are not allowed to access admin APIs.")
+
+    form = await request.form
+    title = form.get("title")
+    description = form.get("description")
+    prize = form.get("prize")
+    prize_picture_url = form.get("prize_picture_url")
+    start_time = form.get("start_time")
+    closing_time = form.get("closing_time")
+
+    if not title or not prize or not start_time or not closing_time:
+        raise BadRequest("Title, Prize, Start time and Closing time are required.")
+
+    if start_time > closing_time:
+        raise BadRequest("Raffle closing time must be greater than start time.")
+
+    raffle_id = await db_lucky_draw.create_raffle(title=title, description=description, prize=prize,
+                                                  prize_picture_url=prize_picture_url, start_time=start_time, closing_time=closing_time)
+
+    return jsonify({"status": "ok", "raffle_id": raffle_id})
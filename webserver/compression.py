@@ -0,0 +1,154 @@
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import flask
+
+import config
+
+# Content types of the responses which are compressed
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/csv"}
+
+# Supported content codings, preferred first when a client accepts several of them equally
+ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def init_compression(app):
+    """ Compress the JSON and CSV responses of the given Flask app with brotli or gzip, whichever the client
+    prefers, if they are larger than ``COMPRESSION_MIN_SIZE`` bytes or are streamed.
+    """
+    app.after_request(_compress_response)
+
+
+def choose_encoding(request) -> Optional[str]:
+    """ Get the content coding a response to the given Flask or Quart request should be compressed with,
+    from its Accept-Encoding header. None if the client doesn't accept any of ``ENCODINGS``.
+    """
+    encoding, quality = None, 0
+    for candidate in ENCODINGS:
+        candidate_quality = request.accept_encodings.quality(candidate)
+        if candidate_quality > quality:
+            encoding, quality = candidate, candidate_quality
+    return encoding
+
+
+def is_compressible(response) -> bool:
+    """ Check if the given response has a body which should be compressed, depending on the client. """
+    return (response.status_code == 200 and response.mimetype in COMPRESSIBLE_MIMETYPES
+            and "Content-Encoding" not in response.headers)
+
+
+def compressor(encoding: str):
+    """ Get the ``compress(data)``, ``flush()`` and ``finish()`` functions of a new compressor for the given
+    content coding. ``flush`` returns all the data compressed so far, so that the client can decompress it
+    without waiting for the rest, and ``finish`` returns the end of the compressed body.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=config.COMPRESSION_BROTLI_QUALITY)
+        return compressor.process, compressor.flush, compressor.finish
+
+    # wbits 16 + 15 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def stream_compressor(encoding: str):
+    """ Get the ``compress(chunk)`` and ``finish()`` functions of a new compressor of a streamed response for the
+    given content coding. The compressed chunks are flushed every ``STREAM_CHUNK_SIZE`` chunks or
+    ``COMPRESSION_STREAM_FLUSH_SIZE`` bytes, so that clients get the rows of slow streams without waiting for
+    the rest, while the rows of fast ones are still compressed together.
+    """
+    compress, flush, finish = compressor(encoding)
+    chunks, size = 0, 0
+
+    def compress_chunk(chunk: bytes) -> bytes:
+        nonlocal chunks, size
+        data = compress(chunk)
+        chunks += 1
+        size += len(chunk)
+        if chunks >= config.STREAM_CHUNK_SIZE or size >= config.COMPRESSION_STREAM_FLUSH_SIZE:
+            data += flush()
+            chunks, size = 0, 0
+        return data
+
+    return compress_chunk, finish
+
+
+def set_encoding_headers(response, encoding: str):
+    """ Mark the response as compressed with the given content coding. Its ETag gets the coding as a suffix,
+    since the compressed body is a different representation than the uncompressed one.
+    """
+    response.headers["Content-Encoding"] = encoding
+    etag = response.headers.get("ETag")
+    if etag and etag.endswith('"'):
+        response.headers["ETag"] = '%s-%s"' % (etag[:-1], encoding)
+
+
+def add_vary_header(response):
+    """ Mark the response as depending on the Accept-Encoding header of the request. """
+    vary = response.headers.get("Vary")
+    if not vary:
+        response.headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        response.headers["Vary"] = vary + ", Accept-Encoding"
+
+
+def encoded_etags(etag: str) -> list:
+    """ Get the ETags a response with the given ETag is sent with, compressed or not, e.g. to check
+    the If-None-Match header of a request against.
+    """
+    return [etag] + ["%s-%s" % (etag, encoding) for encoding in ENCODINGS]
+
+
+def set_not_modified_headers(request, response):
+    """ Send the ETag the client has back with a 304 response, as it may be the one of a compressed response. """
+    add_vary_header(response)
+    etag = response.headers.get("ETag")
+    if not etag or not request.if_none_match:
+        return
+    for encoded_etag in encoded_etags(etag.strip('"'))[1:]:
+        if request.if_none_match.contains_weak(encoded_etag):
+            response.headers["ETag"] = '"%s"' % encoded_etag
+
+
+def _compress_response(response):
+    if response.status_code == 304:
+        set_not_modified_headers(flask.request, response)
+        return response
+    if not is_compressible(response):
+        return response
+    add_vary_header(response)
+
+    encoding = choose_encoding(flask.request)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, *stream_compressor(encoding))
+        response.headers.pop("Content-Length", None)
+    else:
+        compress, _, finish = compressor(encoding)
+        data = response.get_data()
+        if len(data) < config.COMPRESSION_MIN_SIZE:
+            return response
+        response.set_data(compress(data) + finish())
+
+    set_encoding_headers(response, encoding)
+    return response
+
+
+def _compress_stream(chunks, compress, finish):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
@@ -0,0 +1,70 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+
+from werkzeug.http import http_date
+
+import config
+from webserver.compression import encoded_etags
+
+
+def make_etag(request, *parts) -> str:
+    """ Make a strong ETag out of everything a response depends on: the path and query parameters
+    it was requested with, and ``parts``, e.g. whether it shows admin only details and the version
+    of the raffles it is made from. The Flask and Quart apps make the same ETags.
+    """
+    parts = (request.path, sorted(request.args.items(multi=True))) + parts
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def cache_headers(etag: str, version: dict, private: bool) -> dict:
+    """ Get the caching headers of a response about raffles.
+    Args:
+        etag: the ETag of the response, made with ``make_etag``
+        version: the version of the raffles, as returned by ``db.lucky_draw.get_raffle_version``
+                 or ``db.lucky_draw.get_raffles_version``
+        private: True if the response depends on the user making the request, so that it is
+                 never stored by shared caches and is cached per Authorization header.
+    Returns:
+        A dictionary of the ETag, Last-Modified, Cache-Control and, if private, Vary headers.
+        Responses may be reused for ``RAFFLE_CACHE_MAX_AGE`` seconds, but never past the time
+        the next raffle they depend on starts or closes.
+    """
+    max_age = config.RAFFLE_CACHE_MAX_AGE
+    if version["seconds_to_next_change"] is not None:
+        max_age = max(0, min(max_age, int(version["seconds_to_next_change"])))
+
+    headers = {
+        "ETag": '"%s"' % etag,
+        "Cache-Control": "%s, max-age=%d" % ("private" if private else "public", max_age),
+    }
+    if version["last_modified"] is not None:
+        headers["Last-Modified"] = http_date(version["last_modified"])
+    if private:
+        headers["Vary"] = "Authorization"
+    return headers
+
+
+def is_not_modified(request, etag: str, last_modified: Optional[datetime], etag_only: bool = False) -> bool:
+    """ Check if the client making the request already has the current response, compressed or not,
+    from its If-None-Match header or, if it didn't send one, its If-Modified-Since header.
+    Args:
+        request: the Flask or Quart request
+        etag: the ETag of the current response
+        last_modified: the Last-Modified time of the current response
+        etag_only (optional): True if the response has details which don't change its Last-Modified time,
+                              e.g. the entry of the user or live entry counts, so that only the ETag is checked.
+    Returns:
+        True if a 304 Not Modified response can be returned instead.
+    """
+    if request.if_none_match:
+        return any(request.if_none_match.contains_weak(tag) for tag in encoded_etags(etag))
+
+    if etag_only or last_modified is None or request.if_modified_since is None:
+        return False
+
+    if_modified_since = request.if_modified_since
+    if if_modified_since.tzinfo is None:
+        if_modified_since = if_modified_since.replace(tzinfo=timezone.utc)
+    # HTTP dates have no fractions of seconds
+    return last_modified.replace(microsecond=0) <= if_modified_since
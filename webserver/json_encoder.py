@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """ Serializes JSON with orjson if it is installed, and with the standard library otherwise.
+    Used by both the Flask and the Quart apps for ``jsonify`` and ``json.dumps``. Dates are serialized
+    like Flask does, so responses are the same either way except for whitespace and non-ASCII characters,
+    which orjson writes as UTF-8 instead of escaping them.
+    """
+
+    def default(self, o):
+        # The same as werkzeug's http_date, which Flask uses, in half the time
+        if isinstance(o, datetime):
+            if o.tzinfo is not None:
+                o = o.astimezone(timezone.utc)
+            return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (_WEEKDAYS[o.weekday()], o.day, _MONTHS[o.month - 1], o.year,
+                                                          o.hour, o.minute, o.second)
+        return super().default(o)
+
+    def encode(self, o):
+        # Pretty printed JSON is left to the standard library, orjson only indents by 2 spaces
+        if orjson is None or self.indent is not None:
+            return super().encode(o)
+
+        # Dates are passed on to default() to keep their format
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(o, default=self.default, option=option).decode("utf-8")
@@ -29,13 +29,19 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(id):
-    """ Load the logged user. """
+    """ Load the logged user. Users are cached by their ID in ``db.user.user_cache``. """
     try:
-        user = db_user.get(id=id)
+        id = int(id)
+    except ValueError:
+        return None
+    try:
+        db_user.listen_for_invalidations()
+        return db_user.user_cache.get_or_load(id, lambda: _load_user_by_id(id))
     except Exception as e:
         current_app.logger.error("Error while getting user: %s", str(e), exc_info=True)
         return None
-    if user:
-        return User.from_dbrow(user)
-    else:
-        return None
+
+
+def _load_user_by_id(id):
+    user = db_user.get(id=id)
+    return User.from_dbrow(user) if user else None
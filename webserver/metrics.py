@@ -0,0 +1,91 @@
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import db
+import db.lucky_draw as db_lucky_draw
+import db.user as db_user
+import metrics
+
+REQUEST_SECONDS = metrics.Histogram("bingo_http_request_duration_seconds", "Time taken to handle a request, till the response starts.",
+                                    labelnames=("endpoint", "method", "status"))
+DB_QUERIES = metrics.Counter("bingo_db_queries_total", "No. of DB queries made while handling requests.", labelnames=("endpoint",))
+DB_SECONDS = metrics.Counter("bingo_db_query_seconds_total", "Time spent on DB queries while handling requests.", labelnames=("endpoint",))
+DB_ROWS = metrics.Counter("bingo_db_rows_total", "No. of rows returned or affected by DB queries while handling requests.",
+                          labelnames=("endpoint",))
+DB_QUERIES_PER_REQUEST = metrics.Histogram("bingo_db_queries_per_request", "No. of DB queries made by a request.",
+                                           labelnames=("endpoint",), buckets=(0, 1, 2, 3, 4, 5, 10, 20, 50))
+
+
+def init_metrics(app):
+    """ Record the latency and the DB usage of every request of the given app. """
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    g.db_rows = 0
+
+
+def _end_request(response):
+    if "request_start" not in g:
+        return response
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint, method=request.method, status=response.status_code)
+    DB_QUERIES_PER_REQUEST.observe(g.db_queries, endpoint=endpoint)
+    if g.db_queries:
+        DB_QUERIES.inc(g.db_queries, endpoint=endpoint)
+        DB_SECONDS.inc(g.db_seconds, endpoint=endpoint)
+        DB_ROWS.inc(g.db_rows, endpoint=endpoint)
+    return response
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is None or not has_request_context() or "db_queries" not in g:
+        return
+    g.db_queries += 1
+    g.db_seconds += time.perf_counter() - context.metrics_start
+    g.db_rows += max(cursor.rowcount, 0)
+
+
+def _collect_pool_and_cache_stats():
+    collected = []
+    pool = db.get_pool_stats()
+    if pool is not None:
+        collected += [
+            ("bingo_db_pool_checked_out", "gauge", "No. of DB connections in use.", [({}, pool["checked_out"])]),
+            ("bingo_db_pool_checked_in", "gauge", "No. of idle DB connections in the pool.", [({}, pool["checked_in"])]),
+            ("bingo_db_pool_overflow", "gauge", "No. of DB connections open above the pool size.", [({}, pool["overflow"])]),
+            ("bingo_db_pool_checkouts_total", "counter", "No. of DB connections checked out of the pool.", [({}, pool["checkouts"])]),
+            ("bingo_db_pool_wait_seconds_total", "counter", "Time spent waiting for a DB connection.", [({}, pool["wait_time"])]),
+        ]
+
+    caches = {
+        "auth_token": db_user.token_cache.stats(),
+        "session_user": db_user.user_cache.stats(),
+        "raffle_listing": db_lucky_draw.listing_cache.stats(),
+    }
+    collected += [
+        ("bingo_cache_hits_total", "counter", "No. of lookups answered from a cache.",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("bingo_cache_misses_total", "counter", "No. of lookups not found in a cache.",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("bingo_cache_entries", "gauge", "No. of entries in a cache.",
+         [({"cache": name}, stats["size"]) for name, stats in caches.items()]),
+    ]
+    return collected
+
+
+metrics.register_collector(_collect_pool_and_cache_stats)
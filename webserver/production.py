@@ -0,0 +1,79 @@
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+import config
+import db
+import metrics
+
+
+class ProductionServer(BaseApplication):
+    """ Serves the webserver with gunicorn: the app is created once in the master process, which then forks
+    ``workers`` processes each handling up to ``threads`` requests at a time.
+
+    The master process handles the usual gunicorn signals:
+        HUP: start new workers and gracefully stop the old ones. Since the app is preloaded,
+             code changes are only picked up by restarting the master process.
+        TERM: stop accepting connections, drain the requests in flight for up to
+              ``graceful_timeout`` seconds and exit.
+        TTIN / TTOU: add / remove a worker.
+
+    As the metrics are kept by each worker, with ``metrics_port`` each worker serves its own on ``/metrics`` on a port
+    of its own, the lowest one from ``metrics_port`` which no other live worker uses, for Prometheus to scrape them all.
+    Args:
+        host: the host to listen on
+        port: the port to listen on
+        workers (optional): the no. of worker processes, defaults to ``SERVER_WORKERS`` from the config
+        threads (optional): the no. of threads of each worker, defaults to ``SERVER_THREADS`` from the config
+        metrics_port (optional): the first port the workers serve their metrics on, defaults to
+                                 ``SERVER_METRICS_PORT`` from the config
+    """
+
+    def __init__(self, host: str, port: int, workers: int = None, threads: int = None, metrics_port: int = None):
+        self.metrics_port = metrics_port or config.SERVER_METRICS_PORT
+        self.options = {
+            "bind": "%s:%s" % (host, port),
+            "workers": workers or config.SERVER_WORKERS or multiprocessing.cpu_count(),
+            "threads": threads or config.SERVER_THREADS,
+            "worker_class": "gthread",
+            "preload_app": True,
+            "timeout": config.SERVER_TIMEOUT,
+            "graceful_timeout": config.SERVER_GRACEFUL_TIMEOUT,
+            "keepalive": config.SERVER_KEEPALIVE,
+            "max_requests": config.SERVER_MAX_REQUESTS,
+            "max_requests_jitter": config.SERVER_MAX_REQUESTS // 10,
+            "pre_fork": self._pre_fork,
+            "post_fork": _post_fork,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        import webserver
+        app = webserver.create_app()
+        # Close the connections opened while creating the app, so that none are inherited by the workers
+        db.engine.dispose()
+        return app
+
+    def _pre_fork(self, server, worker):
+        # Picked by the master, which knows the ports of all the workers, including the old ones draining on reload
+        worker.metrics_port = None
+        if self.metrics_port:
+            used = {getattr(other, "metrics_port", None) for other in server.WORKERS.values()}
+            worker.metrics_port = next(port for port in range(self.metrics_port, self.metrics_port + len(used) + 1)
+                                       if port not in used)
+
+
+def _post_fork(server, worker):
+    # Each worker gets its own engine and pool, instead of the one created by the master while preloading the app
+    db.init_db_connection(config.SQLALCHEMY_DATABASE_URI)
+    server.log.info("Worker %s connected to the DB", worker.pid)
+    if worker.metrics_port:
+        try:
+            metrics.serve(worker.metrics_port)
+            server.log.info("Worker %s serving its metrics on port %s", worker.pid, worker.metrics_port)
+        except OSError as e:
+            server.log.error("Worker %s couldn't serve its metrics on port %s: %s", worker.pid, worker.metrics_port, e)
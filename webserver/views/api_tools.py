@@ -9,6 +9,7 @@ def validate_auth_header():
     Examine the current request headers for an Authorization: Token <uuid>
     header that identifies a user and then load the corresponding user
     object from the database and return it, if successful. Otherwise return 401.
+    Users are cached by their token in ``db.user.token_cache``.
     Returns:
         - user: the user record for the given token.
     Status:
@@ -23,8 +24,14 @@ def validate_auth_header():
     except IndexError:
         raise Unauthorized("Provided Authorization header is invalid.")
 
-    user = db_user.get_by_token(auth_token=auth_token)
+    db_user.listen_for_invalidations()
+    user = db_user.token_cache.get_or_load(auth_token, lambda: _load_user_by_token(auth_token))
     if user is None:
         raise Unauthorized("Invalid authorization token.")
 
-    return User.from_dbrow(user)
+    return user
+
+
+def _load_user_by_token(auth_token):
+    user = db_user.get_by_token(auth_token=auth_token)
+    return User.from_dbrow(user) if user else None
@@ -83,6 +83,7 @@ def logout():
     Redirects:
         - index.index: The user is already logged out.
     """
+    db_user.user_cache.delete(current_user.id)
     session.clear()
     logout_user()
     return redirect(url_for('index.index'))
@@ -1,10 +1,13 @@
-import pytz
+import base64
+import binascii
+import csv
+import io
 from datetime import datetime
-from flask import Blueprint, jsonify, current_app, request
-from sqlalchemy.exc import IntegrityError
+from flask import Blueprint, Response, jsonify, json, current_app, request, stream_with_context
 from werkzeug.exceptions import BadRequest, Conflict, Unauthorized
 
 import db.lucky_draw as db_lucky_draw
+from webserver.conditional import cache_headers, is_not_modified, make_etag
 from webserver.views.api_tools import validate_auth_header
 
 
@@ -13,20 +16,33 @@ lucky_draw_bp = Blueprint("lucky_draw", __name__)
 
 @lucky_draw_bp.route("/raffle/<int:raffle_id>", methods=["GET", "OPTIONS"])
 def get_raffle(raffle_id):
-    """ Get raffle with the given ``raffle_id``. Returns the raffle applicants too, in case the user is an admin.
+    """ Get raffle with the given ``raffle_id``, with its no. of entries so far. Returns the no. of raffle applicants
+    too, in case the user is an admin.
+    The applicants themselves can be exported with ``/raffle/<raffle_id>/applicants``.
+    Responses have an ETag, and are not sent again if the client has them already (304).
     Headers:
         Authorization: "Token auth_token"
+        If-None-Match (optional): the ETag of the raffle the client has
     Returns:
         - raffle: the raffle record for the given ``raffle_id``.
     """
     user = validate_auth_header()
-
-    if user.email_id in current_app.config["ADMINS"]:
+    show_email = user.email_id in current_app.config["ADMINS"]
+
+    headers = {}
+    version = db_lucky_draw.get_raffle_version(raffle_id=raffle_id, user_id=None if show_email else user.id)
+    if version:
+        etag = make_etag(request, show_email, version["last_modified"],
+                         version["entry_ticket_no"], version["entry_count"])
+        headers = cache_headers(etag, version, private=True)
+        if is_not_modified(request, etag, version["last_modified"], etag_only=True):
+            return Response(status=304, headers=headers)
+
+    if show_email:
         raffle = db_lucky_draw.get_raffle(raffle_id=raffle_id, show_email=True)
 
         if raffle:
-            raffle_applicants = db_lucky_draw.get_raffle_applicants(raffle_id=raffle_id)
-            raffle["applicants"] = raffle_applicants
+            raffle["applicant_count"] = raffle["entry_count"]
 
     else:
         raffle = db_lucky_draw.get_raffle(raffle_id=raffle_id)
@@ -35,16 +51,74 @@ def get_raffle(raffle_id):
             raffle_entry = db_lucky_draw.get_raffle_applicants(raffle_id=raffle_id, user_id=user.id)
             raffle["entry"] = raffle_entry[0] if raffle_entry else None
 
-    return jsonify({"raffle": raffle})
+    return jsonify({"raffle": raffle}), headers
+
+
+@lucky_draw_bp.route("/raffle/<int:raffle_id>/applicants", methods=["GET", "OPTIONS"])
+def export_raffle_applicants(raffle_id):
+    """ Export the applicants of the raffle with the given ``raffle_id``. This endpoint is admin only.
+    Headers:
+        Authorization: "Token auth_token"
+    Query Parameters:
+        - format (optional): ``ndjson`` (default) or ``csv``.
+    Raises:
+        - BadRequest(401): The user is not an authorized admin
+        - BadRequest(404): Unknown format
+    Returns:
+        - The ``name``, ``email_id``, ``ticket_no`` and ``user_id`` of each applicant, as newline delimited JSON
+          objects or as CSV rows with a header.
+    """
+    user = validate_auth_header()
+    if user.email_id not in current_app.config["ADMINS"]:
+        raise Unauthorized("You are not allowed to access admin APIs.")
+
+    export_format = request.args.get("format", "ndjson")
+    applicants = db_lucky_draw.iter_raffle_applicants(raffle_id=raffle_id)
+
+    if export_format == "ndjson":
+        def generate():
+            for applicant in applicants:
+                yield json.dumps(applicant) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    if export_format == "csv":
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=["name", "email_id", "ticket_no", "user_id"])
+            writer.writeheader()
+            for i, applicant in enumerate(applicants, start=1):
+                writer.writerow(applicant)
+                if i % current_app.config["STREAM_CHUNK_SIZE"] == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+
+        return Response(stream_with_context(generate()), mimetype="text/csv", headers={
+            "Content-Disposition": "attachment; filename=raffle-%s-applicants.csv" % raffle_id,
+        })
+
+    raise BadRequest("Format must be ndjson or csv.")
 
 
 @lucky_draw_bp.route("/past-raffles", methods=["GET", "OPTIONS"])
 def get_past_raffles():
-    """ Get a list of past raffles. Returns the winner email ID too, in case the user is an admin.
+    """ Get a list of past raffles, latest first. Returns the winner email ID too, in case the user is an admin.
+    Without a ``limit`` all the past raffles are streamed in a single response.
+    Responses have an ETag and Last-Modified time, and are not sent again if the client has them already (304).
     Headers:
         Authorization: "Token auth_token"
+        If-None-Match (optional): the ETag of the raffles the client has
+        If-Modified-Since (optional): the Last-Modified time of the raffles the client has
+    Query Parameters:
+        - limit (optional): the no. of raffles to return in a page.
+        - cursor (optional): the ``next_cursor`` returned with the previous page.
+    Raises:
+        - BadRequest(404): Invalid limit or cursor
     Returns:
         - raffles: the list of raffles.
+        - next_cursor: the cursor to get the next page with, or null if this is the last page. Only returned with a ``limit``.
     """
     user = validate_auth_header()
 
@@ -52,13 +126,54 @@ def get_past_raffles():
     if user.email_id in current_app.config["ADMINS"]:
         show_email = True
 
-    raffles = db_lucky_draw.get_past_raffles(show_email=show_email)
-    return jsonify({"raffles": raffles})
+    version = db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, show_email, version["last_modified"])
+    headers = cache_headers(etag, version, private=True)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response(status=304, headers=headers)
+
+    if "limit" not in request.args:
+        def generate():
+            yield '{"raffles": ['
+            for i, raffle in enumerate(db_lucky_draw.iter_past_raffles(show_email=show_email)):
+                yield ("," if i else "") + json.dumps(raffle)
+            yield "]}"
+
+        return Response(stream_with_context(generate()), mimetype="application/json", headers=headers)
+
+    try:
+        limit = int(request.args["limit"])
+    except ValueError:
+        raise BadRequest("Limit must be an integer.")
+    if not 1 <= limit <= current_app.config["PAST_RAFFLES_MAX_PAGE_SIZE"]:
+        raise BadRequest("Limit must be between 1 and %s." % current_app.config["PAST_RAFFLES_MAX_PAGE_SIZE"])
+
+    after = _decode_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+
+    # Get a raffle more than asked for to find out if there is another page
+    raffles = db_lucky_draw.get_past_raffles(show_email=show_email, limit=limit + 1, after=after)
+    next_cursor = _encode_cursor(raffles[limit - 1]) if len(raffles) > limit else None
+    return jsonify({"raffles": raffles[:limit], "next_cursor": next_cursor}), headers
+
+
+def _encode_cursor(raffle):
+    """ Get the pagination cursor pointing after the given raffle. """
+    cursor = "%s,%s" % (raffle["closing_time"].isoformat(), raffle["id"])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """ Get the ``closing_time`` and ``id`` of the raffle a pagination cursor points after. """
+    try:
+        closing_time, raffle_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(",")
+        return datetime.fromisoformat(closing_time), int(raffle_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise BadRequest("Invalid cursor.")
 
 
 @lucky_draw_bp.route("/last-week-raffles", methods=["GET", "OPTIONS"])
 def get_last_week_raffles():
-    """ Get a list of last week raffles.
+    """ Get a list of last week raffles. Supports conditional requests like ``/past-raffles``.
     Headers:
         Authorization: "Token auth_token"
     Returns:
@@ -70,44 +185,71 @@ def get_last_week_raffles():
     if user.email_id in current_app.config["ADMINS"]:
         show_email = True
 
+    version = db_lucky_draw.get_raffles_version(days=7)
+    etag = make_etag(request, show_email, version["last_modified"])
+    headers = cache_headers(etag, version, private=True)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response(status=304, headers=headers)
+
     raffles = db_lucky_draw.get_past_raffles(show_email=show_email, days=7)
-    return jsonify({"raffles": raffles})
+    return jsonify({"raffles": raffles}), headers
 
 
 @lucky_draw_bp.route("/next-raffle", methods=["GET", "OPTIONS"])
 def get_next_raffle():
-    """ Get the next raffle.
+    """ Get the next raffle. Supports conditional requests like ``/past-raffles``.
     Headers:
         Authorization: "Token auth_token"
     Returns:
         - raffle: the next raffle.
     """
+    version = db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, version["last_modified"])
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response(status=304, headers=headers)
+
     raffles = db_lucky_draw.get_upcoming_raffles(limit=1)
-    return jsonify({"raffle": raffles[0]})
+    return jsonify({"raffle": raffles[0]}), headers
 
 
 @lucky_draw_bp.route("/upcoming-raffles", methods=["GET", "OPTIONS"])
 def get_upcoming_raffles():
-    """ Get a list of upcoming raffles.
+    """ Get a list of upcoming raffles. Supports conditional requests like ``/past-raffles``.
     Headers:
         Authorization: "Token auth_token"
     Returns:
         - raffles: the list of raffles.
     """
+    version = db_lucky_draw.get_raffles_version()
+    etag = make_etag(request, version["last_modified"])
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"]):
+        return Response(status=304, headers=headers)
+
     raffles = db_lucky_draw.get_upcoming_raffles()
-    return jsonify({"raffles": raffles})
+    return jsonify({"raffles": raffles}), headers
 
 
 @lucky_draw_bp.route("/ongoing-raffles", methods=["GET", "OPTIONS"])
 def get_ongoing_raffles():
-    """ Get a list of ongoing raffles.
+    """ Get a list of ongoing raffles, with the no. of entries in each of them so far. Supports conditional
+    requests like ``/past-raffles``, but only with the ETag as the no. of entries changes all the time.
     Headers:
         Authorization: "Token auth_token"
     Returns:
         - raffles: the list of raffles.
     """
+    version = db_lucky_draw.get_raffles_version()
     raffles = db_lucky_draw.get_ongoing_raffles()
-    return jsonify({"raffles": raffles})
+    entry_counts = db_lucky_draw.get_entry_counts([raffle["id"] for raffle in raffles])
+    etag = make_etag(request, version["last_modified"], sorted(entry_counts.items()))
+    headers = cache_headers(etag, version, private=False)
+    if is_not_modified(request, etag, version["last_modified"], etag_only=True):
+        return Response(status=304, headers=headers)
+
+    raffles = [dict(raffle, entry_count=entry_counts.get(raffle["id"], 0)) for raffle in raffles]
+    return jsonify({"raffles": raffles}), headers
 
 
 @lucky_draw_bp.route("/draw-ticket", methods=["POST", "OPTIONS"])
@@ -123,6 +265,41 @@ def draw_ticket():
     return jsonify({"status": "ok", "ticket": ticket})
 
 
+@lucky_draw_bp.route("/draw-tickets", methods=["POST", "OPTIONS"])
+def draw_tickets():
+    """ Draw tickets for many users at once. This endpoint is admin only.
+    Headers:
+        Authorization: "Token auth_token"
+    Form Data:
+        - user_ids: comma separated DB IDs of the users
+        - count (optional): the no. of tickets to draw for each user, 1 by default.
+    Raises:
+        - BadRequest(401): The user is not an authorized admin
+        - BadRequest(404): Invalid form POSTed
+    Returns:
+        - The newly drawn tickets, as newline delimited JSON objects with the
+          ``user_id``, ``ticket_no`` and ``valid_upto`` of each ticket.
+    """
+    user = validate_auth_header()
+    if user.email_id not in current_app.config["ADMINS"]:
+        raise Unauthorized("You are not allowed to access admin APIs.")
+
+    try:
+        user_ids = [int(user_id) for user_id in request.form.get("user_ids", "").split(",") if user_id.strip()]
+        count = int(request.form.get("count", 1))
+    except ValueError:
+        raise BadRequest("User IDs and count must be integers.")
+
+    if not user_ids or count < 1:
+        raise BadRequest("At least one user ID and a positive count are required.")
+
+    def generate():
+        for ticket in db_lucky_draw.draw_tickets(user_ids=user_ids, count=count):
+            yield json.dumps(ticket) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 @lucky_draw_bp.route("/tickets", methods=["GET", "OPTIONS"])
 def get_tickets_for_user():
     """ Get a given user"s tickets.
@@ -149,22 +326,19 @@ def enter_raffle(raffle_id):
         - Conflict(409): The user has already entered the raffle
     """
     user = validate_auth_header()
-    ticket_no = db_lucky_draw.get_next_vaild_ticket_for_user(user_id=user.id)
-    if ticket_no is None:
-        raise BadRequest("You don't have any tickets left.")
+    outcome, _ = db_lucky_draw.enter_raffle_with_next_ticket(raffle_id=raffle_id, user_id=user.id)
 
-    raffle = db_lucky_draw.get_raffle(raffle_id=raffle_id)
+    if outcome == db_lucky_draw.EntryOutcome.NO_TICKET:
+        raise BadRequest("You don't have any tickets left.")
 
-    if not raffle:
+    if outcome == db_lucky_draw.EntryOutcome.NO_RAFFLE:
         raise BadRequest("The raffle with id %s doesn't exist." % raffle_id)
 
     # Submissions close 1 hour prior to scheduled result time
-    if datetime.now(pytz.UTC) > raffle["closing_time"]:
+    if outcome == db_lucky_draw.EntryOutcome.CLOSED:
         raise BadRequest("Entries for raffle with id %s are closed." % raffle_id)
 
-    try:
-        db_lucky_draw.enter_raflle(raffle_id=raffle_id, ticket_no=ticket_no, user_id=user.id)
-    except IntegrityError:
+    if outcome == db_lucky_draw.EntryOutcome.ALREADY_ENTERED:
         raise Conflict("You have already signed up for this raffle.")
 
     return jsonify({"status": "ok"})
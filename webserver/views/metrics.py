@@ -0,0 +1,12 @@
+from flask import Blueprint, Response
+
+import metrics
+
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    """ Get the metrics of this process in the Prometheus text format. """
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)